@@ -0,0 +1,16 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def sync_thumbnails(settings):
+    """Миниатюры создаются при сохранении поста, а не в фоне: фоновая
+    задача пережила бы запрос и писала бы в тестовую базу и временный
+    MEDIA_ROOT одновременно с тестом."""
+    settings.POST_THUMBNAILS_ASYNC = False
+
+
+@pytest.fixture(autouse=True)
+def temp_media_root(settings, tmp_path):
+    """Загруженные в тестах картинки и их миниатюры пишутся во временный
+    каталог, а не в media/ проекта."""
+    settings.MEDIA_ROOT = str(tmp_path)
@@ -0,0 +1,20 @@
+"""SQLite с выбором режима транзакций.
+
+OPTIONS['transaction_mode'] задаёт, как начинается транзакция: при
+'IMMEDIATE' atomic() сразу берёт блокировку записи. Обычный BEGIN
+(DEFERRED) берёт её только на первой записи, и если к тому времени базу
+изменил другой процесс, SQLite сразу отвечает «database is locked», не
+дожидаясь busy_timeout.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        kwargs.pop('transaction_mode', None)
+        return kwargs
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
@@ -0,0 +1,54 @@
+"""Настройка соединений с базой.
+
+Каждое новое соединение SQLite получает прагмы из SQLITE_PRAGMAS: WAL
+позволяет читать во время записи, synchronous=NORMAL в режиме WAL не
+теряет целостность при сбое процесса, busy_timeout заставляет писателя
+ждать блокировку, а не сразу падать с «database is locked».
+
+При CONN_MAX_AGE соединение переживает запрос. Перед запросом открытое
+соединение проверяется запросом SELECT 1 мимо курсоров Django, чтобы
+проверка не попадала в счётчики запросов; неработающее закрывается, и
+Django откроет новое.
+
+Сами прагмы не делают запись без блокировок: atomic() с обычным BEGIN
+может получить «database is locked», минуя busy_timeout, поэтому
+основная база использует core.backends.sqlite3 с транзакциями
+IMMEDIATE.
+"""
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    # мимо курсоров Django: прагмы не считаются запросами страницы
+    for name, value in settings.SQLITE_PRAGMAS.items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def is_healthy(connection):
+    try:
+        cursor = connection.connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+    except connection.Database.Error:
+        return False
+    return True
+
+
+@receiver(request_started)
+def check_connections(sender, **kwargs):
+    if not settings.CONN_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        if not is_healthy(connection):
+            connection.close()
@@ -0,0 +1,114 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .queries import QueryInspector, QueryStats
+from .routers import route_reads
+
+logger = logging.getLogger('core.queries')
+
+
+class QueryBudgetMiddleware:
+    """Считает SQL-запросы каждого HTTP-запроса и ищет среди них N+1.
+
+    Итог сохраняется в response.query_stats. При DEBUG превышение
+    бюджета, объявленного декоратором query_budget, и повторяющиеся
+    запросы пишутся в лог, а итог выводится в заголовках X-Query-*.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_INSPECTOR_ENABLED:
+            return self.get_response(request)
+        inspector = QueryInspector()
+        started = time.perf_counter()
+        # запросы к репликам тоже считаются
+        with ExitStack() as stack:
+            for alias_connection in connections.all():
+                stack.enter_context(
+                    alias_connection.execute_wrapper(inspector)
+                )
+            response = self.get_response(request)
+        stats = QueryStats(
+            view=getattr(request, 'query_view', None),
+            budget=getattr(request, 'query_budget', None),
+            inspector=inspector,
+            elapsed=time.perf_counter() - started,
+        )
+        response.query_stats = stats
+        if settings.DEBUG:
+            self.report(request, stats)
+            self.add_headers(response, stats)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_view = (
+            f'{view_func.__module__}.{view_func.__qualname__}'
+        )
+        request.query_budget = getattr(view_func, 'query_budget', None)
+
+    def report(self, request, stats):
+        if stats.over_budget:
+            logger.warning(
+                '%s %s: %d SQL-запросов при бюджете %d',
+                request.method, request.path, stats.count, stats.budget,
+            )
+        for shape, times in stats.repeated.items():
+            logger.warning(
+                '%s %s: запрос повторён %d раз (N+1?): %s',
+                request.method, request.path, times, shape,
+            )
+
+    def add_headers(self, response, stats):
+        response['X-Query-Count'] = stats.count
+        response['X-Query-Time-Ms'] = f'{stats.sql_time * 1000:.1f}'
+        response['X-Response-Time-Ms'] = f'{stats.elapsed * 1000:.1f}'
+        response['X-Query-Repeated'] = len(stats.repeated)
+        if stats.view:
+            response['X-Query-View'] = stats.view
+        if stats.budget is not None:
+            response['X-Query-Budget'] = stats.budget
+
+
+class ReplicaRoutingMiddleware:
+    """Отправляет чтения безопасных запросов в реплики базы.
+
+    После запроса, который что-то записал, cookie PRIMARY_COOKIE
+    REPLICA_STICKY_SECONDS секунд направляет чтения пользователя в
+    основную базу, чтобы он сразу видел свои изменения, даже если
+    реплика отстаёт.
+    """
+
+    PRIMARY_COOKIE = 'primary_until'
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        replicas = (
+            request.method in self.SAFE_METHODS and not self.sticky(request)
+        )
+        with route_reads(replicas) as routing:
+            response = self.get_response(request)
+        if routing.wrote:
+            seconds = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                self.PRIMARY_COOKIE, int(time.time() + seconds),
+                max_age=seconds, httponly=True, samesite='Lax',
+            )
+        return response
+
+    def sticky(self, request):
+        try:
+            until = int(request.COOKIES.get(self.PRIMARY_COOKIE, 0))
+        except ValueError:
+            return False
+        return time.time() < until
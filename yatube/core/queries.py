@@ -0,0 +1,75 @@
+"""Учёт SQL-запросов, выполненных при обработке одного HTTP-запроса.
+
+QueryInspector подключается к соединению через execute_wrapper и
+сводит запросы к «форме» — тексту SQL без параметров и с одинаковыми
+списками IN (...). Форма, повторившаяся QUERY_REPEAT_THRESHOLD раз и
+больше, почти всегда означает N+1: связанный объект читается отдельным
+запросом для каждой строки списка.
+"""
+import re
+import time
+from collections import Counter
+
+from django.conf import settings
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+NUMBER_RE = re.compile(r'\b\d+\b')
+
+
+def query_shape(sql):
+    """Текст запроса без значений, по которому сравниваются запросы."""
+    return NUMBER_RE.sub('?', IN_LIST_RE.sub('IN (...)', sql))
+
+
+class QueryInspector:
+    """Обёртка execute_wrapper, считающая запросы и их формы."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.shapes[query_shape(sql)] += 1
+
+    def repeated(self, threshold=None):
+        """Формы запросов, выполненных не меньше threshold раз."""
+        if threshold is None:
+            threshold = settings.QUERY_REPEAT_THRESHOLD
+        return {
+            shape: times for shape, times in self.shapes.items()
+            if times >= threshold
+        }
+
+
+class QueryStats:
+    """Итог по запросу: представление, бюджет, запросы и время."""
+
+    def __init__(self, view, budget, inspector, elapsed):
+        self.view = view
+        self.budget = budget
+        self.count = inspector.count
+        self.sql_time = inspector.duration
+        self.elapsed = elapsed
+        self.repeated = inspector.repeated()
+
+    def __repr__(self):
+        return f'<QueryStats {self.view}: {self.count} queries>'
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.count > self.budget
+
+
+def query_budget(budget):
+    """Объявляет, сколько SQL-запросов допустимо для представления."""
+    def decorator(view_func):
+        view_func.query_budget = budget
+        return view_func
+    return decorator
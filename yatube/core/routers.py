@@ -0,0 +1,71 @@
+"""Чтение из реплик, запись в основную базу.
+
+Реплики — алиасы DATABASES из DATABASE_REPLICAS. В реплику идут только
+чтения внутри route_reads(): их включает ReplicaRoutingMiddleware для
+безопасных HTTP-запросов пользователя, который давно ничего не
+записывал. Команды, сигналы вне запросов, транзакции и все чтения после
+первой записи в том же запросе идут в основную базу, поэтому код,
+читающий только что записанное, не видит отставания реплики.
+"""
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_state = threading.local()
+
+
+class Routing:
+    """Маршрутизация чтений текущего запроса."""
+
+    def __init__(self, replicas):
+        self.replicas = replicas
+        self.wrote = False
+        self.read_replica = False
+
+
+@contextmanager
+def route_reads(replicas=True):
+    """Чтения внутри блока идут в реплики, если replicas истинно."""
+    previous = getattr(_state, 'routing', None)
+    _state.routing = routing = Routing(replicas)
+    try:
+        yield routing
+    finally:
+        _state.routing = previous
+
+
+def read_replica():
+    """Читал ли текущий запрос из реплики."""
+    routing = getattr(_state, 'routing', None)
+    return routing is not None and routing.read_replica
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = getattr(_state, 'routing', None)
+        replicas = settings.DATABASE_REPLICAS
+        if (not replicas or routing is None or not routing.replicas
+                or routing.wrote
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        routing.read_replica = True
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        routing = getattr(_state, 'routing', None)
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # схема попадает в реплики вместе с данными
+        return db not in settings.DATABASE_REPLICAS
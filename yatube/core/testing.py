@@ -0,0 +1,34 @@
+from django.test import override_settings
+
+
+class QueryBudgetMixin:
+    """Проверки бюджета SQL-запросов для TestCase.
+
+    Ответ должен пройти через QueryBudgetMiddleware, поэтому для
+    запросов внутри теста счётчик включается принудительно.
+    """
+
+    def setUp(self):
+        super().setUp()
+        enabled = override_settings(QUERY_INSPECTOR_ENABLED=True)
+        enabled.enable()
+        self.addCleanup(enabled.disable)
+
+    def assertWithinQueryBudget(self, response, budget=None):
+        """Запросов не больше бюджета представления (или budget), и ни
+        один запрос не повторяется как N+1."""
+        stats = response.query_stats
+        if budget is None:
+            budget = stats.budget
+        self.assertIsNotNone(
+            budget, f'У представления {stats.view} не объявлен бюджет.'
+        )
+        self.assertLessEqual(
+            stats.count, budget,
+            f'{stats.view}: {stats.count} SQL-запросов при бюджете '
+            f'{budget}.',
+        )
+        self.assertEqual(
+            stats.repeated, {},
+            f'{stats.view}: повторяющиеся запросы (N+1).',
+        )
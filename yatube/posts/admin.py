@@ -1,10 +1,23 @@
 from django.conf import settings
 from django.contrib import admin
 
-from .models import Comment, Follow, Group, Post
+from . import search
+from .models import AuthorStats, Comment, Follow, Group, Post, StoredImage
 
 
-class PostAdmin(admin.ModelAdmin):
+class SearchIndexMixin:
+    """Поиск в списке объектов через поисковый индекс вместо LIKE."""
+    search_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return search.get_backend().filter_queryset(
+            self.search_kind, queryset, search_term
+        ), False
+
+
+class PostAdmin(SearchIndexMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'text',
@@ -14,6 +27,7 @@ class PostAdmin(admin.ModelAdmin):
     )
     list_editable = ('group',)
     search_fields = ('text',)
+    search_kind = search.POST
     list_filter = ('pub_date',)
     empty_value_display = settings.EMPTY_VALUE_DISPLAY
 
@@ -27,13 +41,14 @@ class GroupAdmin(admin.ModelAdmin):
     empty_value_display = settings.EMPTY_VALUE_DISPLAY
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(SearchIndexMixin, admin.ModelAdmin):
     list_display = (
         'text',
         'author',
         'created',
     )
     search_fields = ('text',)
+    search_kind = search.COMMENT
 
 
 class FollowAdmin(admin.ModelAdmin):
@@ -43,7 +58,28 @@ class FollowAdmin(admin.ModelAdmin):
     )
 
 
+class AuthorStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        'author',
+        'posts_count',
+        'comments_count',
+        'followers_count',
+        'following_count',
+    )
+    readonly_fields = list_display
+
+
+class StoredImageAdmin(admin.ModelAdmin):
+    list_display = (
+        'name',
+        'references',
+    )
+    readonly_fields = list_display
+
+
+admin.site.register(AuthorStats, AuthorStatsAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Post, PostAdmin)
+admin.site.register(StoredImage, StoredImageAdmin)
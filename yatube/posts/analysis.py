@@ -0,0 +1,186 @@
+"""Анализ русского текста для поискового индекса.
+
+Текст разбивается на слова, приводится к нижнему регистру, «ё»
+заменяется на «е», стоп-слова отбрасываются, а оставшиеся слова
+сводятся к основе стеммером Snowball для русского языка. Окончания
+каждого класса заранее разложены в таблицы «окончание -> сколько
+букв отрезать», поэтому поиск окончания — несколько обращений к
+словарю, а не перебор списка.
+"""
+import re
+from functools import lru_cache
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+CYRILLIC_RE = re.compile(r'^[а-я]+$')
+
+VOWELS = frozenset('аеиоуыэюя')
+
+STOP_WORDS = frozenset('''
+    и в во не что он на я с со как а то все она так его но да ты к у же
+    вы за бы по только ее мне было вот от меня еще нет о из ему теперь
+    когда даже ну вдруг ли если уже или ни быть был него до вас нибудь
+    опять уж вам ведь там потом себя ничего ей может они тут где есть
+    надо ней для мы тебя их чем была сам чтоб без будто чего раз тоже
+    себе под будет ж тогда кто этот того потому этого какой совсем ним
+    здесь этом один почти мой тем чтобы нее сейчас были куда зачем всех
+    никогда можно при наконец два об другой хоть после над больше тот
+    через эти нас про всего них какая много разве три эту моя впрочем
+    хорошо свою этой перед иногда лучше чуть том нельзя такой им более
+    всегда конечно всю между
+'''.split())
+
+
+def _table(endings, preceded=()):
+    """Таблица окончаний: окончание -> число отрезаемых букв.
+
+    Для окончаний, которые должны следовать за одной из букв preceded,
+    в таблицу попадают сочетания «буква + окончание», но отрезается
+    только само окончание.
+    """
+    table = {}
+    for ending in endings:
+        if preceded:
+            for letter in preceded:
+                table[letter + ending] = len(ending)
+        else:
+            table[ending] = len(ending)
+    return table
+
+
+def _merge(*tables):
+    merged = {}
+    for table in tables:
+        merged.update(table)
+    return merged
+
+
+PERFECTIVE_GERUND = _merge(
+    _table(('в', 'вши', 'вшись'), preceded='ая'),
+    _table(('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись')),
+)
+ADJECTIVE = _table((
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем',
+    'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю',
+    'ая', 'яя', 'ою', 'ею',
+))
+PARTICIPLE = _merge(
+    _table(('ем', 'нн', 'вш', 'ющ', 'щ'), preceded='ая'),
+    _table(('ивш', 'ывш', 'ующ')),
+)
+ADJECTIVAL = _merge(
+    ADJECTIVE,
+    {
+        participle + adjective: strip + len(adjective)
+        for participle, strip in PARTICIPLE.items()
+        for adjective in ADJECTIVE
+    },
+)
+REFLEXIVE = _table(('ся', 'сь'))
+VERB = _merge(
+    _table((
+        'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но',
+        'ет', 'ют', 'ны', 'ть', 'ешь', 'нно',
+    ), preceded='ая'),
+    _table((
+        'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей',
+        'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят',
+        'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+    )),
+)
+NOUN = _table((
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии',
+    'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам',
+    'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия',
+    'ья', 'я',
+))
+SUPERLATIVE = _table(('ейш', 'ейше'))
+DERIVATIONAL = _table(('ост', 'ость'))
+
+MAX_ENDING = max(
+    len(ending)
+    for table in (PERFECTIVE_GERUND, ADJECTIVAL, REFLEXIVE, VERB, NOUN)
+    for ending in table
+)
+
+
+def _strip(word, start, table):
+    """Отрезает самое длинное окончание из table, целиком лежащее в
+    word[start:]. Возвращает (слово, найдено ли окончание)."""
+    longest = min(len(word) - start, MAX_ENDING)
+    for length in range(longest, 0, -1):
+        strip = table.get(word[-length:])
+        if strip is not None:
+            return word[:len(word) - strip], True
+    return word, False
+
+
+def _regions(word):
+    """Начала областей RV и R2 по правилам Snowball."""
+    rv = r1 = r2 = len(word)
+    for i, letter in enumerate(word):
+        if letter in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+@lru_cache(maxsize=100000)
+def stem(word):
+    """Основа русского слова в нижнем регистре с «е» вместо «ё»."""
+    if not CYRILLIC_RE.match(word):
+        return word
+    rv, r2 = _regions(word)
+    # шаг 1
+    word, found = _strip(word, rv, PERFECTIVE_GERUND)
+    if not found:
+        word, _ = _strip(word, rv, REFLEXIVE)
+        for table in (ADJECTIVAL, VERB, NOUN):
+            word, found = _strip(word, rv, table)
+            if found:
+                break
+    # шаг 2
+    if word.endswith('и') and len(word) > rv:
+        word = word[:-1]
+    # шаг 3
+    word, _ = _strip(word, r2, DERIVATIONAL)
+    # шаг 4
+    if word.endswith('нн') and len(word) - 1 > rv:
+        return word[:-1]
+    word, found = _strip(word, rv, SUPERLATIVE)
+    if found:
+        if word.endswith('нн') and len(word) - 1 > rv:
+            word = word[:-1]
+        return word
+    if word.endswith('ь') and len(word) > rv:
+        word = word[:-1]
+    return word
+
+
+def normalize(token):
+    return token.lower().replace('ё', 'е')
+
+
+def term(token):
+    """Термин индекса для слова или None для стоп-слова."""
+    token = normalize(token)
+    if token in STOP_WORDS:
+        return None
+    return stem(token)
+
+
+def analyze(text):
+    """Список терминов индекса для текста."""
+    terms = []
+    for token in TOKEN_RE.findall(text):
+        token_term = term(token)
+        if token_term:
+            terms.append(token_term)
+    return terms
@@ -0,0 +1,211 @@
+"""JSON API лент только для чтения.
+
+Представления берут те же выборки, что и HTML-страницы, но читают
+values() только тех столбцов, что нужны полям из параметра fields, и
+собирают ответ из словарей строк без экземпляров моделей. Автор и
+группа присоединяются, только если их поля запрошены. Ленты листаются
+по курсору (posts.paginator), ETag дают те же валидаторы, что и у
+страниц (posts.conditional).
+"""
+from operator import itemgetter
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.http import urlencode
+
+from core.queries import query_budget
+
+from . import cache as feed_cache
+from . import feeds
+from .conditional import (comments_validators, conditional_feed, first_row,
+                          follow_validators, group_validators,
+                          index_validators, post_validators,
+                          profile_validators)
+from .models import Comment, Group, Post, User
+from .paginator import CursorPaginator, InvalidCursor
+from .storage import post_image_storage
+
+
+class Field:
+    """Поле ответа: столбцы для values() и функция, собирающая значение
+    из строки; по умолчанию значение — первый столбец."""
+
+    def __init__(self, *columns, build=None):
+        self.columns = columns
+        self.build = build or itemgetter(columns[0])
+
+
+def image_url(row):
+    return post_image_storage.url(row['image']) if row['image'] else None
+
+
+POST_FIELDS = {
+    'id': Field('pk'),
+    'text': Field('text'),
+    'pub_date': Field('pub_date'),
+    'author': Field('author__username'),
+    'group': Field('group__slug'),
+    'image': Field('image', build=image_url),
+    'comments_count': Field('comments_count'),
+}
+
+COMMENT_FIELDS = {
+    'id': Field('pk'),
+    'text': Field('text'),
+    'created': Field('created'),
+    'author': Field('author__username'),
+    'parent': Field('parent_id'),
+    'depth': Field('depth'),
+}
+
+
+class InvalidFields(Exception):
+    pass
+
+
+def error(status, detail):
+    return JsonResponse(
+        {'detail': detail}, status=status,
+        json_dumps_params={'ensure_ascii': False},
+    )
+
+
+def requested_fields(request, fields):
+    """Поля из параметра fields=id,text в порядке запроса; без
+    параметра — все поля."""
+    names = [
+        name.strip() for name in request.GET.get('fields', '').split(',')
+        if name.strip()
+    ]
+    if not names:
+        return fields
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        raise InvalidFields(', '.join(unknown))
+    return {name: fields[name] for name in names}
+
+
+def columns(fields, *required):
+    """Столбцы для values() без повторов."""
+    result = dict.fromkeys(required)
+    for field in fields.values():
+        result.update(dict.fromkeys(field.columns))
+    return list(result)
+
+
+def serialize(rows, fields):
+    items = list(fields.items())
+    return [{name: field.build(row) for name, field in items} for row in rows]
+
+
+def counted(validators):
+    """Валидаторы ленты API: в её элементах есть comments_count, а
+    комментарий меняет не версии лент, а версию COMMENTS."""
+    def wrapped(request, *args, **kwargs):
+        page = validators(request, *args, **kwargs)
+        if page is not None:
+            page.versions = [*page.versions, (feed_cache.COMMENTS, None)]
+        return page
+    return wrapped
+
+
+def page_link(request, cursor):
+    if cursor is None:
+        return None
+    return request.path + '?' + urlencode(
+        {**request.GET.dict(), 'cursor': cursor}
+    )
+
+
+def feed_response(request, rows, fields, per_page, date_field='pub_date',
+                  pk_field='pk'):
+    """Страница выборки rows по курсору из параметра cursor со ссылками
+    на соседние страницы."""
+    try:
+        fields = requested_fields(request, fields)
+    except InvalidFields as unknown:
+        return error(400, f'Неизвестные поля: {unknown}')
+    paginator = CursorPaginator(
+        rows.values(*columns(fields, 'pk', date_field, pk_field)),
+        per_page, date_field, pk_field,
+    )
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        return error(400, 'Неверный курсор.')
+    return JsonResponse({
+        'results': serialize(page, fields),
+        'next': page_link(request, page.next_cursor()),
+        'previous': page_link(request, page.previous_cursor()),
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+@query_budget(1)
+@conditional_feed(counted(index_validators))
+def index(request):
+    return feed_response(request, Post.objects.all(), POST_FIELDS,
+                         settings.POSTS_PER_PAGE)
+
+
+@query_budget(3)
+@conditional_feed(counted(group_validators))
+def group_posts(request, slug):
+    group_id = first_row(
+        Group.objects.filter(slug=slug).values_list('pk', flat=True)
+    )
+    if group_id is None:
+        return error(404, 'Группа не найдена.')
+    return feed_response(request, Post.objects.filter(group_id=group_id),
+                         POST_FIELDS, settings.POSTS_PER_PAGE)
+
+
+@query_budget(3)
+@conditional_feed(counted(profile_validators))
+def profile(request, username):
+    author_id = first_row(
+        User.objects.filter(username=username).values_list('pk', flat=True)
+    )
+    if author_id is None:
+        return error(404, 'Автор не найден.')
+    return feed_response(request, Post.objects.filter(author_id=author_id),
+                         POST_FIELDS, settings.POSTS_PER_PAGE)
+
+
+@query_budget(15)
+@conditional_feed(counted(follow_validators))
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return error(401, 'Нужна авторизация.')
+    return feed_response(request, feeds.subscriptions(request.user),
+                         POST_FIELDS, settings.POSTS_PER_PAGE,
+                         *feeds.FEED_KEYS)
+
+
+@query_budget(2)
+@conditional_feed(post_validators)
+def post_detail(request, post_id):
+    try:
+        fields = requested_fields(request, POST_FIELDS)
+    except InvalidFields as unknown:
+        return error(400, f'Неизвестные поля: {unknown}')
+    row = first_row(
+        Post.objects.filter(pk=post_id).values(*columns(fields, 'pk'))
+    )
+    if row is None:
+        return error(404, 'Пост не найден.')
+    return JsonResponse(
+        serialize([row], fields)[0],
+        json_dumps_params={'ensure_ascii': False},
+    )
+
+
+@query_budget(2)
+@conditional_feed(comments_validators)
+def post_comments(request, post_id):
+    """Все комментарии поста с ответами, от новых к старым; ветки
+    собираются по полям parent и depth."""
+    if not Post.objects.filter(pk=post_id).exists():
+        return error(404, 'Пост не найден.')
+    return feed_response(request, Comment.objects.filter(post_id=post_id),
+                         COMMENT_FIELDS, settings.COMMENTS_PER_PAGE,
+                         date_field='created')
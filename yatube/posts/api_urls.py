@@ -0,0 +1,18 @@
+from django.urls import path
+
+from . import api
+
+app_name = 'api'
+
+urlpatterns = [
+    path('posts/', api.index, name='index'),
+    path('group/<slug:slug>/posts/', api.group_posts, name='group_list'),
+    path('profile/<str:username>/posts/', api.profile, name='profile'),
+    path('follow/posts/', api.follow_index, name='follow_index'),
+    path('posts/<int:post_id>/', api.post_detail, name='post_detail'),
+    path(
+        'posts/<int:post_id>/comments/',
+        api.post_comments,
+        name='post_comments'
+    ),
+]
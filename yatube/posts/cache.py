@@ -0,0 +1,287 @@
+import hashlib
+import math
+import random
+import time
+from contextlib import nullcontext
+from functools import partial, wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import (get_cache_key, has_vary_header,
+                                learn_cache_key, patch_response_headers)
+from django.views.decorators.vary import vary_on_cookie
+
+from core.routers import read_replica
+
+# пространства имён версий лент
+INDEX = 'index'
+GROUP = 'group'
+AUTHOR = 'author'
+FOLLOW = 'follow'
+POST = 'post'
+# любой комментарий; от него зависят числа комментариев в лентах API
+COMMENTS = 'comments'
+
+# все ключи приложения хранятся в кеше с KEY_PREFIX 'posts'
+CACHE_ALIAS = 'posts'
+
+VERSION_KEY_PREFIX = 'version'
+CHANGED_KEY_PREFIX = 'changed'
+# отметка нужна, пока версия не сменилась; потерянная отметка считается
+# текущим временем
+CHANGED_TIMEOUT = 24 * 60 * 60
+
+# сколько секунд страницу строит один запрос, пока остальные её ждут
+# или отдают устаревшую
+PAGE_LOCK_TIMEOUT = 10
+PAGE_WAIT_INTERVAL = 0.05
+
+
+def get_cache():
+    """Кеш приложения posts."""
+    return caches[CACHE_ALIAS]
+
+
+def version_key(namespace, object_id=None):
+    """Ключ кеша, под которым хранится счётчик версии ленты."""
+    if object_id is None:
+        return f'{VERSION_KEY_PREFIX}:{namespace}'
+    return f'{VERSION_KEY_PREFIX}:{namespace}:{object_id}'
+
+
+def changed_key(namespace, object_id, version):
+    """Ключ кеша, под которым хранится время, когда лента получила
+    версию version. Ключ включает версию, поэтому значение по нему не
+    меняется, и двухуровневому кешу не нужно рассылать его изменения."""
+    return version_key(namespace, object_id).replace(
+        VERSION_KEY_PREFIX, CHANGED_KEY_PREFIX, 1
+    ) + f':{version}'
+
+
+def sync_tiers():
+    """Убирает из L1 ключи, изменённые другими процессами, если кеш
+    приложения двухуровневый."""
+    cache = get_cache()
+    if hasattr(cache, 'sync'):
+        cache.sync()
+
+
+def batch():
+    """Изменения версий внутри блока рассылаются другим процессам одним
+    сообщением, если кеш приложения двухуровневый."""
+    return getattr(get_cache(), 'batch', nullcontext)()
+
+
+def _initial_version():
+    # Счётчик, вытесненный из кеша, не должен вернуться к уже
+    # использованному значению, поэтому стартуем с отметки времени.
+    return int(time.time() * 1000)
+
+
+def get_version(namespace, object_id=None):
+    """Текущая версия ленты; отсутствующий счётчик создаётся."""
+    cache = get_cache()
+    key = version_key(namespace, object_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace, object_id=None):
+    """Увеличивает версию ленты, делая устаревшими её кешированные
+    страницы."""
+    cache = get_cache()
+    key = version_key(namespace, object_id)
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), None)
+        version = cache.get(key)
+    cache.add(
+        changed_key(namespace, object_id, version), time.time(),
+        CHANGED_TIMEOUT,
+    )
+    return version
+
+
+def last_changed(versions):
+    """Время, когда ленты versions — пары (пространство имён, объект) —
+    получили текущие версии.
+
+    Отметка, которой нет в кеше, считается текущим временем: версия
+    могла измениться, пока её не было.
+    """
+    cache = get_cache()
+    keys = [
+        changed_key(namespace, object_id, get_version(namespace, object_id))
+        for namespace, object_id in versions
+    ]
+    found = cache.get_many(keys)
+    now = time.time()
+    for key in keys:
+        if key not in found:
+            cache.add(key, now, CHANGED_TIMEOUT)
+            found[key] = cache.get(key, now)
+    return max(found.values(), default=None)
+
+
+def bump_versions(namespace, object_ids):
+    """Увеличивает версии лент для набора объектов."""
+    with batch():
+        for object_id in set(object_ids):
+            bump_version(namespace, object_id)
+
+
+def settled(versions):
+    """Можно ли кешировать ответ и выдавать ему валидаторы.
+
+    Ответ, прочитанный из реплики, мог не увидеть изменения лент
+    versions за последние REPLICA_STICKY_SECONDS секунд — столько, по
+    допущению, отстаёт реплика. Такой ответ, сохранённый под новой
+    версией, оставался бы устаревшим до следующего её увеличения.
+    """
+    if not read_replica():
+        return True
+    changed = last_changed(versions)
+    return (changed is None
+            or changed <= time.time() - settings.REPLICA_STICKY_SECONDS)
+
+
+def refresh_early(expires, delta, now):
+    """Вероятностное досрочное обновление (XFetch): чем дольше строится
+    страница и чем ближе её срок, тем вероятнее, что запрос обновит её
+    заранее, и истечение не совпадёт у всех запросов сразу."""
+    beta = settings.POSTS_PAGE_EARLY_REFRESH
+    return now - delta * beta * math.log(1 - random.random()) >= expires
+
+
+def page_lock_key(request, key, key_prefix):
+    """Блокировка страницы; пока список заголовков Vary ещё не известен,
+    — по адресу страницы."""
+    if key is None:
+        url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        key = f'{key_prefix}.{url}'
+    return f'page_lock.{key}'
+
+
+def should_cache(request, response):
+    """Те же условия, что у UpdateCacheMiddleware."""
+    if response.streaming or response.status_code != 200:
+        return False
+    # ответ на запрос без cookie, выставляющий cookie пользователя
+    if (not request.COOKIES and response.cookies
+            and has_vary_header(response, 'Cookie')):
+        return False
+    return 'private' not in response.get('Cache-Control', ())
+
+
+def coalesced_cache_page(timeout, *, cache=CACHE_ALIAS, key_prefix=None,
+                         versions=()):
+    """Замена cache_page, устойчивая к одновременному истечению страницы.
+
+    Ключи те же, что у cache_page. Отсутствующую страницу строит один
+    запрос, остальные с тем же ключом ждут его результат. Страница свежа
+    timeout секунд и ещё POSTS_PAGE_STALE_TIMEOUT секунд отдаётся
+    устаревшей, пока её обновляет один запрос; обновление может начаться
+    и досрочно. Блокировка после обновления не снимается, а истекает
+    сама: процессы, у которых в L1 осталась прежняя копия, отдают её, а
+    не строят страницу снова. Страница не сохраняется, пока она могла
+    быть прочитана из отстающей реплики (см. settled()).
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+            return serve_page(
+                request, partial(view_func, request, *args, **kwargs),
+                caches[cache], timeout, key_prefix, versions,
+            )
+        return _wrapped_view
+    return decorator
+
+
+def serve_page(request, render, page_cache, timeout, key_prefix,
+               versions=()):
+    key = get_cache_key(request, key_prefix, 'GET', cache=page_cache)
+    entry = page_cache.get(key) if key else None
+    lock = page_lock_key(request, key, key_prefix)
+    if entry is not None:
+        response, expires, delta = entry
+        now = time.time()
+        if now < expires and not refresh_early(expires, delta, now):
+            return response
+        if not page_cache.add(lock, 1, PAGE_LOCK_TIMEOUT):
+            return response
+    elif not page_cache.add(lock, 1, PAGE_LOCK_TIMEOUT):
+        response = wait_page(request, page_cache, key_prefix)
+        if response is not None:
+            return response
+    try:
+        return render_page(
+            request, render, page_cache, timeout, key_prefix, versions
+        )
+    except Exception:
+        page_cache.delete(lock)
+        raise
+
+
+def wait_page(request, page_cache, key_prefix):
+    """Ждёт страницу, которую строит другой запрос."""
+    deadline = time.monotonic() + PAGE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(PAGE_WAIT_INTERVAL)
+        key = get_cache_key(request, key_prefix, 'GET', cache=page_cache)
+        entry = page_cache.get(key) if key else None
+        if entry is not None:
+            return entry[0]
+    return None
+
+
+def render_page(request, render, page_cache, timeout, key_prefix,
+                versions=()):
+    started = time.perf_counter()
+    response = render()
+    if not should_cache(request, response) or not settled(versions):
+        return response
+    patch_response_headers(response, timeout)
+    stored_timeout = timeout + settings.POSTS_PAGE_STALE_TIMEOUT
+    key = learn_cache_key(
+        request, response, stored_timeout, key_prefix, cache=page_cache
+    )
+
+    def store(response):
+        delta = time.perf_counter() - started
+        page_cache.set(
+            key, (response, time.time() + timeout, delta), stored_timeout
+        )
+
+    if hasattr(response, 'render') and callable(response.render):
+        response.add_post_render_callback(store)
+    else:
+        store(response)
+    return response
+
+
+def cache_feed_page(timeout, key_prefix, namespace=INDEX):
+    """Аналог cache_page, ключ которого включает версию ленты.
+
+    Изменение постов ленты увеличивает её версию, поэтому устаревшие
+    страницы больше не читаются и вытесняются по таймауту, а очищать
+    кеш целиком не требуется. Страница зависит от пользователя, а
+    SessionMiddleware добавляет Vary: Cookie уже после того, как
+    cache_page выбрал ключ, поэтому Vary выставляется здесь.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            versioned_prefix = f'{key_prefix}.{get_version(namespace)}'
+            cached_view = coalesced_cache_page(
+                timeout, cache=CACHE_ALIAS, key_prefix=versioned_prefix,
+                versions=[(namespace, None)],
+            )(vary_on_cookie(view_func))
+            return cached_view(request, *args, **kwargs)
+        return _wrapped_view
+    return decorator
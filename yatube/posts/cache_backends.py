@@ -0,0 +1,318 @@
+"""Двухуровневый кеш: L1 в памяти процесса перед общим кешем L2.
+
+L1 — небольшой LRU на процесс, общий для его потоков. Чтение сначала
+идёт в L1 и только при промахе в общий кеш, запись идёт в оба уровня.
+Ключи страниц и карточек включают версии, так что их значения не
+меняются; меняются только счётчики версий, которые увеличивают сигналы
+Post, Follow и Comment.
+
+Изменение значения по ключу (incr, add, delete, clear) публикуется в
+журнале инвалидаций в L2: номер сообщения берётся из счётчика, в
+сообщении — ключи; внутри batch() ключи собираются в одно сообщение.
+set не публикуется: ключи приложения, записываемые через set, включают
+версию, и значение по одному ключу не меняется. В начале
+каждого запроса процесс одним чтением счётчика проверяет журнал и
+убирает из L1 ключи, изменённые другими процессами. Если сообщения
+успели вытесниться или журнал сброшен, L1 очищается целиком. Запись в
+L1 живёт не дольше L1_TIMEOUT секунд, что ограничивает устаревание,
+если сообщение всё же потерялось: на FileBasedCache incr не атомарен.
+
+Пример настройки:
+
+    'posts': {
+        'BACKEND': 'posts.cache_backends.TieredCache',
+        'LOCATION': 'posts_shared',  # алиас общего кеша
+        'OPTIONS': {'MAX_ENTRIES': 1000, 'L1_TIMEOUT': 5},
+    }
+"""
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SEQUENCE_KEY = 'tiered:sequence'
+MESSAGE_KEY = 'tiered:message:{}'
+# сообщения старше этого уже не нужны: L1 к тому времени истёк
+MESSAGE_TIMEOUT = 300
+# при большем отставании дешевле очистить L1, чем читать журнал
+MAX_BACKLOG = 100
+# значения этих типов неизменяемы и хранятся в L1 без pickle
+PLAIN_TYPES = (int, float, str, bytes, type(None))
+# (pid, метка процесса), см. origin()
+_origin = None
+_stores = {}
+_stores_lock = threading.Lock()
+# ключи, собранные batch() в текущем потоке
+_batch = threading.local()
+
+
+class LocalStore:
+    """L1 процесса: LRU с ограниченным числом записей и счётчики."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.synced = False
+        self.last_seen = None
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.entries.pop(key, None)
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, timeout):
+        pickled = not isinstance(value, PLAIN_TYPES)
+        if pickled:
+            value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, pickled, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def discard(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def origin():
+    """Метка, отличающая сообщения этого процесса от чужих. Считается
+    при первом обращении и заново после fork: процессы, порождённые
+    после предзагрузки приложения, не делят её с родителем и
+    соседями."""
+    global _origin
+    pid = os.getpid()
+    if _origin is None or _origin[0] != pid:
+        _origin = (pid, f'{pid}:{uuid.uuid4().hex}')
+    return _origin[1]
+
+
+def _store(alias, max_entries):
+    with _stores_lock:
+        if alias not in _stores:
+            _stores[alias] = LocalStore(max_entries)
+        return _stores[alias]
+
+
+def _value(entry):
+    _, pickled, value = entry
+    return pickle.loads(value) if pickled else value
+
+
+class TieredCache(BaseCache):
+    """Бэкенд кеша Django с уровнями L1 (процесс) и L2 (общий кеш)."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = location
+        self.l1_timeout = options.get('L1_TIMEOUT', 5)
+        self.local = _store(location, options.get('MAX_ENTRIES', 1000))
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def _l1_timeout(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            return self.l1_timeout
+        return min(timeout - time.time(), self.l1_timeout)
+
+    # журнал инвалидаций
+
+    @contextmanager
+    def batch(self):
+        """Публикует ключи, изменённые внутри блока, одним сообщением."""
+        if getattr(_batch, 'keys', None) is not None:
+            yield
+            return
+        _batch.keys = []
+        try:
+            yield
+        finally:
+            keys, _batch.keys = _batch.keys, None
+            if keys:
+                self.publish(keys)
+
+    def publish(self, keys):
+        """Сообщает другим процессам, что ключи keys изменились; None
+        означает очистку всего кеша."""
+        pending = getattr(_batch, 'keys', None)
+        if pending is not None and keys is not None:
+            pending.extend(keys)
+            return
+        shared = self.shared
+        try:
+            number = shared.incr(SEQUENCE_KEY)
+        except ValueError:
+            shared.add(SEQUENCE_KEY, int(time.time() * 1000), None)
+            number = shared.incr(SEQUENCE_KEY)
+        shared.set(
+            MESSAGE_KEY.format(number), (origin(), keys), MESSAGE_TIMEOUT
+        )
+
+    def sync(self):
+        """Убирает из L1 ключи, изменённые другими процессами."""
+        local = self.local
+        sequence = self.shared.get(SEQUENCE_KEY)
+        last_seen, local.last_seen = local.last_seen, sequence
+        if not local.synced:
+            local.synced = True
+            local.clear()
+            return
+        if sequence == last_seen:
+            return
+        if (sequence is None or last_seen is None
+                or not 0 < sequence - last_seen <= MAX_BACKLOG):
+            local.counts['flushes'] += 1
+            local.clear()
+            return
+        names = [
+            MESSAGE_KEY.format(number)
+            for number in range(last_seen + 1, sequence + 1)
+        ]
+        messages = self.shared.get_many(names)
+        if len(messages) < len(names):
+            local.counts['flushes'] += 1
+            local.clear()
+            return
+        own = origin()
+        for sender, keys in messages.values():
+            if sender == own:
+                continue
+            if keys is None:
+                local.counts['flushes'] += 1
+                local.clear()
+                return
+            local.counts['invalidations'] += len(keys)
+            local.discard(keys)
+
+    def stats(self):
+        """Попадания и промахи по уровням с момента запуска процесса."""
+        counts = self.local.counts
+        return {
+            'l1': {'hits': counts['l1_hits'], 'misses': counts['l1_misses']},
+            'l2': {'hits': counts['l2_hits'], 'misses': counts['l2_misses']},
+            'l1_entries': len(self.local.entries),
+            'invalidations': counts['invalidations'],
+            'flushes': counts['flushes'],
+        }
+
+    # интерфейс BaseCache
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_key(key, version)
+        entry = self.local.get(local_key)
+        if entry is not None:
+            self.local.counts['l1_hits'] += 1
+            return _value(entry)
+        self.local.counts['l1_misses'] += 1
+        sentinel = object()
+        value = self.shared.get(key, sentinel, version)
+        if value is sentinel:
+            self.local.counts['l2_misses'] += 1
+            return default
+        self.local.counts['l2_hits'] += 1
+        self.local.set(local_key, value, self.l1_timeout)
+        return value
+
+    def get_many(self, keys, version=None):
+        found, missing = {}, []
+        for key in keys:
+            entry = self.local.get(self.make_key(key, version))
+            if entry is None:
+                missing.append(key)
+            else:
+                found[key] = _value(entry)
+        self.local.counts['l1_hits'] += len(found)
+        self.local.counts['l1_misses'] += len(missing)
+        if missing:
+            shared = self.shared.get_many(missing, version)
+            self.local.counts['l2_hits'] += len(shared)
+            self.local.counts['l2_misses'] += len(missing) - len(shared)
+            for key, value in shared.items():
+                self.local.set(
+                    self.make_key(key, version), value, self.l1_timeout
+                )
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version)
+        self.local.set(
+            self.make_key(key, version), value, self._l1_timeout(timeout)
+        )
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version)
+        for key, value in data.items():
+            if key not in failed:
+                self.local.set(
+                    self.make_key(key, version), value,
+                    self._l1_timeout(timeout),
+                )
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version)
+        local_key = self.make_key(key, version)
+        if added:
+            self.local.set(local_key, value, self._l1_timeout(timeout))
+            self.publish([local_key])
+        else:
+            self.local.discard([local_key])
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version)
+        local_key = self.make_key(key, version)
+        self.local.set(local_key, value, self.l1_timeout)
+        self.publish([local_key])
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        self.shared.delete(key, version)
+        local_key = self.make_key(key, version)
+        self.local.discard([local_key])
+        self.publish([local_key])
+
+    def delete_many(self, keys, version=None):
+        self.shared.delete_many(keys, version)
+        local_keys = [self.make_key(key, version) for key in keys]
+        self.local.discard(local_keys)
+        self.publish(local_keys)
+
+    def has_key(self, key, version=None):
+        sentinel = object()
+        return self.get(key, sentinel, version) is not sentinel
+
+    def clear(self):
+        # счётчик журнала не сбрасывается, иначе новый номер мог бы
+        # совпасть с последним прочитанным другим процессом
+        sequence = self.shared.get(SEQUENCE_KEY)
+        self.shared.clear()
+        if sequence is not None:
+            self.shared.add(SEQUENCE_KEY, sequence, None)
+        self.local.clear()
+        self.publish(None)
@@ -0,0 +1,191 @@
+"""Условные GET-запросы для лент постов и страницы поста.
+
+ETag страницы складывается из версий лент в кеше (posts.cache), того,
+кто смотрит страницу, и строки запроса, поэтому для его вычисления база
+не нужна. Last-Modified — время последнего увеличения тех же версий:
+его меняет любое изменение страницы, в том числе правка и удаление
+поста или переименование группы, о которых даты постов не говорят.
+Валидаторы представления находят объект страницы по slug или имени
+одним запросом. Если клиент прислал If-None-Match, If-Modified-Since
+по RFC 7232 не учитывается, и дата читается только при отрисовке
+ответа.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.functional import cached_property
+from django.utils.http import http_date, quote_etag
+
+from . import cache as feed_cache
+from .feeds import pull_authors
+from .models import Group, Post, User
+
+
+class Validators:
+    """Версии лент, от которых зависит страница.
+
+    Дата изменения страницы читается из кеша, только если она нужна;
+    dated=False отключает Last-Modified.
+    """
+
+    def __init__(self, versions, dated=True):
+        self.versions = versions
+        self.dated = dated
+
+    @cached_property
+    def last_modified(self):
+        if not self.dated:
+            return None
+        return feed_cache.last_changed(self.versions)
+
+
+def viewer_id(request):
+    """Пользователь из сессии без запроса к таблице пользователей."""
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return None
+    return request.session.get(SESSION_KEY)
+
+
+def http_timestamp(moment):
+    """Секунды для заголовков: в HTTP-датах нет долей секунды."""
+    return moment and int(moment)
+
+
+def feed_etag(request, versions):
+    """Слабый ETag: страница зависит от пользователя и CSRF-токена, а
+    маска токена меняется при каждой отрисовке."""
+    parts = [
+        request.path,
+        request.META.get('QUERY_STRING', ''),
+        str(viewer_id(request)),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    ]
+    parts.extend(
+        str(feed_cache.get_version(namespace, object_id))
+        for namespace, object_id in versions
+    )
+    digest = hashlib.md5('|'.join(parts).encode()).hexdigest()
+    return 'W/' + quote_etag(digest)
+
+
+def add_validators(response, etag, timestamp):
+    if etag:
+        response['ETag'] = etag
+    # изменение в ту же секунду дало бы ту же дату, и клиент получил бы
+    # 304 на изменённую страницу
+    if timestamp and timestamp < int(time.time()):
+        response['Last-Modified'] = http_date(timestamp)
+    patch_vary_headers(response, ('Cookie',))
+
+
+def conditional_feed(validators):
+    """Отвечает 304 Not Modified, не вызывая представление, если
+    страница не изменилась с прошлого запроса клиента.
+
+    validators(request, *args, **kwargs) возвращает Validators или
+    None, если объекта страницы нет; тогда представление отвечает само.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+            page = validators(request, *args, **kwargs)
+            if page is None:
+                return view_func(request, *args, **kwargs)
+            etag = feed_etag(request, page.versions)
+            timestamp = None
+            if 'HTTP_IF_NONE_MATCH' not in request.META:
+                timestamp = http_timestamp(page.last_modified)
+            response = get_conditional_response(
+                request, etag=etag, last_modified=timestamp
+            )
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+            if response.status_code == 200:
+                timestamp = http_timestamp(page.last_modified)
+                if not feed_cache.settled(page.versions):
+                    # страница из отстающей реплики не должна получить
+                    # валидаторы новой версии
+                    etag = timestamp = None
+            if response.status_code in (200, 304):
+                add_validators(response, etag, timestamp)
+            return response
+        return _wrapped_view
+    return decorator
+
+
+def first_row(queryset):
+    """Первая строка без ORDER BY, который добавил бы first(): строка по
+    уникальному ключу одна, а сортировка сгруппированного результата
+    идёт во временном B-дереве."""
+    return next(iter(queryset.order_by()[:1]), None)
+
+
+def index_validators(request):
+    return Validators([(feed_cache.INDEX, None)])
+
+
+def group_validators(request, slug):
+    group_id = first_row(
+        Group.objects.filter(slug=slug).values_list('pk', flat=True)
+    )
+    if group_id is None:
+        return None
+    return Validators([(feed_cache.GROUP, group_id)])
+
+
+def profile_validators(request, username):
+    author_id = first_row(
+        User.objects.filter(username=username).values_list('pk', flat=True)
+    )
+    if author_id is None:
+        return None
+    versions = [(feed_cache.AUTHOR, author_id)]
+    viewer = viewer_id(request)
+    if viewer is not None:
+        # кнопка «Подписаться/Отписаться» зависит от подписок читателя
+        versions.append((feed_cache.FOLLOW, viewer))
+    return Validators(versions)
+
+
+def follow_validators(request):
+    viewer = viewer_id(request)
+    if viewer is None:
+        return None
+    # посты популярных авторов меняют версии их лент, а не ленты
+    # подписчика
+    return Validators(
+        [(feed_cache.FOLLOW, viewer)] + [
+            (feed_cache.AUTHOR, author_id)
+            for author_id in pull_authors(viewer)
+        ],
+        dated=False,
+    )
+
+
+def post_validators(request, post_id):
+    row = first_row(
+        Post.objects.filter(pk=post_id).values_list('author_id', 'group_id')
+    )
+    if row is None:
+        return None
+    author_id, group_id = row
+    # в карточке поста выводятся число постов автора и название группы
+    versions = [(feed_cache.POST, post_id), (feed_cache.AUTHOR, author_id)]
+    if group_id is not None:
+        versions.append((feed_cache.GROUP, group_id))
+    return Validators(versions)
+
+
+def comments_validators(request, post_id):
+    # комментарии меняют версию ленты поста
+    return Validators([(feed_cache.POST, post_id)])
+
+
+def replies_validators(request, post_id, comment_id):
+    return comments_validators(request, post_id)
@@ -0,0 +1,128 @@
+import heapq
+from itertools import islice
+
+from django.db.models import F
+
+from . import timeline
+from .models import Follow, Post
+
+
+FEED_KEYS = timeline.FEED_KEYS
+
+
+def _sort_key(ordering):
+    fields = [field.lstrip('-') for field in ordering]
+
+    def key(post):
+        # строки values() — словари с ключами полей сортировки
+        if isinstance(post, dict):
+            return tuple(post[field] for field in fields)
+        return tuple(getattr(post, field) for field in fields)
+    return key
+
+
+class MergedFeed:
+    """Несколько лент постов, слитых в одну по полям сортировки.
+
+    Каждая лента — отсортированный QuerySet. Срез [start:stop] читает из
+    каждой ленты не больше stop записей и лениво сливает их кучей, так
+    что лента подходит и для Paginator, и для CursorPaginator. Пост,
+    попавший сразу в несколько лент, выводится и считается один раз.
+    """
+    ordered = True
+
+    def __init__(self, querysets, ordering=('-pub_date', '-pk')):
+        self.querysets = [qs.order_by(*ordering) for qs in querysets]
+        self.ordering = ordering
+
+    def __repr__(self):
+        return f'<MergedFeed of {len(self.querysets)} streams>'
+
+    def filter(self, *args, **kwargs):
+        return MergedFeed(
+            [qs.filter(*args, **kwargs) for qs in self.querysets],
+            self.ordering,
+        )
+
+    def order_by(self, *ordering):
+        return MergedFeed(self.querysets, ordering)
+
+    def values(self, *fields):
+        return MergedFeed(
+            [qs.values(*fields) for qs in self.querysets], self.ordering
+        )
+
+    def count(self):
+        # UNION без ALL убирает посты, попавшие в несколько лент
+        first, *rest = [qs.order_by().values('pk') for qs in self.querysets]
+        return first.union(*rest).count() if rest else first.count()
+
+    def __len__(self):
+        return self.count()
+
+    def _merge(self, limit):
+        streams = [iter(qs[:limit]) for qs in self.querysets]
+        key = _sort_key(self.ordering)
+        merged = heapq.merge(
+            *streams,
+            key=key,
+            reverse=self.ordering[0].startswith('-'),
+        )
+        previous_pk = None
+        for post in merged:
+            pk = key(post)[-1]
+            if pk != previous_pk:
+                yield post
+            previous_pk = pk
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if key.step is not None or key.stop is None:
+                raise TypeError('MergedFeed supports only [start:stop].')
+            start = key.start or 0
+            return list(islice(self._merge(key.stop), start, key.stop))
+        return self[key:key + 1][0]
+
+    def __iter__(self):
+        return iter(self[:self.count()])
+
+
+def pull_authors(user):
+    """Авторы из подписок пользователя, чьи посты не раскладываются
+    по лентам, а читаются при запросе."""
+    threshold = timeline.pull_threshold()
+    if threshold is None:
+        return []
+    return list(
+        Follow.objects.filter(
+            user=user, author__stats__followers_count__gte=threshold
+        ).values_list('author_id', flat=True)
+    )
+
+
+def follow_feed(user):
+    """Лента подписок пользователя с построенной материализованной лентой.
+
+    Посты обычных авторов берутся из материализованной ленты, посты
+    авторов с большим числом подписчиков читаются из Post одним запросом
+    при обращении к ленте, и обе ленты сливаются.
+    """
+    pushed = timeline.timeline_feed(user)
+    authors = pull_authors(user)
+    if not authors:
+        return pushed
+    pulled = Post.objects.select_related('author', 'group').filter(
+        author_id__in=authors
+    ).annotate(feed_date=F('pub_date'), feed_post=F('pk'))
+    return MergedFeed(
+        [pushed, pulled], tuple(f'-{key}' for key in FEED_KEYS)
+    )
+
+
+def subscriptions(user):
+    """Лента подписок для страницы и API. Пока материализованной ленты
+    нет, посты читаются соединением с Follow: GET ничего не пишет, лента
+    строится при подписке или командой build_timelines."""
+    if timeline.has_timeline(user):
+        return follow_feed(user)
+    return timeline.pull_feed(user)
@@ -1,5 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
+from . import uploads
 from .models import Comment, Post
 
 
@@ -8,8 +10,37 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def clean_image(self):
+        """Новая картинка проверяется по заголовку, уменьшается и
+        очищается от EXIF до сохранения."""
+        image = self.cleaned_data['image']
+        if not isinstance(image, UploadedFile):
+            return image
+        uploads.check_header(image)
+        return uploads.sanitize(image)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
         fields = ('text',)
+
+
+class ReplyForm(CommentForm):
+    """Комментарий или ответ на комментарий того же поста."""
+
+    class Meta(CommentForm.Meta):
+        fields = ('text', 'parent')
+        widgets = {'parent': forms.HiddenInput}
+
+    def __init__(self, *args, post=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['parent'].queryset = Comment.objects.filter(post=post)
+
+    def clean_parent(self):
+        parent = self.cleaned_data['parent']
+        if parent is not None and not parent.can_reply:
+            raise forms.ValidationError(
+                'Ветка слишком глубокая: на этот комментарий ответить нельзя.'
+            )
+        return parent
@@ -0,0 +1,186 @@
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import Counter
+from itertools import accumulate
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import (override_settings, setup_databases,
+                               teardown_databases)
+from django.urls import reverse
+
+from posts.cache import CACHE_ALIAS
+from posts.seeding import DatasetBuilder
+
+KINDS = ('page', 'card', 'version')
+
+
+def key_kind(key):
+    # cache_page сначала читает список заголовков Vary, затем страницу;
+    # страница из кеша — это попадание по второму ключу
+    if 'cache_header' in key:
+        return 'header'
+    if 'cache_page' in key:
+        return 'page'
+    if ':card:' in key:
+        return 'card'
+    return 'version'
+
+
+def count_gets(cache, counts):
+    """Считает попадания и промахи cache.get по видам ключей."""
+    get = cache.get
+
+    def counting_get(key, default=None, version=None):
+        value = get(key, default, version)
+        hit = value is not default
+        counts[key_kind(cache.make_key(key, version)), hit] += 1
+        return value
+
+    cache.get = counting_get
+
+
+def cache_settings(backend, location):
+    """Настройки кешей; 'tiered' — файловый кеш с L1 в процессе."""
+    tiered = backend == 'tiered'
+    config = dict(settings.CACHE_BACKENDS['file' if tiered else backend])
+    if backend in ('file', 'tiered'):
+        config['LOCATION'] = location
+    caches_config = {
+        'default': config,
+        CACHE_ALIAS: {**config, 'KEY_PREFIX': 'posts'},
+    }
+    if tiered:
+        caches_config['posts_shared'] = caches_config[CACHE_ALIAS]
+        caches_config[CACHE_ALIAS] = {
+            'BACKEND': 'posts.cache_backends.TieredCache',
+            'LOCATION': 'posts_shared',
+            'KEY_PREFIX': 'posts',
+            'OPTIONS': {'MAX_ENTRIES': 1000, 'L1_TIMEOUT': 5},
+        }
+    return caches_config
+
+
+def run_worker(caches_config, seed, requests, pages, skew):
+    """Процесс-«воркер»: запросы к страницам главной по Ципфу."""
+    rng = random.Random(seed)
+    cum_weights = list(accumulate(
+        1 / rank ** skew for rank in range(1, pages + 1)
+    ))
+    counts = Counter()
+    with override_settings(CACHES=caches_config, ALLOWED_HOSTS=['testserver']):
+        count_gets(caches[CACHE_ALIAS], counts)
+        client = Client()
+        url = reverse('posts:index')
+        started = time.perf_counter()
+        for page in rng.choices(
+            range(1, pages + 1), cum_weights=cum_weights, k=requests
+        ):
+            client.get(url, {'page': page})
+        elapsed = time.perf_counter() - started
+        stats = getattr(caches[CACHE_ALIAS], 'stats', dict)()
+    connection.close()
+    return counts, elapsed, stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Доля попаданий в кеш при нескольких процессах, как у воркеров '
+        'gunicorn: с кешем в памяти процесса и с общим кешем.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Запросов на процесс.')
+        parser.add_argument('--pages', type=int, default=100,
+                            help='Сколько страниц главной запрашивается.')
+        parser.add_argument('--skew', type=float, default=1.0,
+                            help='Показатель степени распределения Ципфа '
+                                 'популярности страниц.')
+        parser.add_argument('--posts', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--backends', nargs='+',
+                            default=['locmem', 'file', 'tiered'],
+                            choices=sorted(settings.CACHE_BACKENDS)
+                            + ['tiered'],
+                            help="tiered — файловый кеш с L1 в памяти "
+                                 "процесса.")
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        # процессам нужна общая база в файле, а не в памяти
+        connection.settings_dict['TEST']['NAME'] = os.path.join(
+            directory, 'benchmark.sqlite3'
+        )
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            DatasetBuilder(seed=options['seed'], index_search=False).build(
+                users=100, groups=10, posts=options['posts'], comments=0,
+                follows=0,
+            )
+            self.stdout.write(
+                f'{"кеш":<8}{"страницы":>10}{"карточки":>10}{"версии":>10}'
+                f'{"мс/запрос":>11}'
+            )
+            for backend in options['backends']:
+                self.report(backend, self.run(
+                    backend, os.path.join(directory, backend), options
+                ), options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def run(self, backend, location, options):
+        caches_config = cache_settings(backend, location)
+        with override_settings(CACHES=caches_config):
+            caches[CACHE_ALIAS].clear()
+        # дочерние процессы открывают свои соединения с базой
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(options['workers']) as pool:
+            return pool.starmap(run_worker, [
+                (caches_config, options['seed'] + worker,
+                 options['requests'], options['pages'], options['skew'])
+                for worker in range(options['workers'])
+            ])
+
+    def report(self, backend, results, options):
+        counts = sum((worker_counts for worker_counts, _, _ in results),
+                     Counter())
+        requests = options['workers'] * options['requests']
+        rates = [counts['page', True] / requests]
+        for kind in KINDS[1:]:
+            total = counts[kind, True] + counts[kind, False]
+            rates.append(counts[kind, True] / total if total else 0)
+        elapsed = sum(seconds for _, seconds, _ in results)
+        self.stdout.write(
+            f'{backend:<8}' + ''.join(f'{rate:>10.0%}' for rate in rates)
+            + f'{elapsed * 1000 / requests:>11.2f}'
+        )
+        tiers = [stats for _, _, stats in results if stats]
+        if not tiers:
+            return
+        # попадания по уровням: L1 процесса и общий L2
+        total = Counter()
+        for stats in tiers:
+            for tier in ('l1', 'l2'):
+                for outcome, number in stats[tier].items():
+                    total[tier, outcome] += number
+            total['invalidations'] += stats['invalidations']
+            total['flushes'] += stats['flushes']
+        line = []
+        for tier in ('l1', 'l2'):
+            reads = total[tier, 'hits'] + total[tier, 'misses']
+            rate = total[tier, 'hits'] / reads if reads else 0
+            line.append(f'{tier.upper()} {rate:.0%} из {reads}')
+        line.append(f'инвалидаций {total["invalidations"]}')
+        line.append(f'очисток L1 {total["flushes"]}')
+        self.stdout.write('        ' + ', '.join(line))
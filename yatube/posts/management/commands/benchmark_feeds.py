@@ -0,0 +1,148 @@
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import (override_settings, setup_databases,
+                               teardown_databases)
+
+from posts import feeds, timeline
+from posts.management.commands.benchmark_cache import cache_settings
+from posts.models import Follow, Post, TimelineEntry, User
+from posts.stats import rebuild_author_stats
+
+
+class Rollback(Exception):
+    pass
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    index = min(int(len(ordered) * share), len(ordered) - 1)
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает ленты подписок pull, push и hybrid на синтетическом '
+        'графе подписок. Данные создаются в отдельной тестовой базе и '
+        'откатываются после каждой стратегии, версии лент хранятся в '
+        'памяти процесса, а не в общем кеше.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--follows', type=int, default=30,
+                            help='Подписок на пользователя.')
+        parser.add_argument('--posts', type=int, default=300)
+        parser.add_argument('--readers', type=int, default=100)
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель степени распределения Ципфа '
+                                 'популярности авторов.')
+        parser.add_argument('--threshold', type=int,
+                            default=settings.FEED_PULL_FOLLOWERS_THRESHOLD,
+                            help='Порог подписчиков для стратегии hybrid.')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(CACHES=cache_settings('locmem', None)):
+                self.compare(options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+    def compare(self, options):
+        strategies = (
+            ('pull', None),
+            ('push', None),
+            ('hybrid', options['threshold']),
+        )
+        self.stdout.write(
+            f'{"стратегия":<10}{"запись, мс/пост":>18}{"запросов/пост":>16}'
+            f'{"чтение p50, мс":>17}{"p95, мс":>10}{"запросов":>10}'
+            f'{"строк ленты":>14}'
+        )
+        for name, threshold in strategies:
+            try:
+                with transaction.atomic():
+                    result = self.run(name, threshold, options)
+                    raise Rollback
+            except Rollback:
+                pass
+            self.stdout.write(
+                f'{name:<10}{result["write_ms"]:>18.2f}'
+                f'{result["write_queries"]:>16.1f}'
+                f'{result["read_p50"]:>17.2f}{result["read_p95"]:>10.2f}'
+                f'{result["read_queries"]:>10.1f}'
+                f'{result["timeline_rows"]:>14}'
+            )
+
+    def make_graph(self, rng, options):
+        User.objects.bulk_create(
+            [User(username=f'bench{i}') for i in range(options['users'])],
+            batch_size=500,
+        )
+        users = list(
+            User.objects.filter(username__startswith='bench').order_by('pk')
+        )
+        weights = [
+            1 / (rank + 1) ** options['skew'] for rank in range(len(users))
+        ]
+        follows = []
+        for user in users:
+            authors = set(rng.choices(users, weights, k=options['follows']))
+            authors.discard(user)
+            follows.extend(Follow(user=user, author=a) for a in authors)
+        Follow.objects.bulk_create(
+            follows, batch_size=500, ignore_conflicts=True
+        )
+        rebuild_author_stats()
+        return users, weights
+
+    def run(self, name, threshold, options):
+        rng = random.Random(options['seed'])
+        users, weights = self.make_graph(rng, options)
+        readers = rng.sample(users, min(options['readers'], len(users)))
+        with override_settings(FEED_PULL_FOLLOWERS_THRESHOLD=threshold):
+            if name != 'pull':
+                for user in users:
+                    timeline.build(user.pk)
+            authors = rng.choices(users, weights, k=options['posts'])
+            write_queries = QueryCounter()
+            with connection.execute_wrapper(write_queries):
+                started = time.perf_counter()
+                for i, author in enumerate(authors):
+                    Post.objects.create(author=author, text=f'Пост {i}')
+                write_seconds = time.perf_counter() - started
+            read_times, read_queries = [], []
+            for user in readers:
+                queries = QueryCounter()
+                with connection.execute_wrapper(queries):
+                    started = time.perf_counter()
+                    if name == 'pull':
+                        posts = timeline.pull_feed(user)
+                    else:
+                        posts = feeds.follow_feed(user)
+                    list(posts[:settings.POSTS_PER_PAGE])
+                    read_times.append(time.perf_counter() - started)
+                read_queries.append(queries.count)
+            return {
+                'write_ms': write_seconds * 1000 / len(authors),
+                'write_queries': write_queries.count / len(authors),
+                'read_p50': percentile(read_times, 0.5) * 1000,
+                'read_p95': percentile(read_times, 0.95) * 1000,
+                'read_queries': statistics.mean(read_queries),
+                'timeline_rows': TimelineEntry.objects.count(),
+            }
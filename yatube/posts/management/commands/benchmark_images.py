@@ -0,0 +1,135 @@
+import io
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageDraw, ImageOps
+
+from posts import thumbnails
+
+# ширина слота карточки в CSS-пикселях и плотность экрана
+VIEWPORTS = (
+    ('телефон 1x', 360, 1),
+    ('телефон 2x', 360, 2),
+    ('десктоп 1x', 720, 1),
+    ('десктоп 2x', 720, 2),
+)
+# качество JPEG в sorl по умолчанию (THUMBNAIL_QUALITY)
+OLD_QUALITY = 95
+
+
+def sample_image(rng, size=(2000, 1333)):
+    """Синтетическая «фотография»: градиент, шум и случайные фигуры."""
+    noise = Image.effect_noise(size, rng.randint(20, 60))
+    gradient = Image.linear_gradient('L').resize(size)
+    image = Image.merge('RGB', (
+        gradient,
+        noise,
+        gradient.rotate(rng.randint(0, 360)),
+    ))
+    draw = ImageDraw.Draw(image)
+    for _ in range(30):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        radius = rng.randint(20, 300)
+        draw.ellipse(
+            (x - radius, y - radius, x + radius, y + radius),
+            fill=tuple(rng.randrange(256) for _ in range(3)),
+        )
+    return image
+
+
+def encode(image, size, pil_format, quality):
+    """Размер в байтах и время создания миниатюры в мс."""
+    started = time.perf_counter()
+    resized = ImageOps.fit(image, size, Image.LANCZOS)
+    buffer = io.BytesIO()
+    resized.save(buffer, format=pil_format, quality=quality)
+    elapsed = (time.perf_counter() - started) * 1000
+    return len(buffer.getvalue()), elapsed
+
+
+def pick(widths, slot):
+    """Ширина из srcset, которую выберет браузер для слота."""
+    return next((width for width in widths if width >= slot), widths[-1])
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает размер и время создания прежней миниатюры карточки '
+        '(один JPEG) и вариантов для srcset из POST_THUMBNAILS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'images',
+            nargs='*',
+            help='Файлы картинок; без них создаются синтетические.',
+        )
+        parser.add_argument('--samples', type=int, default=5)
+        parser.add_argument('--variant', default='card')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['images']:
+            images = [
+                Image.open(path).convert('RGB') for path in options['images']
+            ]
+        else:
+            rng = random.Random(options['seed'])
+            images = [sample_image(rng) for _ in range(options['samples'])]
+        sizes = thumbnails.variant_sizes(options['variant'])
+        widths = [width for width, _ in sizes]
+        formats = thumbnails.image_formats()
+
+        old = [encode(image, sizes[-1], 'JPEG', OLD_QUALITY)
+               for image in images]
+        old_bytes = statistics.mean(size for size, _ in old)
+        old_ms = statistics.mean(ms for _, ms in old)
+
+        results = {}
+        for image_format in formats:
+            pil_format = thumbnails.FORMATS[image_format][0]
+            quality = settings.POST_IMAGE_FORMATS[image_format]
+            for size in sizes:
+                encoded = [encode(image, size, pil_format, quality)
+                           for image in images]
+                results[image_format, size[0]] = (
+                    statistics.mean(size for size, _ in encoded),
+                    statistics.mean(ms for _, ms in encoded),
+                )
+
+        self.stdout.write(f'картинок: {len(images)}, '
+                          f'форматы: {", ".join(formats)}')
+        self.stdout.write(f'{"вариант":<20}{"КБ":>10}{"создание, мс":>15}')
+        self.stdout.write(
+            f'{"прежний jpeg " + str(sizes[-1][0]):<20}'
+            f'{old_bytes / 1024:>10.1f}{old_ms:>15.1f}'
+        )
+        for (image_format, width), (size, ms) in results.items():
+            self.stdout.write(
+                f'{image_format + " " + str(width):<20}'
+                f'{size / 1024:>10.1f}{ms:>15.1f}'
+            )
+        total_ms = sum(ms for _, ms in results.values())
+        self.stdout.write(
+            f'создание всех вариантов: {total_ms:.1f} мс на картинку '
+            f'против {old_ms:.1f} мс'
+        )
+
+        best = formats[0]
+        per_page = settings.POSTS_PER_PAGE
+        self.stdout.write(
+            f'\n{"экран":<14}{"файл":>12}'
+            f'{"КБ на страницу":>16}{"было":>10}{"экономия":>10}'
+        )
+        for label, slot, density in VIEWPORTS:
+            width = pick(widths, slot * density)
+            page = results[best, width][0] * per_page
+            was = old_bytes * per_page
+            self.stdout.write(
+                f'{label:<14}{best + " " + str(width):>12}'
+                f'{page / 1024:>16.1f}{was / 1024:>10.1f}'
+                f'{1 - page / was:>10.0%}'
+            )
@@ -0,0 +1,78 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.test.utils import (override_settings, setup_databases,
+                               teardown_databases)
+
+from posts.cache import CACHE_ALIAS
+from posts.management.commands.benchmark_cache import cache_settings
+from posts.models import Group, Post, User
+from posts.utils import page_obj_return
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время отрисовки страницы ленты с кешем карточек '
+        'постов и без него. Данные создаются в отдельной тестовой базе, '
+        'карточки кешируются в памяти процесса, а не в общем кеше.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=200)
+
+    def handle(self, *args, **options):
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(CACHES=cache_settings('locmem', None)):
+                cold, warm = self.run(options['rounds'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+        self.stdout.write(
+            f'{settings.POSTS_PER_PAGE} постов на странице, медиана '
+            f'из {options["rounds"]} отрисовок:\n'
+            f'  без кеша карточек: {cold:.2f} мс\n'
+            f'  с кешем карточек: {warm:.2f} мс\n'
+            f'  экономия: {cold - warm:.2f} мс '
+            f'({(cold - warm) / cold:.0%})'
+        )
+
+    def run(self, rounds):
+        author = User.objects.create_user(
+            username='bench_cards', first_name='Имя', last_name='Фамилия'
+        )
+        group = Group.objects.create(
+            title='Группа', slug='bench-cards', description='Описание'
+        )
+        Post.objects.bulk_create(
+            Post(author=author, group=group, text='Текст поста. ' * 40)
+            for _ in range(settings.POSTS_PER_PAGE)
+        )
+        request = RequestFactory().get('/')
+        request.user = author
+        posts = Post.objects.select_related('author', 'group').filter(
+            author=author
+        )
+        page_obj = page_obj_return(request, posts)
+        list(page_obj)
+        timings = []
+        # таймаут 0: карточки не сохраняются и отрисовываются заново
+        for timeout in (0, settings.POST_CARD_CACHE_TIMEOUT):
+            caches[CACHE_ALIAS].clear()
+            with override_settings(POST_CARD_CACHE_TIMEOUT=timeout):
+                render_to_string(
+                    'posts/index.html', {'page_obj': page_obj}, request
+                )
+                samples = []
+                for _ in range(rounds):
+                    started = time.perf_counter()
+                    render_to_string(
+                        'posts/index.html', {'page_obj': page_obj}, request
+                    )
+                    samples.append(time.perf_counter() - started)
+            timings.append(statistics.median(samples) * 1000)
+        return timings
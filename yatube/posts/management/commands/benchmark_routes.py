@@ -0,0 +1,377 @@
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import (override_settings, setup_databases,
+                               teardown_databases)
+from django.urls import get_resolver, reverse
+
+from core.queries import QueryInspector
+from posts.cache import CACHE_ALIAS
+from posts.management.commands.benchmark_cache import cache_settings
+from posts.models import Comment, Group, Post, User
+from posts.seeding import DatasetBuilder
+
+CLEAR_REFS = '/proc/self/clear_refs'
+
+
+def rss_status(key):
+    """Значение поля из /proc/self/status в КБ или None."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(key + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+class PeakMemory:
+    """Прирост пикового RSS процесса за время блока, КБ.
+
+    На Linux пик сбрасывается через /proc/self/clear_refs, иначе берётся
+    ru_maxrss, который только растёт за время жизни процесса.
+    """
+
+    def __enter__(self):
+        self.resettable = os.access(CLEAR_REFS, os.W_OK)
+        if self.resettable:
+            with open(CLEAR_REFS, 'w') as refs:
+                refs.write('5')
+            self.before = rss_status('VmRSS')
+        else:
+            self.before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.growth = 0
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.resettable:
+            peak = rss_status('VmHWM')
+        else:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.growth = max(peak - self.before, 0)
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """Процентили values; для одного значения все они равны ему."""
+    if len(values) < 2:
+        return {point: values[0] if values else 0.0 for point in points}
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return {point: cuts[point - 1] for point in points}
+
+
+def url_names():
+    """Имена адресов приложения posts и его API из URLconf; адреса API
+    — с пространством имён api:."""
+    resolver = get_resolver()
+    names = set()
+    for namespace, prefix in (('posts', ''), ('api', 'api:')):
+        _, urls = resolver.namespace_dict[namespace]
+        names.update(
+            prefix + name for name in urls.reverse_dict
+            if isinstance(name, str)
+        )
+    return names
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест всех адресов posts/urls.py и API на синтетических '
+        'данных. Данные создаются в отдельной тестовой базе, кеш — свой '
+        'в памяти процесса, результат пишется в JSON для сравнения между '
+        'коммитами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=40000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Запросов к каждому адресу.')
+        parser.add_argument('--warmup', type=int, default=1,
+                            help='Запросов без замеров перед каждым '
+                                 'адресом.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--routes', nargs='+', metavar='NAME',
+                            help='Проверять только эти адреса.')
+        parser.add_argument('--output', help='Файл для результатов JSON.')
+        parser.add_argument('--compare', metavar='JSON',
+                            help='Результаты прошлого запуска для '
+                                 'сравнения.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as source:
+                baseline = json.load(source)
+        self.rng = random.Random(options['seed'])
+        self.clients = {}
+        routes = self.routes()
+        missing = url_names() - set(routes)
+        if missing:
+            raise CommandError(
+                f'Нет замеров для адресов: {", ".join(sorted(missing))}'
+            )
+        if options['routes']:
+            unknown = set(options['routes']) - set(routes)
+            if unknown:
+                raise CommandError(
+                    f'Неизвестные адреса: {", ".join(sorted(unknown))}'
+                )
+            routes = {name: routes[name] for name in options['routes']}
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver'],
+                                   CACHES=cache_settings('locmem', None)):
+                result = self.run(routes, options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+        if options['output']:
+            with open(options['output'], 'w') as target:
+                json.dump(result, target, ensure_ascii=False, indent=2)
+        self.report(result, baseline)
+
+    def run(self, routes, options):
+        started = time.perf_counter()
+        counts = DatasetBuilder(
+            seed=options['seed'], chunk_size=options['chunk_size']
+        ).build(
+            options['users'], options['groups'], options['posts'],
+            options['comments'], options['follows'],
+        )
+        seed_seconds = time.perf_counter() - started
+        self.users = list(User.objects.order_by('pk'))
+        self.group_slugs = list(Group.objects.values_list('slug', flat=True))
+        self.post_ids = list(Post.objects.values_list('pk', flat=True))
+        self.comment_ids = list(
+            Comment.objects.values_list('post_id', 'pk')
+        )
+        results = {}
+        for name, prepare in routes.items():
+            caches['default'].clear()
+            caches[CACHE_ALIAS].clear()
+            for _ in range(options['warmup']):
+                client, method, path, data = prepare()
+                getattr(client, method)(path, data)
+            results[name] = self.measure(prepare, options['requests'])
+        return {
+            'meta': {
+                'commit': git_commit(),
+                'created': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'seed': options['seed'],
+                'requests': options['requests'],
+                'seed_seconds': round(seed_seconds, 2),
+            },
+            'dataset': counts,
+            'routes': results,
+        }
+
+    def client(self, user):
+        """Клиент, авторизованный как user; None — анонимный."""
+        if user not in self.clients:
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            self.clients[user] = client
+        return self.clients[user]
+
+    def reader(self):
+        return self.client(self.rng.choice(self.users))
+
+    def page(self):
+        # в основном первые страницы, как у настоящих читателей
+        return {'page': min(int(self.rng.expovariate(0.5)) + 1, 20)}
+
+    def routes(self):
+        """Имя адреса -> функция, готовящая один запрос к нему.
+
+        Функция возвращает (клиент, метод, путь, данные): выбор объектов
+        и авторизация не попадают в замер. Имена совпадают с именами
+        адресов в URLconf, адреса API — с префиксом api:.
+        """
+        rng = self.rng
+        anonymous = self.client(None)
+
+        def post_id():
+            return rng.choice(self.post_ids)
+
+        def username():
+            return rng.choice(self.users).username
+
+        def edit():
+            post = Post.objects.select_related('author').get(pk=post_id())
+            return (
+                self.client(post.author), 'get',
+                reverse('posts:post_edit', args=(post.pk,)), {},
+            )
+
+        return {
+            'index': lambda: (
+                anonymous, 'get', reverse('posts:index'), self.page(),
+            ),
+            'group_list': lambda: (
+                anonymous, 'get',
+                reverse('posts:group_list', args=(
+                    rng.choice(self.group_slugs),
+                )),
+                self.page(),
+            ),
+            'profile': lambda: (
+                anonymous, 'get',
+                reverse('posts:profile', args=(username(),)), self.page(),
+            ),
+            'search': lambda: (
+                anonymous, 'get', reverse('posts:search'),
+                {'q': rng.choice(self.post_words())},
+            ),
+            'post_detail': lambda: (
+                anonymous, 'get',
+                reverse('posts:post_detail', args=(post_id(),)), {},
+            ),
+            'post_comments': lambda: (
+                anonymous, 'get',
+                reverse('posts:post_comments', args=(post_id(),)), {},
+            ),
+            'comment_replies': lambda: (
+                anonymous, 'get',
+                reverse('posts:comment_replies',
+                        args=rng.choice(self.comment_ids)),
+                {},
+            ),
+            'post_create': lambda: (
+                self.reader(), 'post', reverse('posts:post_create'),
+                {'text': f'Нагрузочный пост {rng.random()}'},
+            ),
+            'post_edit': edit,
+            'add_comment': lambda: (
+                self.reader(), 'post',
+                reverse('posts:add_comment', args=(post_id(),)),
+                {'text': f'Нагрузочный комментарий {rng.random()}'},
+            ),
+            'follow_index': lambda: (
+                self.reader(), 'get', reverse('posts:follow_index'),
+                self.page(),
+            ),
+            'profile_follow': lambda: (
+                self.reader(), 'get',
+                reverse('posts:profile_follow', args=(username(),)), {},
+            ),
+            'profile_unfollow': lambda: (
+                self.reader(), 'get',
+                reverse('posts:profile_unfollow', args=(username(),)), {},
+            ),
+            'api:index': lambda: (
+                anonymous, 'get', reverse('api:index'), {},
+            ),
+            'api:group_list': lambda: (
+                anonymous, 'get',
+                reverse('api:group_list', args=(
+                    rng.choice(self.group_slugs),
+                )),
+                {},
+            ),
+            'api:profile': lambda: (
+                anonymous, 'get',
+                reverse('api:profile', args=(username(),)), {},
+            ),
+            'api:follow_index': lambda: (
+                self.reader(), 'get', reverse('api:follow_index'), {},
+            ),
+            'api:post_detail': lambda: (
+                anonymous, 'get',
+                reverse('api:post_detail', args=(post_id(),)), {},
+            ),
+            'api:post_comments': lambda: (
+                anonymous, 'get',
+                reverse('api:post_comments', args=(post_id(),)), {},
+            ),
+        }
+
+    def post_words(self):
+        if not hasattr(self, '_words'):
+            texts = Post.objects.values_list('text', flat=True)[:100]
+            self._words = [
+                word.strip('.,') for text in texts for word in text.split()
+                if len(word) > 4
+            ] or ['пост']
+        return self._words
+
+    def measure(self, prepare, count):
+        latencies, queries, statuses = [], [], {}
+        with PeakMemory() as memory:
+            for _ in range(count):
+                client, method, path, data = prepare()
+                send = getattr(client, method)
+                inspector = QueryInspector()
+                with connection.execute_wrapper(inspector):
+                    started = time.perf_counter()
+                    response = send(path, data)
+                    latencies.append(time.perf_counter() - started)
+                queries.append(inspector.count)
+                code = str(response.status_code)
+                statuses[code] = statuses.get(code, 0) + 1
+        latency = percentiles([seconds * 1000 for seconds in latencies])
+        return {
+            'p50_ms': round(latency[50], 3),
+            'p95_ms': round(latency[95], 3),
+            'p99_ms': round(latency[99], 3),
+            'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+            'queries_mean': round(statistics.mean(queries), 2),
+            'queries_max': max(queries),
+            'peak_memory_kb': memory.growth,
+            'status': statuses,
+        }
+
+    def report(self, result, baseline=None):
+        dataset = ', '.join(
+            f'{name}={count}' for name, count in result['dataset'].items()
+        )
+        self.stdout.write(
+            f'Данные: {dataset} ({result["meta"]["seed_seconds"]} с)'
+        )
+        self.stdout.write(
+            f'{"адрес":<18}{"p50, мс":>10}{"p95, мс":>10}{"p99, мс":>10}'
+            f'{"запросов":>10}{"память, КБ":>12}'
+        )
+        before = baseline['routes'] if baseline else {}
+        for name, route in result['routes'].items():
+            line = (
+                f'{name:<18}{route["p50_ms"]:>10.2f}{route["p95_ms"]:>10.2f}'
+                f'{route["p99_ms"]:>10.2f}{route["queries_mean"]:>10.1f}'
+                f'{route["peak_memory_kb"]:>12}'
+            )
+            old = before.get(name)
+            if old:
+                p95 = route['p95_ms'] - old['p95_ms']
+                queries = route['queries_mean'] - old['queries_mean']
+                line += f'   p95 {p95:+.2f} мс, запросов {queries:+.1f}'
+
+            self.stdout.write(line)
@@ -0,0 +1,157 @@
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection
+from django.test import Client
+from django.test.utils import (override_settings, setup_databases,
+                               teardown_databases)
+from django.urls import reverse
+
+from posts.models import Post, User
+from posts.seeding import DatasetBuilder
+
+from .benchmark_routes import percentiles
+
+# журнал и синхронизация SQLite по умолчанию, соединение на запрос,
+# транзакции DEFERRED
+PROFILES = {
+    'default': {
+        'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+        'conn_max_age': 0,
+        'transaction_mode': None,
+    },
+    'tuned': {
+        'pragmas': settings.SQLITE_PRAGMAS,
+        'conn_max_age': 600,
+        'transaction_mode': 'IMMEDIATE',
+    },
+}
+
+
+def run_worker(profile, seed, requests, write_ratio, post_ids, usernames):
+    """Процесс-«воркер»: смесь чтений страниц и комментариев."""
+    rng = random.Random(seed)
+    connection.settings_dict['CONN_MAX_AGE'] = profile['conn_max_age']
+    connection.settings_dict['OPTIONS']['transaction_mode'] = (
+        profile['transaction_mode']
+    )
+    # ошибки «database is locked» считаются, а не пишутся в лог
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    timings = {'read': [], 'write': []}
+    errors = 0
+    with override_settings(SQLITE_PRAGMAS=profile['pragmas'],
+                           QUERY_INSPECTOR_ENABLED=False,
+                           ALLOWED_HOSTS=['testserver']):
+        client = Client()
+        client.force_login(User.objects.get(username=rng.choice(usernames)))
+        close_old_connections()
+        for _ in range(requests):
+            post_id = rng.choice(post_ids)
+            if rng.random() < write_ratio:
+                kind = 'write'
+                request = (client.post, reverse(
+                    'posts:add_comment', kwargs={'post_id': post_id}
+                ), {'text': 'Комментарий'})
+            else:
+                kind = 'read'
+                request = (client.get, rng.choice([
+                    reverse('posts:post_detail', kwargs={'post_id': post_id}),
+                    reverse('posts:profile',
+                            kwargs={'username': rng.choice(usernames)}),
+                ]), {})
+            method, path, data = request
+            started = time.perf_counter()
+            try:
+                method(path, data)
+            except OperationalError:
+                errors += 1
+            else:
+                timings[kind].append(time.perf_counter() - started)
+            # то, что делает request_finished вне тестового клиента
+            close_old_connections()
+    connection.close()
+    return timings, errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Одновременные чтения и записи нескольких процессов к базе SQLite '
+        'в файле: настройки SQLite по умолчанию против SQLITE_PRAGMAS и '
+        'постоянных соединений.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=300,
+                            help='Запросов на процесс.')
+        parser.add_argument('--write-ratio', type=float, default=0.2,
+                            help='Доля запросов, добавляющих комментарий.')
+        parser.add_argument('--posts', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--profiles', nargs='+', default=list(PROFILES),
+                            choices=list(PROFILES))
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        # процессам нужна общая база в файле, а не в памяти
+        connection.settings_dict['TEST']['NAME'] = os.path.join(
+            directory, 'benchmark.sqlite3'
+        )
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            DatasetBuilder(seed=options['seed'], index_search=False).build(
+                users=100, groups=10, posts=options['posts'],
+                comments=options['posts'], follows=200,
+            )
+            post_ids = list(Post.objects.values_list('pk', flat=True))
+            usernames = list(User.objects.values_list('username', flat=True))
+            self.stdout.write(
+                f'{"профиль":<9}{"запр/с":>8}{"чтение p50":>12}'
+                f'{"p95":>8}{"запись p50":>12}{"p95":>8}{"ошибки":>8}'
+            )
+            for name in options['profiles']:
+                self.report(name, *self.run(
+                    PROFILES[name], options, post_ids, usernames
+                ))
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def run(self, profile, options, post_ids, usernames):
+        # режим журнала хранится в файле базы и действует на все процессы
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'PRAGMA journal_mode = {profile["pragmas"]["journal_mode"]}'
+            )
+        # дочерние процессы открывают свои соединения с базой
+        connection.close()
+        context = multiprocessing.get_context('fork')
+        started = time.perf_counter()
+        with context.Pool(options['workers']) as pool:
+            results = pool.starmap(run_worker, [
+                (profile, options['seed'] + worker, options['requests'],
+                 options['write_ratio'], post_ids, usernames)
+                for worker in range(options['workers'])
+            ])
+        return results, time.perf_counter() - started
+
+    def report(self, name, results, elapsed):
+        timings = {'read': [], 'write': []}
+        errors = 0
+        for worker_timings, worker_errors in results:
+            for kind, values in worker_timings.items():
+                timings[kind].extend(values)
+            errors += worker_errors
+        done = len(timings['read']) + len(timings['write'])
+        line = f'{name:<9}{done / elapsed:>8.0f}'
+        for kind in ('read', 'write'):
+            cuts = percentiles([value * 1000 for value in timings[kind]])
+            line += f'{cuts[50]:>12.1f}{cuts[95]:>8.1f}'
+        self.stdout.write(line + f'{errors:>8}')
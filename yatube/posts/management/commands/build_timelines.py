@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.models import Follow, Timeline
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит материализованные ленты подписок пользователей, у которых '
+        'есть подписки, но ленты ещё нет. Новые ленты строятся при '
+        'подписке; команда нужна для подписок, созданных до этого.'
+    )
+
+    def handle(self, *args, **options):
+        user_ids = list(
+            Follow.objects.exclude(
+                user_id__in=Timeline.objects.values('user_id')
+            ).order_by('user_id').values_list('user_id', flat=True)
+            .distinct()
+        )
+        built = sum(timeline.build(user_id) for user_id in user_ids)
+        self.stdout.write(self.style.SUCCESS(f'Построено лент: {built}.'))
@@ -0,0 +1,80 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts import media
+from posts.models import Post
+from posts.storage import post_image_storage
+
+UPLOAD_DIRECTORY = Post._meta.get_field('image').upload_to.rstrip('/')
+
+
+class Command(BaseCommand):
+    help = (
+        'Находит одинаковые по содержимому картинки постов и файлы без '
+        'постов; с --reclaim переводит посты на один файл и удаляет '
+        'лишние файлы вместе с миниатюрами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reclaim',
+            action='store_true',
+            help='Удалить дубликаты и файлы без постов.',
+        )
+        parser.add_argument(
+            '--orphan-age',
+            type=int,
+            default=60,
+            help='Файл без постов удаляется, если он старше стольких '
+                 'минут: более новый может принадлежать посту, который '
+                 'ещё сохраняется.',
+        )
+
+    def handle(self, *args, **options):
+        reclaim = options['reclaim']
+        fixed = media.rebuild_references(dry_run=not reclaim)
+        references = media.expected_references()
+
+        groups = media.group_by_content(references)
+        duplicates = {
+            digest_name: names
+            for digest_name, names in groups.items()
+            if len(names) > 1 or names[0] != digest_name
+        }
+        copies = sum(len(names) - 1 for names in duplicates.values())
+        duplicate_bytes = sum(
+            media.file_size(names[0]) * (len(names) - 1)
+            for names in duplicates.values()
+        )
+        renamed = sum(1 for names in duplicates.values() if len(names) == 1)
+
+        deadline = timezone.now() - timedelta(minutes=options['orphan_age'])
+        orphans = [
+            name for name in media.stored_files(UPLOAD_DIRECTORY)
+            if name not in references
+            and name not in duplicates
+            and post_image_storage.get_modified_time(name) < deadline
+        ]
+        orphan_bytes = sum(media.file_size(name) or 0 for name in orphans)
+
+        self.stdout.write(
+            f'Файлов у постов: {len(references)}, разных по содержимому: '
+            f'{len(groups)}.\n'
+            f'Лишних копий: {copies} ({duplicate_bytes / 1024:.1f} КБ), '
+            f'файлов со старыми именами: {renamed}.\n'
+            f'Файлов без постов: {len(orphans)} '
+            f'({orphan_bytes / 1024:.1f} КБ).\n'
+            f'Расхождений в счётчиках ссылок: {fixed}.'
+        )
+        if not reclaim:
+            return
+        for digest_name, names in duplicates.items():
+            media.deduplicate(digest_name, names)
+        for name in orphans:
+            media.delete_file(name)
+        media.collect_unreferenced()
+        self.stdout.write(self.style.SUCCESS(
+            f'Освобождено {(duplicate_bytes + orphan_bytes) / 1024:.1f} КБ.'
+        ))
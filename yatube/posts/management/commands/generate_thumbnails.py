@@ -0,0 +1,70 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+from posts.utils import iter_chunks
+
+
+def render_or_none(image_name):
+    try:
+        return thumbnails.render(image_name)
+    except Exception:
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт миниатюры картинок существующих постов, распределяя '
+        'работу по процессам.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Число процессов.',
+        )
+        parser.add_argument('--chunk-size', type=int, default=100)
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать миниатюры и у постов, где они уже есть.',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='')
+        if not options['force']:
+            posts = posts.filter(thumbnails='')
+        done = failed = 0
+        started = time.perf_counter()
+        # процессы запускаются заново, а не через fork, чтобы не
+        # унаследовать открытые соединения с базой
+        pool = ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+        with pool:
+            for rows in iter_chunks(
+                posts, ('pk', 'image'), options['chunk_size']
+            ):
+                names = [image_name for _, image_name in rows]
+                results = pool.map(render_or_none, names)
+                for (post_id, image_name), urls in zip(rows, results):
+                    if urls is None:
+                        failed += 1
+                        continue
+                    thumbnails.store(post_id, image_name, urls)
+                    done += 1
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано постов: {done}, с ошибкой: {failed}, '
+            f'за {elapsed:.1f} с.'
+        ))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from posts.stats import rebuild_author_stats, rebuild_comment_counts
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики AuthorStats и число комментариев постов '
+        'и исправляет расхождения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не сохраняя.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Размер пачки при записи в базу.',
+        )
+
+    def handle(self, *args, **options):
+        created, fixed = rebuild_author_stats(
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size'],
+        )
+        posts = rebuild_comment_counts(dry_run=options['dry_run'])
+        prefix = 'Найдено' if options['dry_run'] else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}: отсутствующих строк {created}, '
+            f'строк с неверными счётчиками {fixed}, '
+            f'постов с неверным числом комментариев {posts}.'
+        ))
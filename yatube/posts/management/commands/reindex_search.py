@@ -0,0 +1,44 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import analysis, search
+
+
+class Command(BaseCommand):
+    help = (
+        'Перестраивает поисковый индекс постов и комментариев, '
+        'читая их пачками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Сколько записей читать и индексировать за раз.',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        indexed = Counter()
+        with transaction.atomic():
+            for kind, count in search.reindex(
+                search.get_backend(), options['chunk_size']
+            ):
+                indexed[kind] += count
+                self.stdout.write(
+                    f'{kind}: {indexed[kind]}', ending='\r'
+                )
+        elapsed = time.perf_counter() - started
+        rate = sum(indexed.values()) / max(elapsed, 1e-9)
+        cache_info = analysis.stem.cache_info()
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано постов: {indexed[search.POST]}, '
+            f'комментариев: {indexed[search.COMMENT]} '
+            f'за {elapsed:.1f} с ({rate:.0f} в секунду); '
+            f'попаданий в кеш основ: {cache_info.hits}, '
+            f'промахов: {cache_info.misses}.'
+        ))
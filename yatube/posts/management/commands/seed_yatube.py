@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand
+
+from posts.seeding import DatasetBuilder
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, группами, постами, '
+        'комментариями и подписками. Строки вставляются через bulk_create '
+        'пачками, каждая пачка — в своей транзакции.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='Сколько строк вставлять в одной транзакции.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Строк в одном INSERT; по умолчанию максимум для базы.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Процессов, генерирующих строки.',
+        )
+        parser.add_argument(
+            '--skew',
+            type=float,
+            default=1.1,
+            help='Показатель степени распределения Ципфа популярности '
+                 'авторов.',
+        )
+
+        parser.add_argument(
+            '--skip-search-index',
+            action='store_true',
+            help='Не перестраивать поисковый индекс; его можно построить '
+                 'позже командой reindex_search.',
+        )
+
+    def handle(self, *args, **options):
+        builder = DatasetBuilder(
+            seed=options['seed'],
+            chunk_size=options['chunk_size'],
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            skew=options['skew'],
+            index_search=not options['skip_search_index'],
+        )
+        counts = builder.build(
+            options['users'], options['groups'], options['posts'],
+            options['comments'], options['follows'],
+        )
+        self.stdout.write(
+            f'{"модель":<14}{"строк":>10}{"секунд":>10}{"строк/с":>12}'
+        )
+        for name, seconds in builder.timings.items():
+            rows = counts.get(name)
+            if rows is None:
+                self.stdout.write(f'{name:<14}{"":>10}{seconds:>10.2f}')
+                continue
+            rate = rows / max(seconds, 1e-9)
+            self.stdout.write(
+                f'{name:<14}{rows:>10}{seconds:>10.2f}{rate:>12.0f}'
+            )
+        total = sum(counts.values())
+        seconds = sum(builder.timings.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано строк: {total} за {seconds:.1f} с.'
+        ))
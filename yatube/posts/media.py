@@ -0,0 +1,152 @@
+"""Учёт ссылок постов на файлы картинок.
+
+Число постов, ссылающихся на файл, хранится в StoredImage и меняется
+сигналами сохранения и удаления постов. Когда ссылок не остаётся, файл
+и его миниатюры удаляются после коммита.
+"""
+import logging
+import posixpath
+from collections import defaultdict
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.db.models import Count, F
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from .models import Post, StoredImage
+from .storage import post_image_storage
+
+logger = logging.getLogger(__name__)
+
+
+def retain(name):
+    """Добавляет ссылку на файл name."""
+    with transaction.atomic():
+        StoredImage.objects.get_or_create(name=name)
+    StoredImage.objects.filter(name=name).update(
+        references=F('references') + 1
+    )
+
+
+def release(name):
+    """Убирает ссылку на файл name; файл без ссылок удаляется после
+    коммита."""
+    StoredImage.objects.filter(name=name, references__gt=0).update(
+        references=F('references') - 1
+    )
+    transaction.on_commit(lambda: collect(name))
+
+
+def collect(name):
+    """Удаляет файл name и его миниатюры, если ссылок на него не
+    осталось. Возвращает True, если файл удалён."""
+    deleted, _ = StoredImage.objects.filter(
+        name=name, references=0
+    ).delete()
+    if not deleted:
+        return False
+    return delete_file(name)
+
+
+def collect_unreferenced():
+    """Удаляет все файлы, на которые не ссылается ни один пост."""
+    names = StoredImage.objects.filter(references=0).values_list(
+        'name', flat=True
+    )
+    return sum(collect(name) for name in list(names))
+
+
+def delete_file(name):
+    """Удаляет файл name и его миниатюры."""
+    try:
+        default.kvstore.delete(ImageFile(name, post_image_storage))
+        post_image_storage.delete(name)
+    except SuspiciousFileOperation:
+        logger.warning('Файл %s лежит вне MEDIA_ROOT', name)
+        return False
+    return True
+
+
+def expected_references():
+    """Число постов на каждый файл картинки по данным Post."""
+    return dict(
+        Post.objects.exclude(image='').order_by().values('image')
+        .annotate(total=Count('pk')).values_list('image', 'total')
+    )
+
+
+def rebuild_references(dry_run=False, batch_size=500):
+    """Сверяет ссылки StoredImage с постами и исправляет расхождения.
+
+    Возвращает число созданных и исправленных строк.
+    """
+    expected = expected_references()
+    stored = {row.name: row for row in StoredImage.objects.all()}
+    missing = [
+        StoredImage(name=name, references=total)
+        for name, total in expected.items()
+        if name not in stored
+    ]
+    changed = []
+    for name, row in stored.items():
+        total = expected.get(name, 0)
+        if row.references != total:
+            row.references = total
+            changed.append(row)
+    if not dry_run:
+        StoredImage.objects.bulk_create(missing, batch_size=batch_size)
+        StoredImage.objects.bulk_update(
+            changed, ('references',), batch_size=batch_size
+        )
+    return len(missing) + len(changed)
+
+
+def file_size(name):
+    try:
+        return post_image_storage.size(name)
+    except (OSError, SuspiciousFileOperation):
+        return None
+
+
+def group_by_content(names):
+    """Имя файла по его содержимому -> существующие файлы с этим
+    содержимым."""
+    groups = defaultdict(list)
+    for name in names:
+        if file_size(name) is None:
+            continue
+        with post_image_storage.open(name) as content:
+            groups[post_image_storage.digest_name(name, content)].append(
+                name
+            )
+    return groups
+
+
+def deduplicate(digest_name, names):
+    """Переводит посты с файлами names на один файл digest_name; старые
+    файлы удаляются после коммита, когда на них не остаётся ссылок."""
+    with transaction.atomic():
+        if digest_name not in names:
+            with post_image_storage.open(names[0]) as content:
+                post_image_storage.save(names[0], content)
+        duplicates = Post.objects.filter(image__in=names).exclude(
+            image=digest_name
+        )
+        for post in duplicates:
+            post.image.name = digest_name
+            post.thumbnails = ''
+            # новое Post.updated сбрасывает кеш карточки со старым файлом
+            post.save(update_fields=('image', 'thumbnails', 'updated'))
+
+
+def stored_files(directory):
+    """Все файлы хранилища в каталоге directory и его подкаталогах."""
+    try:
+        directories, files = post_image_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in files:
+        yield posixpath.join(directory, name)
+    for subdirectory in directories:
+        yield from stored_files(posixpath.join(directory, subdirectory))
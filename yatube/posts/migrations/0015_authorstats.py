@@ -0,0 +1,68 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_author_stats(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+
+    def grouped(queryset, field):
+        return dict(
+            queryset.order_by().values(field).annotate(
+                total=models.Count('pk')
+            ).values_list(field, 'total')
+        )
+
+    posts = grouped(Post.objects, 'author')
+    comments = grouped(Comment.objects, 'author')
+    followers = grouped(Follow.objects, 'author')
+    following = grouped(Follow.objects, 'user')
+    AuthorStats.objects.bulk_create(
+        [
+            AuthorStats(
+                author_id=user_id,
+                posts_count=posts.get(user_id, 0),
+                comments_count=comments.get(user_id, 0),
+                followers_count=followers.get(user_id, 0),
+                following_count=following.get(user_id, 0),
+            )
+            for user_id in User.objects.values_list('pk', flat=True)
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0014_auto_20230116_1953'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='автор')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='постов')),
+                ('comments_count', models.PositiveIntegerField(default=0, verbose_name='комментариев')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='подписок')),
+            ],
+            options={
+                'verbose_name': 'Статистика автора',
+                'verbose_name_plural': 'Статистика авторов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('author', 'user'), name='unique_follow'),
+        ),
+        migrations.RunPython(fill_author_stats, migrations.RunPython.noop),
+    ]
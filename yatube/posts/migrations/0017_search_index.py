@@ -0,0 +1,38 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:07
+
+from django.db import migrations
+
+
+def create_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS posts_search USING fts5("
+        "text, kind UNINDEXED, object_id UNINDEXED, post_id UNINDEXED, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO posts_search (text, kind, object_id, post_id) "
+        "SELECT text, 'post', id, id FROM posts_post"
+    )
+    schema_editor.execute(
+        "INSERT INTO posts_search (text, kind, object_id, post_id) "
+        "SELECT text, 'comment', id, post_id FROM posts_comment"
+    )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS posts_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_timeline'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
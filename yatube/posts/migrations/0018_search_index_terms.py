@@ -0,0 +1,76 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:40
+
+from django.db import migrations
+
+from posts.analysis import analyze
+
+CHUNK_SIZE = 1000
+
+
+def index_rows(schema_editor, kind, queryset, fields):
+    last_pk = 0
+    with schema_editor.connection.cursor() as cursor:
+        while True:
+            rows = list(
+                queryset.filter(pk__gt=last_pk).order_by('pk')
+                .values_list(*fields)[:CHUNK_SIZE]
+            )
+            if not rows:
+                break
+            cursor.executemany(
+                'INSERT INTO posts_search '
+                '(terms, text, kind, object_id, post_id) '
+                'VALUES (%s, %s, %s, %s, %s)',
+                [
+                    (' '.join(analyze(text)), text, kind, pk, post_id)
+                    for pk, post_id, text in rows
+                ],
+            )
+            last_pk = rows[-1][0]
+
+
+def create_analyzed_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    schema_editor.execute('DROP TABLE IF EXISTS posts_search')
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE posts_search USING fts5("
+        "terms, text UNINDEXED, kind UNINDEXED, object_id UNINDEXED, "
+        "post_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 0')"
+    )
+    index_rows(schema_editor, 'post', Post.objects, ('pk', 'pk', 'text'))
+    index_rows(
+        schema_editor, 'comment', Comment.objects, ('pk', 'post_id', 'text')
+    )
+
+
+def restore_plain_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS posts_search')
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE posts_search USING fts5("
+        "text, kind UNINDEXED, object_id UNINDEXED, post_id UNINDEXED, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO posts_search (text, kind, object_id, post_id) "
+        "SELECT text, 'post', id, id FROM posts_post"
+    )
+    schema_editor.execute(
+        "INSERT INTO posts_search (text, kind, object_id, post_id) "
+        "SELECT text, 'comment', id, post_id FROM posts_comment"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_analyzed_table, restore_plain_table),
+    ]
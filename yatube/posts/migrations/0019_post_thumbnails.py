@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_search_index_terms'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='thumbnails',
+            field=models.TextField(blank=True, default='', editable=False, help_text='JSON: имя размера из POST_THUMBNAILS -> URL миниатюры', verbose_name='Миниатюры'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_post_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='thumbnails',
+            field=models.TextField(blank=True, default='', editable=False, help_text='JSON: вариант из POST_THUMBNAILS -> формат -> список пар [ширина, URL]', verbose_name='Миниатюры'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:23
+
+from django.db import migrations, models
+import posts.storage
+
+
+def fill_stored_images(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    StoredImage = apps.get_model('posts', 'StoredImage')
+    references = (
+        Post.objects.exclude(image='').order_by().values('image')
+        .annotate(total=models.Count('pk')).values_list('image', 'total')
+    )
+    StoredImage.objects.bulk_create(
+        [
+            StoredImage(name=name, references=total)
+            for name, total in references
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_post_thumbnails_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='файл')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл картинки',
+                'verbose_name_plural': 'Файлы картинок',
+            },
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.RunPython(fill_stored_images, migrations.RunPython.noop),
+    ]
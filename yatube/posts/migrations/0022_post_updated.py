@@ -0,0 +1,33 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:02
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def fill_updated(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.update(updated=F('pub_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_storedimage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='updated',
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                help_text='Меняется и при переименовании группы или автора: '
+                          'по ней сбрасывается кеш карточки поста',
+                verbose_name='дата изменения',
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_updated, migrations.RunPython.noop),
+    ]
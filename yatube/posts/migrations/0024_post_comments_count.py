@@ -0,0 +1,35 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_comments_count(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Post.objects.update(comments_count=Coalesce(Subquery(
+        Comment.objects.filter(post=OuterRef('pk')).order_by()
+        .values('post').annotate(total=Count('pk')).values('total')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0023_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text='Поддерживается сигналами Comment',
+                verbose_name='комментариев',
+            ),
+        ),
+        migrations.RunPython(fill_comments_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, LPad
+
+
+def fill_paths(apps, schema_editor):
+    # до веток все комментарии корневые: путь — собственный pk
+    Comment = apps.get_model('posts', 'Comment')
+    Comment.objects.update(
+        path=LPad(Cast('id', CharField()), 10, Value('0'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0024_post_comments_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='глубина'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='posts.Comment', verbose_name='ответ на комментарий'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, help_text='pk предков и самого комментария через точку', max_length=255, verbose_name='путь в ветке'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
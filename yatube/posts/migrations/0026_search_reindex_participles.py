@@ -0,0 +1,25 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:45
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def reindex(apps, schema_editor):
+    """Основы слов с причастными суффиксами ивш, ывш, ующ теперь
+    короче: индекс пересобирается командой reindex_search."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    call_command('reindex_search', stdout=StringIO())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0025_comment_threads'),
+    ]
+
+    operations = [
+        migrations.RunPython(reindex, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,11 @@
+import json
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .storage import post_image_storage
+
 User = get_user_model()
 
 
@@ -23,6 +28,12 @@ class Post(models.Model):
         help_text='Введите текст поста'
     )
     pub_date = models.DateTimeField('дата публикации', auto_now_add=True)
+    updated = models.DateTimeField(
+        'дата изменения',
+        auto_now=True,
+        help_text='Меняется и при переименовании группы или автора: '
+                  'по ней сбрасывается кеш карточки поста',
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -41,17 +52,66 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=post_image_storage,
+        blank=True,
+    )
+    comments_count = models.PositiveIntegerField(
+        'комментариев',
+        default=0,
+        editable=False,
+        help_text='Поддерживается сигналами Comment',
+    )
+    thumbnails = models.TextField(
+        'Миниатюры',
         blank=True,
+        default='',
+        editable=False,
+        help_text=(
+            'JSON: вариант из POST_THUMBNAILS -> формат -> '
+            'список пар [ширина, URL]'
+        ),
     )
 
     class Meta:
-        ordering = ('-pub_date', 'author')
+        # (pub_date, id) — порядок индексов лент: сортировка без
+        # временного B-дерева
+        ordering = ('-pub_date', '-id')
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(
+                fields=('pub_date', 'id'),
+                name='post_pub_date_idx',
+            ),
+            models.Index(
+                fields=('group', 'pub_date'),
+                name='post_group_pub_date_idx',
+            ),
+            models.Index(
+                fields=('author', 'pub_date'),
+                name='post_author_pub_date_idx',
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.text[:15]
 
+    @property
+    def thumbnail_urls(self) -> dict:
+        """Заранее созданные миниатюры картинки поста."""
+        if not self.thumbnails:
+            return {}
+        return json.loads(self.thumbnails)
+
+
+# путь комментария — pk его предков и его собственный, дополненные
+# нулями до одной ширины, чтобы пути сортировались как числа
+PATH_SEGMENT_WIDTH = 10
+PATH_SEPARATOR = '.'
+# следующий за разделителем символ: пути потомков лежат между
+# path + PATH_SEPARATOR и path + PATH_SUBTREE_END
+PATH_SUBTREE_END = chr(ord(PATH_SEPARATOR) + 1)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -71,15 +131,64 @@ class Comment(models.Model):
         help_text='Напишите комментарий'
     )
     created = models.DateTimeField('дата комментария', auto_now_add=True)
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='replies',
+        verbose_name='ответ на комментарий',
+    )
+    path = models.CharField(
+        'путь в ветке',
+        max_length=255,
+        default='',
+        editable=False,
+        help_text='pk предков и самого комментария через точку',
+    )
+    depth = models.PositiveSmallIntegerField(
+        'глубина', default=0, editable=False
+    )
 
     class Meta:
-        ordering = ('-created', 'author')
+        ordering = ('-created', '-id')
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(
+                fields=('post', 'created'),
+                name='comment_post_created_idx',
+            ),
+            models.Index(
+                fields=('post', 'path'),
+                name='comment_post_path_idx',
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        if self.parent_id:
+            self.depth = self.parent.depth + 1
+        super().save(*args, **kwargs)
+        if not self.path:
+            # в путь входит pk, который известен только после вставки
+            segment = str(self.pk).zfill(PATH_SEGMENT_WIDTH)
+            self.path = (
+                self.parent.path + PATH_SEPARATOR + segment
+                if self.parent_id else segment
+            )
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
+
+    @property
+    def can_reply(self):
+        return self.depth < settings.COMMENT_MAX_DEPTH
+
+    def subtree_bounds(self):
+        """Границы путей потомков, не включая сами границы."""
+        return self.path + PATH_SEPARATOR, self.path + PATH_SUBTREE_END
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -106,3 +215,109 @@ class Follow(models.Model):
                 check=~models.Q(user=models.F("author")),
             ),
         ]
+        indexes = [
+            # подписки читателя; уникальный индекс начинается с автора
+            models.Index(
+                fields=('user', 'author'),
+                name='follow_user_author_idx',
+            ),
+        ]
+
+
+class AuthorStats(models.Model):
+    """Денормализованные счётчики пользователя.
+
+    Поддерживаются сигналами при создании и удалении Post, Comment и
+    Follow; пересчитать их с нуля можно командой rebuild_author_stats.
+    """
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='автор',
+    )
+    posts_count = models.PositiveIntegerField('постов', default=0)
+    comments_count = models.PositiveIntegerField('комментариев', default=0)
+    followers_count = models.PositiveIntegerField('подписчиков', default=0)
+    following_count = models.PositiveIntegerField('подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+
+    def __str__(self) -> str:
+        return f'{self.author}: {self.posts_count}'
+
+
+class Timeline(models.Model):
+    """Отметка о том, что лента подписок пользователя материализована."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='timeline',
+        verbose_name='пользователь',
+    )
+    built_at = models.DateTimeField('дата построения', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Лента подписок'
+        verbose_name_plural = 'Ленты подписок'
+
+    def __str__(self) -> str:
+        return str(self.user)
+
+
+class TimelineEntry(models.Model):
+    """Пост в материализованной ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='пользователь',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='пост',
+    )
+    pub_date = models.DateTimeField('дата публикации')
+
+    class Meta:
+        ordering = ('-pub_date',)
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'post'),
+                name='unique_timeline_entry',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-post'),
+                name='timeline_user_date_post_idx',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.user}: {self.post}'
+
+
+class StoredImage(models.Model):
+    """Файл картинки и число постов, которые на него ссылаются.
+
+    Поддерживается сигналами сохранения и удаления Post; пересчитать
+    ссылки с нуля можно командой dedupe_images.
+    """
+    name = models.CharField('файл', max_length=100, primary_key=True)
+    references = models.PositiveIntegerField('ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self) -> str:
+        return f'{self.name}: {self.references}'
@@ -0,0 +1,150 @@
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+AFTER = 'a'
+BEFORE = 'b'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(direction, date, pk):
+    """Упаковывает позицию в ленте в непрозрачную строку."""
+    raw = f'{direction}|{date.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    padding = '=' * (-len(cursor) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(cursor + padding).decode()
+        direction, date, pk = raw.split('|')
+        date = parse_datetime(date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(cursor)
+    if direction not in (AFTER, BEFORE) or date is None:
+        raise InvalidCursor(cursor)
+    return direction, date, pk
+
+
+class CursorPage:
+    """Страница ленты, полученная по курсору.
+
+    Повторяет ту часть интерфейса Page, которая нужна шаблонам,
+    но не знает ни номера страницы, ни их общего количества.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_cursor(self):
+        if not self.has_next() or not self.object_list:
+            return None
+        return self.paginator.cursor_for(AFTER, self.object_list[-1])
+
+    def previous_cursor(self):
+        if not self.has_previous() or not self.object_list:
+            return None
+        return self.paginator.cursor_for(BEFORE, self.object_list[0])
+
+
+class CursorPaginator:
+    """Паджинатор по ключу (date_field, pk_field) без COUNT и OFFSET.
+
+    Каждая страница выбирается одним запросом с условием по позиции
+    последнего показанного объекта и лимитом на одну запись больше
+    размера страницы, чтобы узнать, есть ли следующая.
+    """
+
+    def __init__(self, object_list, per_page, date_field='pub_date',
+                 pk_field='pk'):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.date_field = date_field
+        self.pk_field = pk_field
+
+    def cursor_for(self, direction, obj):
+        # строки values() — словари с ключами pk_field и date_field
+        if isinstance(obj, dict):
+            return encode_cursor(
+                direction, obj[self.date_field], obj[self.pk_field]
+            )
+        return encode_cursor(
+            direction,
+            getattr(obj, self.date_field),
+            getattr(obj, self.pk_field),
+        )
+
+    def _seek(self, direction, date, pk):
+        field, pk_field = self.date_field, self.pk_field
+        if direction == AFTER:
+            lookup, ordering = 'lt', (f'-{field}', f'-{pk_field}')
+        else:
+            lookup, ordering = 'gt', (field, pk_field)
+        condition = (
+            Q(**{f'{field}__{lookup}': date})
+            | Q(**{field: date, f'{pk_field}__{lookup}': pk})
+        )
+        return self.object_list.filter(condition).order_by(*ordering)
+
+    def first_page(self):
+        rows = list(
+            self.object_list.order_by(
+                f'-{self.date_field}', f'-{self.pk_field}'
+            )[:self.per_page + 1]
+        )
+        return CursorPage(
+            rows[:self.per_page], self, len(rows) > self.per_page, False
+        )
+
+    def page(self, cursor):
+        """Страница по курсору; InvalidCursor для испорченного курсора."""
+        if not cursor:
+            return self.first_page()
+        direction, date, pk = decode_cursor(cursor)
+        rows = list(self._seek(direction, date, pk)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == AFTER:
+            return CursorPage(rows, self, has_more, True)
+        if not rows:
+            return self.first_page()
+        rows.reverse()
+        return CursorPage(rows, self, True, has_more)
+
+    def get_page(self, cursor):
+        """Как page(), но испорченный курсор ведёт на первую страницу."""
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.first_page()
@@ -0,0 +1,330 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+from . import analysis
+from .models import Comment, Post
+from .utils import iter_chunks
+
+POST = 'post'
+COMMENT = 'comment'
+
+SEARCH_TABLE = 'posts_search'
+SNIPPET_TOKENS = 24
+
+TOKEN_RE = analysis.TOKEN_RE
+
+
+def highlight(text, terms, size=SNIPPET_TOKENS):
+    """Фрагмент text около первого найденного слова, в котором слова с
+    терминами из terms обёрнуты в <mark>."""
+    tokens = list(TOKEN_RE.finditer(text))
+    marked = [analysis.term(token.group()) in terms for token in tokens]
+    first = marked.index(True) if True in marked else 0
+    start_token = max(first - size // 4, 0)
+    window = tokens[start_token:start_token + size]
+    if not window:
+        return escape(text)
+    start, end = window[0].start(), window[-1].end()
+    parts = ['…' if start_token else '']
+    position = start
+    for token, is_marked in zip(window, marked[start_token:]):
+        parts.append(escape(text[position:token.start()]))
+        word = escape(token.group())
+        parts.append(f'<mark>{word}</mark>' if is_marked else word)
+        position = token.end()
+    parts.append('…' if end < len(text) else '')
+    return mark_safe(''.join(parts))
+
+
+class SearchHit:
+    """Найденный пост или комментарий."""
+
+    def __init__(self, kind, object_id, post_id, text, rank, terms=()):
+        self.kind = kind
+        self.object_id = object_id
+        self.post_id = post_id
+        self.text = text
+        self.rank = rank
+        self.terms = frozenset(terms)
+        self.post = None
+
+    def __repr__(self):
+        return f'<SearchHit {self.kind} {self.object_id}>'
+
+    @property
+    def is_comment(self):
+        return self.kind == COMMENT
+
+    @property
+    def highlighted(self):
+        """Фрагмент текста с найденными словами, обёрнутыми в <mark>."""
+        return highlight(self.text, self.terms)
+
+
+class SearchResults:
+    """Ленивый результат поиска, совместимый с Paginator.
+
+    count() и срезы выполняются запросами бэкенда; для каждой страницы
+    посты найденных записей подгружаются одним запросом.
+    """
+    ordered = True
+
+    def __init__(self, backend, query):
+        self.backend = backend
+        self.query = query
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.backend.count(self.query)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        stop = self.count() if key.stop is None else key.stop
+        if stop <= start:
+            return []
+        hits = self.backend.hits(self.query, start, stop - start)
+        posts = Post.objects.select_related('author', 'group').in_bulk(
+            {hit.post_id for hit in hits}
+        )
+        for hit in hits:
+            hit.post = posts.get(hit.post_id)
+        return [hit for hit in hits if hit.post is not None]
+
+
+class BaseSearchBackend:
+    """Интерфейс поискового индекса постов и комментариев."""
+
+    def index_post(self, post):
+        raise NotImplementedError
+
+    def index_comment(self, comment):
+        raise NotImplementedError
+
+    def remove(self, kind, object_id):
+        raise NotImplementedError
+
+    def index_many(self, kind, rows):
+        """Добавляет в индекс пачку строк (object_id, post_id, text)."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def count(self, query):
+        raise NotImplementedError
+
+    def hits(self, query, offset, limit):
+        raise NotImplementedError
+
+    def matching_ids(self, kind, query):
+        """id объектов вида kind, подходящих под запрос."""
+        raise NotImplementedError
+
+    def filter_queryset(self, kind, queryset, query):
+        """Оставляет в queryset только объекты, подходящие под запрос."""
+        return queryset.filter(pk__in=self.matching_ids(kind, query))
+
+    def search(self, query):
+        return SearchResults(self, query)
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Поиск по вхождению подстроки без отдельного индекса.
+
+    Работает на любой базе, но сводится к LIKE '%...%' по таблицам
+    постов и комментариев.
+    """
+
+    def index_post(self, post):
+        pass
+
+    def index_comment(self, comment):
+        pass
+
+    def remove(self, kind, object_id):
+        pass
+
+    def index_many(self, kind, rows):
+        pass
+
+    def clear(self):
+        pass
+
+    def _querysets(self, query):
+        terms = TOKEN_RE.findall(query)
+        posts = Post.objects.all()
+        comments = Comment.objects.all()
+        for term in terms:
+            posts = posts.filter(text__icontains=term)
+            comments = comments.filter(text__icontains=term)
+        if not terms:
+            return posts.none(), comments.none()
+        return posts, comments
+
+    def count(self, query):
+        posts, comments = self._querysets(query)
+        return posts.count() + comments.count()
+
+    def hits(self, query, offset, limit):
+        """Сначала посты, затем комментарии; LIMIT и OFFSET считает база,
+        число постов нужно, только если страница целиком из комментариев."""
+        posts, comments = self._querysets(query)
+        terms = analysis.analyze(query)
+        rows = [
+            SearchHit(POST, pk, pk, text, 0, terms)
+            for pk, text in posts.values_list('pk', 'text')[
+                offset:offset + limit
+            ]
+        ]
+        if len(rows) == limit:
+            return rows
+        skip = 0 if rows else max(offset - posts.count(), 0)
+        rows.extend(
+            SearchHit(COMMENT, pk, post_id, text, 0, terms)
+            for pk, post_id, text in comments.values_list(
+                'pk', 'post_id', 'text'
+            )[skip:skip + limit - len(rows)]
+        )
+        return rows
+
+    def matching_ids(self, kind, query):
+        posts, comments = self._querysets(query)
+        queryset = posts if kind == POST else comments
+        return list(queryset.values_list('pk', flat=True))
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    """Индекс SQLite FTS5 с ранжированием bm25 и подсветкой.
+
+    Таблица создаётся миграцией и обновляется сигналами сохранения и
+    удаления постов и комментариев. В индексируемую колонку terms
+    попадают термины из posts.analysis, исходный текст хранится рядом
+    для подсветки.
+    """
+
+    def _execute(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _replace(self, kind, object_id, post_id, text):
+        self.remove(kind, object_id)
+        self.index_many(kind, [(object_id, post_id, text)])
+
+    def index_many(self, kind, rows):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} '
+                f'(terms, text, kind, object_id, post_id) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                [
+                    (' '.join(analysis.analyze(text)), text, kind,
+                     object_id, post_id)
+                    for object_id, post_id, text in rows
+                ],
+            )
+
+    def index_post(self, post):
+        self._replace(POST, post.pk, post.pk, post.text)
+
+    def index_comment(self, comment):
+        self._replace(COMMENT, comment.pk, comment.post_id, comment.text)
+
+    def remove(self, kind, object_id):
+        self._execute(
+            f'DELETE FROM {SEARCH_TABLE} WHERE kind = %s AND object_id = %s',
+            (kind, object_id),
+        )
+
+    def clear(self):
+        self._execute(f'DELETE FROM {SEARCH_TABLE}')
+
+    def match_expression(self, query):
+        """Каждый термин запроса — отдельная фраза в кавычках, поэтому
+        синтаксис FTS5 из пользовательского ввода не интерпретируется."""
+        return ' '.join(f'"{term}"' for term in analysis.analyze(query))
+
+    def count(self, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return 0
+        return self._execute(
+            f'SELECT COUNT(*) FROM {SEARCH_TABLE} '
+            f'WHERE {SEARCH_TABLE} MATCH %s',
+            (expression,),
+        )[0][0]
+
+    def hits(self, query, offset, limit):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        rows = self._execute(
+            # скрытый столбец rank — тот же bm25(), но сортировку по нему
+            # FTS5 делает сам, без временного B-дерева
+            f'SELECT kind, object_id, post_id, text, rank '
+            f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+            f'ORDER BY rank LIMIT %s OFFSET %s',
+            (expression, limit, offset),
+        )
+        terms = analysis.analyze(query)
+        return [SearchHit(*row, terms=terms) for row in rows]
+
+    def matching_ids(self, kind, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        rows = self._execute(
+            f'SELECT object_id FROM {SEARCH_TABLE} '
+            f'WHERE {SEARCH_TABLE} MATCH %s AND kind = %s',
+            (expression, kind),
+        )
+        return [row[0] for row in rows]
+
+    def filter_queryset(self, kind, queryset, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return queryset.none()
+        table = queryset.model._meta.db_table
+        return queryset.extra(
+            where=[
+                f'{table}.id IN (SELECT object_id FROM {SEARCH_TABLE} '
+                f'WHERE {SEARCH_TABLE} MATCH %s AND kind = %s)'
+            ],
+            params=[expression, kind],
+        )
+
+
+def reindex(backend, chunk_size=1000):
+    """Перестраивает индекс; возвращает генератор пар (вид, число
+    проиндексированных записей в очередной пачке)."""
+    backend.clear()
+    sources = (
+        (POST, Post.objects.all(), ('pk', 'pk', 'text')),
+        (COMMENT, Comment.objects.all(), ('pk', 'post_id', 'text')),
+    )
+    for kind, queryset, fields in sources:
+        for rows in iter_chunks(queryset, fields, chunk_size):
+            backend.index_many(kind, rows)
+            yield kind, len(rows)
+
+
+@lru_cache(maxsize=None)
+def _load_backend(path):
+    return import_string(path)()
+
+
+def get_backend():
+    """Бэкенд поиска из настройки POSTS_SEARCH_BACKEND."""
+    return _load_backend(settings.POSTS_SEARCH_BACKEND)
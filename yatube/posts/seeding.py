@@ -0,0 +1,378 @@
+"""Синтетические данные для нагрузочных тестов и стендов.
+
+Строки создаются пачками по chunk_size: каждая пачка генерируется
+отдельно со своим зерном, выведенным из общего, и вставляется через
+bulk_create в одной транзакции. Поэтому набор данных не зависит от
+числа процессов-генераторов, а при одинаковых параметрах выходит
+одинаковым. Сигналы при bulk_create не срабатывают, так что счётчики
+AuthorStats и поисковый индекс в конце пересчитываются целиком.
+"""
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import lru_cache
+from itertools import accumulate
+
+import django
+from django.db import connection, transaction
+from django.utils import timezone
+from faker import Faker
+
+from . import search, threads
+from .models import Comment, Follow, Group, Post, User
+from .stats import rebuild_author_stats, rebuild_comment_counts
+
+# тексты берутся из заранее созданного набора: Faker на каждую строку
+# оказался бы медленнее самой вставки
+TEXT_POOL_SIZE = 1000
+
+# на время загрузки SQLite не ждёт записи на диск после каждой
+# транзакции и держит в памяти больше страниц; сбой посреди загрузки
+# может испортить базу, поэтому после загрузки прежние значения
+# возвращаются
+SQLITE_BULK_PRAGMAS = {
+    'synchronous': 'OFF',
+    'temp_store': 'MEMORY',
+    'cache_size': -256000,
+}
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """Отключает auto_now_add у полей, чтобы bulk_create сохранил
+    заданные даты."""
+    previous = [field.auto_now_add for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in zip(fields, previous):
+            field.auto_now_add = value
+
+
+@contextmanager
+def bulk_load_pragmas():
+    """Настраивает SQLite для массовой вставки. С другими базами и
+    внутри транзакции, где synchronous менять нельзя, ничего не
+    делает."""
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        yield
+        return
+    with connection.cursor() as cursor:
+        previous = {}
+        for name, value in SQLITE_BULK_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name}')
+            previous[name] = cursor.fetchone()[0]
+            cursor.execute(f'PRAGMA {name} = {value}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for name, value in previous.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@lru_cache(maxsize=None)
+def zipf_cum_weights(count, skew):
+    """Накопленные веса популярности count авторов по закону Ципфа."""
+    return list(accumulate(1 / (rank + 1) ** skew for rank in range(count)))
+
+
+@lru_cache(maxsize=None)
+def text_pool(seed):
+    faker = Faker('ru_RU')
+    faker.seed_instance(seed)
+    return [faker.paragraph(nb_sentences=3) for _ in range(TEXT_POOL_SIZE)]
+
+
+@lru_cache(maxsize=1)
+def name_faker():
+    return Faker('ru_RU')
+
+
+def chunk_random(seed, model, index):
+    return random.Random(f'{seed}:{model}:{index}')
+
+
+def random_date(rng, now, days):
+    return now - timedelta(seconds=rng.randrange(days * 24 * 3600))
+
+
+# Генераторы пачек. Они не обращаются к базе и выполняются в процессах
+# ProcessPoolExecutor, поэтому получают всё нужное аргументами.
+
+def user_rows(seed, index, numbers, prefix):
+    faker = name_faker()
+    faker.seed_instance(f'{seed}:user:{index}')
+    return [
+        (f'{prefix}{number}', faker.first_name(), faker.last_name())
+        for number in numbers
+    ]
+
+
+def group_rows(seed, index, numbers, prefix):
+    faker = name_faker()
+    faker.seed_instance(f'{seed}:group:{index}')
+    texts = text_pool(seed)
+    return [
+        (faker.catch_phrase()[:200], f'{prefix}{number}', texts[number % 100])
+        for number in numbers
+    ]
+
+
+def post_rows(seed, index, size, user_ids, group_ids, now, days, skew):
+    """Посты; у авторов по Ципфу разное число постов, у части постов
+    нет группы."""
+    rng = chunk_random(seed, 'post', index)
+    texts = text_pool(seed)
+    authors = rng.choices(
+        user_ids, cum_weights=zipf_cum_weights(len(user_ids), skew), k=size
+    )
+    return [
+        (
+            author_id,
+            rng.choice(group_ids)
+            if group_ids and rng.random() < 0.7 else None,
+            rng.choice(texts),
+            random_date(rng, now, days),
+        )
+        for author_id in authors
+    ]
+
+
+def comment_rows(seed, index, size, user_ids, post_ids, now, days):
+    rng = chunk_random(seed, 'comment', index)
+    texts = text_pool(seed)
+    return [
+        (
+            rng.choice(post_ids), rng.choice(user_ids), rng.choice(texts),
+            random_date(rng, now, days),
+        )
+        for _ in range(size)
+    ]
+
+
+def follow_rows(seed, index, readers, user_ids, skew):
+    """Подписки читателей readers: пары без повторов и без подписок на
+    себя. Пачки делят читателей между собой, поэтому пары разных пачек
+    тоже не совпадают, и проверять их в базе не нужно."""
+    rng = chunk_random(seed, 'follow', index)
+    cum_weights = zipf_cum_weights(len(user_ids), skew)
+    rows = []
+    for reader, count in readers:
+        authors = set()
+        while len(authors) < count:
+            authors.update(rng.choices(
+                user_ids, cum_weights=cum_weights, k=count - len(authors)
+            ))
+            authors.discard(reader)
+        rows.extend((reader, author) for author in authors)
+    return rows
+
+
+def split(total, size):
+    """Диапазоны номеров строк по пачкам не больше size."""
+    return [
+        range(start, min(start + size, total))
+        for start in range(0, total, size)
+    ]
+
+
+def spread(total, parts):
+    """Делит total на parts почти равных целых слагаемых."""
+    base, extra = divmod(total, parts)
+    return [base + (part < extra) for part in range(parts)]
+
+
+class DatasetBuilder:
+    """Создаёт пользователей, группы, посты, комментарии и подписки.
+
+    workers > 1 генерирует пачки в отдельных процессах; вставляет их
+    всегда текущий процесс, так как SQLite допускает одного писателя.
+    После build() в timings лежит время создания каждой модели.
+    """
+
+    def __init__(self, seed=42, chunk_size=10000, batch_size=None,
+                 workers=1, days=365, skew=1.1, index_search=True):
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.workers = workers
+        self.days = days
+        self.skew = skew
+        self.index_search = index_search
+        self.now = timezone.now()
+        self.timings = {}
+
+    def generate(self, function, tasks):
+        """Результаты function(seed, index, *task) по порядку задач."""
+        tasks = [(self.seed, index, *task) for index, task in enumerate(tasks)]
+        if self.workers <= 1:
+            yield from (function(*task) for task in tasks)
+            return
+        # django.setup нужен процессам, запущенным через spawn
+        with ProcessPoolExecutor(
+            self.workers, initializer=django.setup
+        ) as executor:
+            yield from executor.map(function, *zip(*tasks))
+
+    def insert(self, model, chunks, make, dates=()):
+        """Вставляет пачки объектов, каждую в своей транзакции."""
+        fields = [model._meta.get_field(name) for name in dates]
+        with explicit_dates(*fields):
+            for rows in chunks:
+                with transaction.atomic():
+                    model.objects.bulk_create(
+                        [make(*row) for row in rows],
+                        batch_size=self.batch_size,
+                    )
+
+    def new_ids(self, model, last_pk, **filters):
+        return list(
+            model.objects.filter(pk__gt=last_pk, **filters)
+            .order_by('pk').values_list('pk', flat=True)
+        )
+
+    def last_pk(self, model):
+        return model.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+
+    def numbered(self, model, field, prefix, count):
+        """Пачки номеров для новых строк; нумерация продолжает строки,
+        созданные прошлыми запусками с тем же зерном."""
+        first = model.objects.filter(
+            **{f'{field}__startswith': prefix}
+        ).count()
+        return [
+            (range(first + numbers.start, first + numbers.stop), prefix)
+            for numbers in split(count, self.chunk_size)
+        ]
+
+    def create_users(self, count):
+        last_pk = self.last_pk(User)
+        tasks = self.numbered(User, 'username', f'seed{self.seed}_', count)
+        self.insert(
+            User, self.generate(user_rows, tasks),
+            lambda username, first_name, last_name: User(
+                username=username, first_name=first_name,
+                last_name=last_name,
+            ),
+        )
+        return self.new_ids(User, last_pk)
+
+    def create_groups(self, count):
+        last_pk = self.last_pk(Group)
+        tasks = self.numbered(Group, 'slug', f'seed-{self.seed}-', count)
+        self.insert(
+            Group, self.generate(group_rows, tasks),
+            lambda title, slug, description: Group(
+                title=title, slug=slug, description=description
+            ),
+        )
+        return self.new_ids(Group, last_pk)
+
+    def create_posts(self, count, user_ids, group_ids):
+        if not user_ids:
+            return []
+        last_pk = self.last_pk(Post)
+        tasks = [
+            (len(numbers), user_ids, group_ids, self.now, self.days,
+             self.skew)
+            for numbers in split(count, self.chunk_size)
+        ]
+        self.insert(
+            Post, self.generate(post_rows, tasks),
+            lambda author_id, group_id, text, pub_date: Post(
+                author_id=author_id, group_id=group_id, text=text,
+                pub_date=pub_date,
+            ),
+            dates=('pub_date',),
+        )
+        return self.new_ids(Post, last_pk)
+
+    def create_comments(self, count, user_ids, post_ids):
+        if not post_ids:
+            return 0
+        tasks = [
+            (len(numbers), user_ids, post_ids, self.now, self.days)
+            for numbers in split(count, self.chunk_size)
+        ]
+        self.insert(
+            Comment, self.generate(comment_rows, tasks),
+            lambda post_id, author_id, text, created: Comment(
+                post_id=post_id, author_id=author_id, text=text,
+                created=created,
+            ),
+            dates=('created',),
+        )
+        threads.fill_root_paths()
+        return count
+
+    def create_follows(self, count, user_ids):
+        """Подписки, поровну распределённые между читателями; популярность
+        авторов распределена по Ципфу."""
+        count = min(count, len(user_ids) * (len(user_ids) - 1))
+        if not count:
+            return 0
+        readers = list(zip(user_ids, spread(count, len(user_ids))))
+        per_chunk = max(self.chunk_size * len(user_ids) // count, 1)
+        tasks = [
+            (readers[start:start + per_chunk], user_ids, self.skew)
+            for start in range(0, len(readers), per_chunk)
+        ]
+        before = Follow.objects.count()
+        # ignore_conflicts пропускает только подписки, оставшиеся от
+        # прошлых запусков: новые пары уникальны по построению
+        fields = ('user_id', 'author_id')
+        for rows in self.generate(follow_rows, tasks):
+            with transaction.atomic():
+                Follow.objects.bulk_create(
+                    [Follow(**dict(zip(fields, row))) for row in rows],
+                    batch_size=self.batch_size,
+                    ignore_conflicts=True,
+                )
+        return Follow.objects.count() - before
+
+    @contextmanager
+    def timed(self, name):
+        started = time.perf_counter()
+        yield
+        self.timings[name] = time.perf_counter() - started
+
+    def build(self, users, groups, posts, comments, follows):
+        """Создаёт весь набор; возвращает число строк по моделям."""
+        counts = {}
+        with bulk_load_pragmas():
+            with self.timed('users'):
+                user_ids = self.create_users(users)
+            with self.timed('groups'):
+                group_ids = self.create_groups(groups)
+            with self.timed('posts'):
+                post_ids = self.create_posts(posts, user_ids, group_ids)
+            with self.timed('comments'):
+                counts['comments'] = self.create_comments(
+                    comments, user_ids, post_ids
+                )
+            with self.timed('follows'):
+                counts['follows'] = self.create_follows(follows, user_ids)
+            with self.timed('author_stats'):
+                rebuild_author_stats(batch_size=self.batch_size or 500)
+            with self.timed('comment_counts'):
+                rebuild_comment_counts()
+            if self.index_search:
+                with self.timed('search_index'):
+                    for _ in search.reindex(
+                        search.get_backend(), self.chunk_size
+                    ):
+                        pass
+        counts.update(
+            users=len(user_ids), groups=len(group_ids), posts=len(post_ids)
+        )
+        return {
+            name: counts[name]
+            for name in ('users', 'groups', 'posts', 'comments', 'follows')
+        }
@@ -0,0 +1,257 @@
+from django.core.signals import request_started
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import cache as feed_cache
+from . import media, search, timeline
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+from .stats import shift_comments_count, shift_counter
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_state(sender, instance, **kwargs):
+    """Запоминаем прежние группу, автора и картинку поста, чтобы
+    обновить и их ленты и счётчики."""
+    instance._previous_group_id = None
+    instance._previous_author_id = None
+    instance._previous_image = ''
+    if not instance._state.adding and instance.pk:
+        previous = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group_id', 'author_id', 'image')
+            .first()
+        )
+        if previous:
+            (instance._previous_group_id,
+             instance._previous_author_id,
+             instance._previous_image) = previous
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def bump_post_feeds(sender, instance, **kwargs):
+    """Изменение поста делает устаревшими все ленты, где он выводится."""
+    with feed_cache.batch():
+        bump_post_versions(instance)
+
+
+def bump_post_versions(instance):
+    feed_cache.bump_version(feed_cache.INDEX)
+    feed_cache.bump_version(feed_cache.AUTHOR, instance.author_id)
+    feed_cache.bump_version(feed_cache.POST, instance.pk)
+    feed_cache.bump_versions(
+        feed_cache.GROUP,
+        filter(None, (
+            instance.group_id,
+            getattr(instance, '_previous_group_id', None),
+        )),
+    )
+    if timeline.is_pull_author(instance.author_id):
+        # Ленты подписчиков популярного автора дочитывают его посты при
+        # запросе; их версии зависят от версии ленты автора.
+        return
+    feed_cache.bump_versions(
+        feed_cache.FOLLOW,
+        Follow.objects.filter(author_id=instance.author_id).values_list(
+            'user_id', flat=True
+        ),
+    )
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_comment_feeds(sender, instance, **kwargs):
+    with feed_cache.batch():
+        feed_cache.bump_version(feed_cache.POST, instance.post_id)
+        feed_cache.bump_version(feed_cache.COMMENTS)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def bump_follow_feeds(sender, instance, **kwargs):
+    feed_cache.bump_version(feed_cache.FOLLOW, instance.user_id)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def bump_group_feeds(sender, instance, **kwargs):
+    """Название группы выводится в карточках постов на главной."""
+    feed_cache.bump_version(feed_cache.INDEX)
+    feed_cache.bump_version(feed_cache.GROUP, instance.pk)
+
+
+# поля автора, которые выводятся в карточках его постов
+AUTHOR_CARD_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def touch_posts(**filters):
+    """Обновляет Post.updated одним запросом, сбрасывая кеш карточек."""
+    Post.objects.filter(**filters).update(updated=timezone.now())
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def touch_group_posts(sender, instance, raw=False, **kwargs):
+    """Название и адрес группы выводятся в карточках её постов; при
+    удалении группы ссылка из карточек пропадает."""
+    if not raw:
+        touch_posts(group=instance)
+
+
+@receiver(pre_save, sender=User)
+def remember_author_name(sender, instance, update_fields=None, **kwargs):
+    instance._author_name_changed = False
+    if instance._state.adding or not instance.pk:
+        return
+    # при входе сохраняется только last_login
+    if update_fields and not set(update_fields) & set(AUTHOR_CARD_FIELDS):
+        return
+    previous = User.objects.filter(pk=instance.pk).values_list(
+        *AUTHOR_CARD_FIELDS
+    ).first()
+    current = tuple(getattr(instance, name) for name in AUTHOR_CARD_FIELDS)
+    instance._author_name_changed = previous != current
+
+
+@receiver(post_save, sender=User)
+def touch_author_posts(sender, instance, raw=False, **kwargs):
+    """Имя автора выводится в карточках его постов и во всех лентах с
+    ними."""
+    if raw or not getattr(instance, '_author_name_changed', False):
+        return
+    touch_posts(author=instance)
+    with feed_cache.batch():
+        bump_author_versions(instance)
+
+
+def bump_author_versions(instance):
+    feed_cache.bump_version(feed_cache.INDEX)
+    feed_cache.bump_version(feed_cache.AUTHOR, instance.pk)
+    feed_cache.bump_versions(
+        feed_cache.GROUP,
+        instance.posts.exclude(group=None).order_by()
+        .values_list('group_id', flat=True).distinct(),
+    )
+    feed_cache.bump_versions(
+        feed_cache.FOLLOW,
+        Follow.objects.filter(author=instance).values_list(
+            'user_id', flat=True
+        ),
+    )
+
+
+@receiver(post_save, sender=User)
+def create_author_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.get_or_create(author=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    if created:
+        shift_counter(instance.author_id, 'posts_count', 1)
+        return
+    previous_author_id = getattr(instance, '_previous_author_id', None)
+    if previous_author_id and previous_author_id != instance.author_id:
+        shift_counter(previous_author_id, 'posts_count', -1)
+        shift_counter(instance.author_id, 'posts_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    shift_counter(instance.author_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def count_image_references(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    image = instance.image.name or ''
+    previous_image = getattr(instance, '_previous_image', '') or ''
+    if image == previous_image:
+        return
+    if image:
+        media.retain(image)
+    if previous_image:
+        media.release(previous_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    if instance.image:
+        media.release(instance.image.name)
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, **kwargs):
+    if created:
+        shift_counter(instance.author_id, 'comments_count', 1)
+        shift_comments_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    shift_counter(instance.author_id, 'comments_count', -1)
+    shift_comments_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_saved_follow(sender, instance, created, **kwargs):
+    if created:
+        shift_counter(instance.author_id, 'followers_count', 1)
+        shift_counter(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    shift_counter(instance.author_id, 'followers_count', -1)
+    shift_counter(instance.user_id, 'following_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def purge_timeline(sender, instance, **kwargs):
+    timeline.purge(instance.user_id, instance.author_id)
+    # count_deleted_follow подключён раньше и уже уменьшил число
+    # подписчиков автора
+    timeline.push_back(instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.get_backend().index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.get_backend().remove(search.POST, instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.get_backend().index_comment(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, **kwargs):
+    search.get_backend().remove(search.COMMENT, instance.pk)
+
+
+@receiver(request_started)
+def sync_cache_tiers(sender, **kwargs):
+    feed_cache.sync_tiers()
@@ -0,0 +1,135 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import AuthorStats, Comment, Follow, Post, User
+
+COUNTER_FIELDS = (
+    'posts_count',
+    'comments_count',
+    'followers_count',
+    'following_count',
+)
+
+
+def shift_counter(user_id, field, delta):
+    """Атомарно изменяет счётчик пользователя на delta.
+
+    Если строки статистики ещё нет, при увеличении счётчика она
+    создаётся пересчётом; при уменьшении отсутствующая строка
+    означает, что пользователь удаляется, и менять нечего. Счётчик,
+    разошедшийся с данными (например, после bulk_create в обход
+    сигналов), не уходит ниже нуля.
+    """
+    updated = AuthorStats.objects.filter(author_id=user_id).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+    if not updated and delta > 0:
+        with transaction.atomic():
+            AuthorStats.objects.get_or_create(
+                author_id=user_id, defaults=count_for(user_id)
+            )
+
+
+def shift_comments_count(post_id, delta):
+    """Атомарно изменяет число комментариев поста на delta. Post.updated
+    не меняется: в карточке поста число комментариев не выводится."""
+    Post.objects.filter(pk=post_id).update(
+        comments_count=Greatest(F('comments_count') + delta, 0)
+    )
+
+
+def count_for(user_id):
+    """Точные значения счётчиков одного пользователя."""
+    return {
+        'posts_count': Post.objects.filter(author_id=user_id).count(),
+        'comments_count': Comment.objects.filter(author_id=user_id).count(),
+        'followers_count': Follow.objects.filter(author_id=user_id).count(),
+        'following_count': Follow.objects.filter(user_id=user_id).count(),
+    }
+
+
+def _grouped_counts(queryset, field):
+    return dict(
+        queryset.values(field).annotate(total=Count('pk')).values_list(
+            field, 'total'
+        )
+    )
+
+
+def collect_counts():
+    """Точные значения счётчиков всех пользователей, по одному
+    агрегирующему запросу на счётчик."""
+    totals = {
+        'posts_count': _grouped_counts(Post.objects.order_by(), 'author'),
+        'comments_count': _grouped_counts(
+            Comment.objects.order_by(), 'author'
+        ),
+        'followers_count': _grouped_counts(
+            Follow.objects.order_by(), 'author'
+        ),
+        'following_count': _grouped_counts(
+            Follow.objects.order_by(), 'user'
+        ),
+    }
+    return {
+        user_id: {
+            field: totals[field].get(user_id, 0) for field in COUNTER_FIELDS
+        }
+        for user_id in User.objects.values_list('pk', flat=True)
+    }
+
+
+@transaction.atomic
+def rebuild_author_stats(dry_run=False, batch_size=500):
+    """Сверяет счётчики с данными и исправляет расхождения.
+
+    Возвращает пару (создано строк, исправлено строк).
+    """
+    expected = collect_counts()
+    stored = {stats.author_id: stats for stats in AuthorStats.objects.all()}
+    missing = [
+        AuthorStats(author_id=user_id, **counts)
+        for user_id, counts in expected.items()
+        if user_id not in stored
+    ]
+    changed = []
+    for user_id, stats in stored.items():
+        counts = expected.get(user_id)
+        if counts is None:
+            continue
+        if any(getattr(stats, field) != counts[field]
+               for field in COUNTER_FIELDS):
+            for field, value in counts.items():
+                setattr(stats, field, value)
+            changed.append(stats)
+    if not dry_run:
+        AuthorStats.objects.bulk_create(missing, batch_size=batch_size)
+        AuthorStats.objects.bulk_update(
+            changed, COUNTER_FIELDS, batch_size=batch_size
+        )
+    return len(missing), len(changed)
+
+
+def actual_comments_count():
+    """Число комментариев поста OuterRef('pk') одним подзапросом."""
+    return Coalesce(Subquery(
+        Comment.objects.filter(post=OuterRef('pk')).order_by()
+        .values('post').annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+@transaction.atomic
+def rebuild_comment_counts(dry_run=False):
+    """Исправляет Post.comments_count, расходящиеся с комментариями.
+
+    Возвращает число постов с неверным счётчиком.
+    """
+    wrong = Post.objects.annotate(
+        actual=actual_comments_count()
+    ).exclude(comments_count=F('actual'))
+    if dry_run:
+        return wrong.count()
+    return Post.objects.filter(pk__in=list(
+        wrong.values_list('pk', flat=True)
+    )).update(comments_count=actual_comments_count())
@@ -0,0 +1,51 @@
+"""Хранилище картинок постов с адресацией по содержимому.
+
+Файл сохраняется под именем из SHA-256 его содержимого, поэтому
+повторная загрузка той же картинки не создаёт ни нового файла, ни
+новых миниатюр. Ссылки постов на файлы считает posts.media.
+"""
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+def content_digest(content):
+    hasher = hashlib.sha256()
+    for chunk in content.chunks():
+        hasher.update(chunk)
+    content.seek(0)
+    return hasher.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, где имя файла — хеш его содержимого."""
+
+    def digest_name(self, name, content):
+        """posts/ab/cd/abcd….jpg для файла name из каталога posts/."""
+        digest = content_digest(content)
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(
+            posixpath.dirname(name), digest[:2], digest[2:4],
+            digest + extension,
+        )
+
+    def get_available_name(self, name, max_length=None):
+        # настоящее имя выбирает _save по содержимому файла
+        return name
+
+    def _save(self, name, content):
+        name = self.digest_name(name, content)
+        if self.exists(name):
+            return name
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            # тот же файл только что записал параллельный запрос
+            return name
+
+
+post_image_storage = ContentAddressedStorage()
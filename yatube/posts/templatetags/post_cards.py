@@ -0,0 +1,37 @@
+from django import template
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from posts.cache import get_cache
+
+register = template.Library()
+
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+
+
+def card_key(post, is_group):
+    """Ключ карточки: post.updated меняется при правке поста, новых
+    миниатюрах и переименовании группы или автора."""
+    return (
+        f'card:{post.pk}:{post.updated.timestamp()}:'
+        f'{int(bool(is_group))}'
+    )
+
+
+@register.simple_tag
+def post_card(post, is_group=False):
+    """Общая для всех читателей часть карточки поста из кеша.
+
+    Ссылку «редактировать пост» шаблон выводит отдельно, поэтому кеш
+    не делится по пользователям.
+    """
+    cache = get_cache()
+    key = card_key(post, is_group)
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string(
+            CARD_TEMPLATE, {'post': post, 'is_group': is_group}
+        )
+        cache.set(key, html, settings.POST_CARD_CACHE_TIMEOUT)
+    return mark_safe(html)
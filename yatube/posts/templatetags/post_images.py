@@ -0,0 +1,50 @@
+from django import template
+from django.conf import settings
+from django.utils.html import format_html, format_html_join
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+def srcset(urls):
+    return ', '.join(f'{url} {width}w' for width, url in urls)
+
+
+def fallback_img(post, name, css_class):
+    """Оригинал картинки, пока её варианты не готовы; их создание
+    ставится в очередь, а не выполняется во время рендеринга."""
+    thumbnails.enqueue(post)
+    return format_html(
+        '<img class="{}" src="{}" width="{}" height="{}" '
+        'style="object-fit: cover" loading="lazy" alt="">',
+        css_class, post.image.url, *thumbnails.variant_sizes(name)[-1],
+    )
+
+
+@register.simple_tag
+def post_picture(post, name='card', css_class=''):
+    """Картинка поста в теге <picture>: по <source> со srcset на каждый
+    современный формат и <img> в запасном формате."""
+    if not post.image:
+        return ''
+    formats = post.thumbnail_urls.get(name)
+    if not isinstance(formats, dict) or not formats:
+        return fallback_img(post, name, css_class)
+    sizes = settings.POST_THUMBNAILS[name].get('sizes', '100vw')
+    *sources, (fallback, urls) = formats.items()
+    width, url = urls[-1]
+    height = thumbnails.variant_sizes(name)[-1][1]
+    return format_html(
+        '<picture>{}<img class="{}" src="{}" srcset="{}" sizes="{}" '
+        'width="{}" height="{}" loading="lazy" alt=""></picture>',
+        format_html_join(
+            '',
+            '<source type="{}" srcset="{}" sizes="{}">',
+            (
+                (thumbnails.FORMATS[image_format][1], srcset(urls), sizes)
+                for image_format, urls in sources
+            ),
+        ),
+        css_class, url, srcset(urls), sizes, width, height,
+    )
@@ -0,0 +1,35 @@
+from django.test import SimpleTestCase
+
+from posts.analysis import analyze, stem
+
+
+class RussianStemmerTest(SimpleTestCase):
+    def test_stem(self):
+        """Стеммер сводит формы слова к общей основе."""
+        words = {
+            'горы': 'гор',
+            'горах': 'гор',
+            'ходили': 'ход',
+            'красивая': 'красив',
+            'книги': 'книг',
+            'программирование': 'программирован',
+            'важнейший': 'важн',
+            'быстрее': 'быстр',
+            'прочитавший': 'прочита',
+            'следующая': 'след',
+            'организующий': 'организ',
+            'убивший': 'уб',
+            'обнаруживший': 'обнаруж',
+            'ходившая': 'ход',
+            'python': 'python',
+        }
+        for word, expected in words.items():
+            with self.subTest(word=word):
+                self.assertEqual(stem(word), expected)
+
+    def test_analyze(self):
+        """Анализ приводит регистр, заменяет «ё» и убирает стоп-слова."""
+        self.assertEqual(
+            analyze('Сегодня мы ходили в Горы, а ёлки стоят'),
+            ['сегодн', 'ход', 'гор', 'елк', 'сто'],
+        )
@@ -0,0 +1,191 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+
+
+@override_settings(POSTS_PER_PAGE=2, COMMENTS_PER_PAGE=2)
+class FeedApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, group=cls.group, text=f'Пост {number}'
+            )
+            for number in range(5)
+        ]
+        cls.post = cls.posts[-1]
+        cls.comment = Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий'
+        )
+        Comment.objects.create(
+            post=cls.post, author=cls.author, text='Ответ',
+            parent=cls.comment,
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def collect(self, address, **params):
+        """Все страницы ленты по ссылкам next."""
+        results = []
+        while address:
+            response = self.client.get(address, params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            results.extend(data['results'])
+            address, params = data['next'], {}
+        return results
+
+    def test_index_paginated_by_cursor(self):
+        results = self.collect(reverse('api:index'))
+        self.assertEqual(
+            [item['text'] for item in results],
+            [post.text for post in reversed(self.posts)],
+        )
+        pub_date = results[0].pop('pub_date')
+        self.assertTrue(pub_date.startswith(
+            self.post.pub_date.strftime('%Y-%m-%dT%H:%M:%S')
+        ))
+        self.assertEqual(results[0], {
+            'id': self.post.pk,
+            'text': self.post.text,
+            'author': 'author',
+            'group': 'group',
+            'image': None,
+            'comments_count': 2,
+        })
+
+    def test_sparse_fields_skip_joins(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse('api:index'), {'fields': 'id,text'}
+            )
+        self.assertEqual(
+            list(response.json()['results'][0]), ['id', 'text']
+        )
+        sql = context.captured_queries[-1]['sql']
+        self.assertNotIn('JOIN', sql)
+        self.assertIn('?fields=id%2Ctext&cursor=', response.json()['next'])
+
+    def test_unknown_field(self):
+        response = self.client.get(reverse('api:index'), {'fields': 'id,x'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'detail': 'Неизвестные поля: x'})
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('api:index'), {'cursor': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_etag(self):
+        response = self.client.get(reverse('api:index'))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        etag = response['ETag']
+        response = self.client.get(
+            reverse('api:index'), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(author=self.author, text='Новый пост')
+        response = self.client.get(
+            reverse('api:index'), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['text'], 'Новый пост')
+
+    def test_comment_changes_feed_etags(self):
+        """Новый комментарий меняет comments_count в лентах API, а
+        значит, и их ETag."""
+        self.client.force_login(self.reader)
+        addresses = (
+            reverse('api:index'),
+            reverse('api:group_list', kwargs={'slug': 'group'}),
+            reverse('api:profile', kwargs={'username': 'author'}),
+            reverse('api:follow_index'),
+        )
+        etags = [self.client.get(address)['ETag'] for address in addresses]
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Ещё комментарий'
+        )
+        for address, etag in zip(addresses, etags):
+            with self.subTest(address=address):
+                response = self.client.get(
+                    address, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    response.json()['results'][0]['comments_count'], 3
+                )
+
+    def test_group_and_profile(self):
+        for address in (
+            reverse('api:group_list', kwargs={'slug': 'group'}),
+            reverse('api:profile', kwargs={'username': 'author'}),
+        ):
+            with self.subTest(address=address):
+                self.assertEqual(len(self.collect(address)), 5)
+        for address in (
+            reverse('api:group_list', kwargs={'slug': 'missing'}),
+            reverse('api:profile', kwargs={'username': 'missing'}),
+            reverse('api:post_detail', kwargs={'post_id': 0}),
+            reverse('api:post_comments', kwargs={'post_id': 0}),
+        ):
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                self.assertEqual(response.status_code, 404)
+                self.assertIn('detail', response.json())
+
+    def test_follow_index(self):
+        address = reverse('api:follow_index')
+        self.assertEqual(self.client.get(address).status_code, 401)
+        self.client.force_login(self.reader)
+        results = self.collect(address, fields='id')
+        self.assertEqual(
+            [item['id'] for item in results],
+            [post.pk for post in reversed(self.posts)],
+        )
+
+    @override_settings(FEED_PULL_FOLLOWERS_THRESHOLD=1)
+    def test_follow_index_merged(self):
+        """Посты популярного автора дочитываются и сливаются с
+        материализованной лентой по строкам values()."""
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.reader, author=other)
+        own = Post.objects.create(author=other, text='Пост другого')
+        self.client.force_login(self.reader)
+        results = self.collect(reverse('api:follow_index'), fields='id')
+        self.assertEqual(
+            [item['id'] for item in results],
+            [own.pk] + [post.pk for post in reversed(self.posts)],
+        )
+
+    def test_post_detail(self):
+        response = self.client.get(
+            reverse('api:post_detail', kwargs={'post_id': self.post.pk}),
+            {'fields': 'text,author'},
+        )
+        self.assertEqual(
+            response.json(), {'text': self.post.text, 'author': 'author'}
+        )
+
+    def test_post_comments(self):
+        results = self.collect(
+            reverse('api:post_comments', kwargs={'post_id': self.post.pk}),
+            fields='text,parent,depth',
+        )
+        self.assertEqual(results, [
+            {'text': 'Ответ', 'parent': self.comment.pk, 'depth': 1},
+            {'text': 'Комментарий', 'parent': None, 'depth': 0},
+        ])
+
+    def test_queries(self):
+        with self.assertNumQueries(1):
+            self.client.get(reverse('api:index'))
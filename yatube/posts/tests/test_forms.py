@@ -1,5 +1,8 @@
+import hashlib
 import shutil
 import tempfile
+from concurrent.futures import Future
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -7,6 +10,7 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
+from posts import thumbnails
 from posts.forms import CommentForm
 from posts.models import Group, Post
 
@@ -93,6 +97,9 @@ class PostFormsImageTest(TestCase):
             b'\x02\x00\x01\x00\x00\x02\x02\x0C'
             b'\x0A\x00\x3B'
         )
+        # картинка хранится под именем из хеша содержимого
+        digest = hashlib.sha256(cls.small_gif).hexdigest()
+        cls.image_name = f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif'
         cls.uploaded = SimpleUploadedFile(
             name='small.gif',
             content=cls.small_gif,
@@ -118,12 +125,12 @@ class PostFormsImageTest(TestCase):
         """В контексте главной страницы передается изображение."""
         response = self.authorized_client.get(reverse('posts:index'))
         first_object = response.context['page_obj'][0]
-        self.assertIn('small', f'{first_object.image}')
+        self.assertEqual(f'{first_object.image}', self.image_name)
         self.assertTrue(
             Post.objects.filter(
                 author=self.user,
                 text='Any text',
-                image='posts/small.gif'
+                image=self.image_name
             ).exists()
         )
 
@@ -134,7 +141,7 @@ class PostFormsImageTest(TestCase):
         )
         first_object = response.context['page_obj'][0]
         self.assertTrue(
-            first_object.image == 'posts/small.gif',
+            first_object.image == self.image_name,
             'Изображение в записи отсутствует!'
         )
 
@@ -151,7 +158,7 @@ class PostFormsImageTest(TestCase):
             reverse('posts:post_detail', kwargs={'post_id': self.post.id})
         )
         self.assertEqual(
-            response.context.get('post').image.name, 'posts/small.gif'
+            response.context.get('post').image.name, self.image_name
         )
 
     def test_new_post_creates_if_form_with_image_is_valid(self):
@@ -178,6 +185,109 @@ class PostFormsImageTest(TestCase):
         self.assertIsNotNone(last_post.image, 'Изображение отсутствует!')
 
 
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_THUMBNAILS_ASYNC=False)
+class PostThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+        cls.small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_thumbnails_generated_on_create(self):
+        """Миниатюры создаются при сохранении поста с картинкой,
+        и страница поста использует готовый URL."""
+        uploaded = SimpleUploadedFile(
+            name='thumb.gif',
+            content=self.small_gif,
+            content_type='image/gif'
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            {'text': 'Пост с картинкой', 'image': uploaded},
+        )
+        post = Post.objects.get(text='Пост с картинкой')
+        card = post.thumbnail_urls.get('card')
+        self.assertTrue(card, 'Миниатюры не созданы!')
+        self.assertEqual(list(card), thumbnails.image_formats())
+        widths = [width for width, _ in thumbnails.variant_sizes('card')]
+        for image_format, urls in card.items():
+            with self.subTest(image_format=image_format):
+                self.assertEqual([width for width, _ in urls], widths)
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.id})
+        )
+        self.assertContains(response, '<picture>')
+        self.assertContains(response, f'src="{card["jpeg"][-1][1]}"')
+        self.assertContains(response, f'{card["jpeg"][0][1]} {widths[0]}w')
+        if 'webp' in card:
+            self.assertContains(response, 'type="image/webp"')
+
+    @override_settings(POST_THUMBNAILS_ASYNC=True)
+    def test_picture_falls_back_without_thumbnails(self):
+        """Пока варианты не созданы, выводится оригинал в <img>, а
+        миниатюры ставятся в очередь, а не создаются при рендеринге."""
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост без миниатюр',
+            image=SimpleUploadedFile(
+                name='plain.gif',
+                content=self.small_gif,
+                content_type='image/gif'
+            ),
+        )
+        with mock.patch.object(thumbnails, 'thumbnail') as thumbnail, \
+                mock.patch.object(thumbnails, '_submit') as submit, \
+                mock.patch.object(thumbnails.transaction, 'on_commit',
+                                  side_effect=lambda func: func()):
+            response = self.authorized_client.get(
+                reverse('posts:post_detail', kwargs={'post_id': post.id})
+            )
+        self.assertNotContains(response, '<picture>')
+        self.assertContains(
+            response, f'<img class="card-img my-2" src="{post.image.url}"'
+        )
+        thumbnail.assert_not_called()
+        submit.assert_called_with(post.pk, post.image.name)
+
+    def test_thumbnails_queued_once(self):
+        """Пока задача картинки не завершилась, вторая не ставится."""
+        future = Future()
+        executor = mock.Mock(**{'submit.return_value': future})
+        with mock.patch.object(thumbnails, 'get_executor',
+                               return_value=executor):
+            thumbnails._submit(1, 'posts/a.gif')
+            thumbnails._submit(1, 'posts/a.gif')
+            self.assertEqual(executor.submit.call_count, 1)
+            future.set_result(None)
+            thumbnails.drain()
+            thumbnails._submit(1, 'posts/a.gif')
+        self.assertEqual(executor.submit.call_count, 2)
+
+    def test_thumbnails_cleared_with_image(self):
+        """Без картинки у поста нет миниатюр."""
+        self.authorized_client.post(
+            reverse('posts:post_create'), {'text': 'Пост без картинки'}
+        )
+        post = Post.objects.get(text='Пост без картинки')
+        self.assertEqual(post.thumbnail_urls, {})
+
+
 class CommentFormsTest(TestCase):
     @classmethod
     def setUpClass(cls) -> None:
@@ -210,7 +320,7 @@ class CommentFormsTest(TestCase):
             reverse('posts:post_detail', kwargs={'post_id': self.post.id})
         )
         form = response.context['form']
-        self.assertTrue(response.context['comments'].exists())
+        self.assertTrue(response.context['comments'])
         self.assertIsInstance(form, CommentForm)
         self.assertContains(response, 'Добавить комментарий:')
         self.assertContains(response, 'Test comment')
@@ -226,6 +336,6 @@ class CommentFormsTest(TestCase):
         response = self.guest_client.get(
             reverse('posts:post_detail', kwargs={'post_id': self.post.id})
         )
-        self.assertFalse(response.context['comments'].exists())
+        self.assertFalse(response.context['comments'])
         self.assertNotContains(response, 'Добавить комментарий:')
         self.assertNotContains(response, 'Test comment')
@@ -0,0 +1,141 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+
+from posts import media
+from posts.models import Post, StoredImage
+from posts.storage import post_image_storage
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+OTHER_GIF = SMALL_GIF.replace(b'\xFF\xFF\xFF', b'\x00\xFF\x00')
+
+
+def references(name):
+    return StoredImage.objects.get(name=name).references
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_THUMBNAILS_ASYNC=False)
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def create(self, text, content, name='small.gif'):
+        self.authorized_client.post(reverse('posts:post_create'), {
+            'text': text,
+            'image': SimpleUploadedFile(name, content, 'image/gif'),
+        })
+        return Post.objects.get(text=text)
+
+    def test_same_upload_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом с двумя ссылками."""
+        first = self.create('Первый пост', SMALL_GIF, 'one.gif')
+        second = self.create('Второй пост', SMALL_GIF, 'two.gif')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(post_image_storage.exists(first.image.name))
+        self.assertEqual(len(list(media.stored_files('posts'))), 1)
+        self.assertEqual(references(first.image.name), 2)
+
+    def test_replaced_image_collected(self):
+        """Картинка без ссылок удаляется вместе с записью о ней."""
+        post = self.create('Пост', SMALL_GIF)
+        old_name = post.image.name
+        post.image.save('other.gif', ContentFile(OTHER_GIF))
+        self.assertEqual(references(old_name), 0)
+        self.assertEqual(references(post.image.name), 1)
+        self.assertTrue(media.collect(old_name))
+        self.assertFalse(post_image_storage.exists(old_name))
+        self.assertFalse(StoredImage.objects.filter(name=old_name).exists())
+
+    def test_shared_image_kept_after_delete(self):
+        """Файл, на который ещё ссылается пост, не удаляется."""
+        first = self.create('Первый пост', SMALL_GIF)
+        self.create('Второй пост', SMALL_GIF)
+        name = first.image.name
+        first.delete()
+        self.assertEqual(references(name), 1)
+        self.assertFalse(media.collect(name))
+        self.assertTrue(post_image_storage.exists(name))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class DedupeImagesCommandTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='NoName')
+        # файлы, загруженные до хранилища с адресацией по содержимому
+        legacy_storage = FileSystemStorage()
+        for name in ('a.gif', 'b.gif'):
+            legacy_storage.save(f'posts/{name}', ContentFile(SMALL_GIF))
+            Post.objects.create(
+                author=self.user, text=name, image=f'posts/{name}'
+            )
+        legacy_storage.save('posts/orphan.gif', ContentFile(OTHER_GIF))
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def dedupe(self, *args):
+        out = StringIO()
+        call_command('dedupe_images', '--orphan-age=0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_report_only(self):
+        report = self.dedupe()
+        self.assertIn('Лишних копий: 1', report)
+        self.assertIn('Файлов без постов: 1', report)
+        self.assertEqual(len(list(media.stored_files('posts'))), 3)
+
+    def test_reclaim(self):
+        """Посты переводятся на один файл, копии и файлы без постов
+        удаляются."""
+        self.dedupe('--reclaim')
+        name = post_image_storage.digest_name(
+            'posts/a.gif', ContentFile(SMALL_GIF)
+        )
+        self.assertEqual(
+            set(Post.objects.values_list('image', flat=True)), {name}
+        )
+        self.assertEqual(list(media.stored_files('posts')), [name])
+        self.assertEqual(references(name), 2)
+        self.assertEqual(StoredImage.objects.count(), 1)
+
+    def test_reclaim_touches_posts(self):
+        """Переведённые на другой файл посты получают новое updated, и
+        кеш их карточек сбрасывается."""
+        before = dict(Post.objects.values_list('pk', 'updated'))
+        self.dedupe('--reclaim')
+        for pk, updated in Post.objects.values_list('pk', 'updated'):
+            with self.subTest(pk=pk):
+                self.assertGreater(updated, before[pk])
@@ -1,7 +1,10 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
-from ..models import Group, Post
+from ..models import AuthorStats, Comment, Follow, Group, Post
 
 User = get_user_model()
 
@@ -65,3 +68,72 @@ class GroupModelTest(TestCase):
         group = GroupModelTest.group
         self.assertEqual(
             group._meta.get_field('slug').help_text, 'адрес')
+
+
+class AuthorStatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def assertStats(self, user, **expected):
+        stats = AuthorStats.objects.get(author=user)
+        for field, value in expected.items():
+            with self.subTest(user=user.username, field=field):
+                self.assertEqual(getattr(stats, field), value)
+
+    def test_counters_follow_create_and_delete(self):
+        """Счётчики меняются при создании и удалении постов, комментариев
+        и подписок."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий'
+        )
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertStats(self.author, posts_count=1, followers_count=1)
+        self.assertStats(self.reader, comments_count=1, following_count=1)
+        comment.delete()
+        follow.delete()
+        post.delete()
+        self.assertStats(self.author, posts_count=0, followers_count=0)
+        self.assertStats(self.reader, comments_count=0, following_count=0)
+
+    def test_bulk_delete_updates_counters(self):
+        """Удаление постов через QuerySet, в том числе с каскадом на
+        комментарии, уменьшает счётчики."""
+        for i in range(3):
+            post = Post.objects.create(author=self.author, text=f'Пост {i}')
+            Comment.objects.create(
+                post=post, author=self.reader, text='Комментарий'
+            )
+        Post.objects.filter(author=self.author).delete()
+        self.assertStats(self.author, posts_count=0)
+        self.assertStats(self.reader, comments_count=0)
+
+    def test_drifted_counter_not_negative(self):
+        """Удаление при уже нулевом счётчике оставляет его нулём, а не
+        нарушает CHECK положительного поля."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий'
+        )
+        AuthorStats.objects.filter(author=self.author).update(posts_count=0)
+        AuthorStats.objects.filter(author=self.reader).update(
+            comments_count=0
+        )
+        Post.objects.filter(pk=post.pk).update(comments_count=0)
+        comment.delete()
+        post.delete()
+        self.assertStats(self.author, posts_count=0)
+        self.assertStats(self.reader, comments_count=0)
+
+    def test_rebuild_command_reconciles_counters(self):
+        """Команда rebuild_author_stats восстанавливает счётчики."""
+        Post.objects.bulk_create(
+            [Post(author=self.author, text=f'Пост {i}') for i in range(4)]
+        )
+        AuthorStats.objects.filter(author=self.reader).delete()
+        call_command('rebuild_author_stats', stdout=StringIO())
+        self.assertStats(self.author, posts_count=4)
+        self.assertStats(self.reader, posts_count=0, comments_count=0)
@@ -0,0 +1,116 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+from posts.paginator import AFTER, encode_cursor
+
+
+class FeedQueryPlanTest(TestCase):
+    """Запросы лент выполняются по индексам: без полного просмотра
+    таблиц и без сортировки во временном B-дереве."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост'
+        )
+        cls.comment = Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий'
+        )
+        Comment.objects.create(
+            post=cls.post, author=cls.author, text='Ответ',
+            parent=cls.comment,
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assert_indexed(self, address):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(address)
+        selects = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('SELECT')
+        ]
+        self.assertTrue(selects)
+        for sql in selects:
+            for step in self.plan(sql):
+                with self.subTest(address=address, sql=sql, step=step):
+                    self.assertNotIn('TEMP B-TREE', step)
+                    # SCAN subquery читает строки подзапроса, а не таблицу
+                    if step.startswith('SCAN') and step != 'SCAN subquery':
+                        self.assertIn('INDEX', step)
+
+    def test_index(self):
+        self.assert_indexed(reverse('posts:index'))
+
+    def test_group_list(self):
+        self.assert_indexed(
+            reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        )
+
+    def test_profile(self):
+        self.assert_indexed(
+            reverse('posts:profile', kwargs={'username': 'author'})
+        )
+
+    def test_post_detail(self):
+        self.assert_indexed(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+
+    def test_post_comments(self):
+        first = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        cursor = first.context['comments'].paginator.cursor_for(
+            AFTER, first.context['comments'][0]
+        )
+        self.assert_indexed(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+            + f'?cursor={cursor}'
+        )
+
+    def test_comment_replies(self):
+        self.assert_indexed(reverse('posts:comment_replies', kwargs={
+            'post_id': self.post.pk, 'comment_id': self.comment.pk,
+        }))
+
+    def test_follow_index(self):
+        # материализованная лента построена при подписке
+        self.assert_indexed(reverse('posts:follow_index'))
+
+    def test_follow_index_cursor(self):
+        cursor = encode_cursor(AFTER, self.post.pub_date, self.post.pk)
+        for address in (
+            reverse('posts:follow_index'),
+            reverse('api:follow_index'),
+        ):
+            self.assert_indexed(f'{address}?cursor={cursor}')
+
+    def test_search(self):
+        self.assert_indexed(reverse('posts:search') + '?q=Пост')
+
+    def test_api_feeds(self):
+        for address in (
+            reverse('api:index'),
+            reverse('api:group_list', kwargs={'slug': self.group.slug}),
+            reverse('api:profile', kwargs={'username': 'author'}),
+            reverse('api:follow_index'),
+            reverse('api:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('api:post_comments', kwargs={'post_id': self.post.pk}),
+        ):
+            self.assert_indexed(address)
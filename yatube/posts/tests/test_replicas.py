@@ -0,0 +1,100 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from core.routers import PrimaryReplicaRouter, route_reads
+from posts.models import Post, User
+
+REPLICA = 'replica'
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], REPLICA_STICKY_SECONDS=5)
+class ReplicaRoutingTest(TransactionTestCase):
+    """Реплика — второй файл SQLite, который догоняет основную базу
+    только при вызове replicate(); так моделируется отставание."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        connections.databases[REPLICA] = {
+            **connections[DEFAULT_DB_ALIAS].settings_dict,
+            'NAME': os.path.join(directory, 'replica.sqlite3'),
+        }
+        self.addCleanup(self.remove_replica)
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        Post.objects.create(author=self.author, text='Старый пост')
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.replicate()
+
+    def remove_replica(self):
+        connections[REPLICA].close()
+        delattr(connections._connections, REPLICA)
+        del connections.databases[REPLICA]
+
+    def replicate(self):
+        """Копирует основную базу в реплику."""
+        primary = connections[DEFAULT_DB_ALIAS]
+        primary.ensure_connection()
+        target = sqlite3.connect(connections.databases[REPLICA]['NAME'])
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
+
+    def test_reads_outside_requests_use_primary(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Post), DEFAULT_DB_ALIAS)
+        with route_reads():
+            self.assertEqual(router.db_for_read(Post), REPLICA)
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Post), DEFAULT_DB_ALIAS)
+            router.db_for_write(Post)
+            self.assertEqual(router.db_for_read(Post), DEFAULT_DB_ALIAS)
+
+    def test_feed_read_from_replica(self):
+        """Гость читает ленту из отстающей реплики; такая страница не
+        кешируется и не получает валидаторов, и когда реплика догоняет
+        основную базу, гость видит новый пост."""
+        Post.objects.create(author=self.author, text='Новый пост')
+        for url in (reverse('posts:index'), reverse('api:index')):
+            with self.subTest(url=url):
+                response = Client().get(url)
+                self.assertContains(response, 'Старый пост')
+                self.assertNotContains(response, 'Новый пост')
+                self.assertNotIn('ETag', response)
+                self.assertNotIn('Last-Modified', response)
+        self.replicate()
+        for url in (reverse('posts:index'), reverse('api:index')):
+            with self.subTest(url=url):
+                self.assertContains(Client().get(url), 'Новый пост')
+
+    def test_settled_feed_cached(self):
+        """Когда окно отставания прошло, страница из реплики снова
+        кешируется и получает валидаторы."""
+        with mock.patch('time.time', return_value=time.time() + 6):
+            response = Client().get(reverse('posts:index'))
+        self.assertIn('ETag', response)
+
+    def test_author_reads_own_write(self):
+        """После записи автор видит свой пост, хотя реплика отстаёт;
+        когда окно истекает, его чтения снова идут в реплику."""
+        response = self.author_client.post(
+            reverse('posts:post_create'), {'text': 'Новый пост'}
+        )
+        self.assertIn('primary_until', response.cookies)
+        profile = reverse('posts:profile', kwargs={'username': 'author'})
+        self.assertContains(self.author_client.get(profile), 'Новый пост')
+        self.assertNotContains(Client().get(profile), 'Новый пост')
+        with mock.patch('time.time', return_value=time.time() + 6):
+            response = self.author_client.get(profile)
+        self.assertNotContains(response, 'Новый пост')
@@ -0,0 +1,93 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase
+
+from posts.models import AuthorStats, Comment, Follow, Group, Post, User
+from posts.seeding import DatasetBuilder
+
+
+class DatasetBuilderTest(TestCase):
+    def build(self, seed=7):
+        return DatasetBuilder(seed=seed, chunk_size=40).build(
+            users=30, groups=3, posts=200, comments=100, follows=150
+        )
+
+    def test_counts(self):
+        counts = self.build()
+        self.assertEqual(counts, {
+            'users': 30, 'groups': 3, 'posts': 200,
+            'comments': 100, 'follows': 150,
+        })
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 100)
+        self.assertEqual(Follow.objects.count(), 150)
+        self.assertEqual(AuthorStats.objects.count(), 30)
+
+    def test_dates_spread(self):
+        """Даты постов заданы генератором, а не моментом вставки."""
+        self.build()
+        dates = Post.objects.values_list('pub_date', flat=True)
+        self.assertGreater(len(set(date.date() for date in dates)), 50)
+
+    def test_no_self_follow(self):
+        self.build()
+        self.assertFalse(Follow.objects.filter(
+            user_id=F('author_id')
+        ).exists())
+
+    def test_reproducible(self):
+        """Одно зерно — одни и те же тексты и авторы."""
+        self.build()
+        first = list(Post.objects.order_by('pk').values_list(
+            'text', 'author__first_name'
+        ))
+        Post.objects.all().delete()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        self.build()
+        second = list(Post.objects.order_by('pk').values_list(
+            'text', 'author__first_name'
+        ))
+        self.assertEqual(first, second)
+
+    def test_same_data_with_workers(self):
+        """Данные не зависят от числа процессов-генераторов."""
+        self.assertEqual(self.sample(workers=2), self.sample(workers=1))
+
+    def sample(self, workers):
+        """Посты и подписки с авторами, заданными номером пользователя."""
+        Post.objects.all().delete()
+        User.objects.all().delete()
+        builder = DatasetBuilder(seed=3, chunk_size=25, workers=workers)
+        user_ids = builder.create_users(30)
+        builder.create_posts(100, user_ids, [])
+        builder.create_follows(100, user_ids)
+        number = {pk: index for index, pk in enumerate(user_ids)}
+        posts = [
+            (number[author], text) for author, text in
+            Post.objects.order_by('pk').values_list('author', 'text')
+        ]
+        follows = {
+            (number[user], number[author]) for user, author in
+            Follow.objects.values_list('user', 'author')
+        }
+        return posts, follows
+
+
+class SeedCommandTest(TestCase):
+    def test_rates_printed(self):
+        out = StringIO()
+        call_command(
+            'seed_yatube', users=10, groups=2, posts=30, comments=20,
+            follows=15, chunk_size=7, stdout=out,
+        )
+        report = out.getvalue()
+        for model in ('users', 'groups', 'posts', 'comments', 'follows'):
+            self.assertIn(model, report)
+        self.assertIn('строк/с', report)
+        self.assertEqual(Follow.objects.count(), 15)
+        self.assertEqual(Post.objects.count(), 30)
@@ -0,0 +1,69 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import TransactionTestCase
+
+from core.db import check_connections
+
+DATABASE = 'pragmas'
+
+
+class SQLiteProfileTest(TransactionTestCase):
+    """Новое соединение с базой в файле получает SQLITE_PRAGMAS.
+
+    База теста — отдельный файл под алиасом DATABASE, который
+    добавляется в setUp; основная база объявлена, чтобы тесту был
+    разрешён доступ к базам и под pytest-django.
+    """
+
+    databases = {DEFAULT_DB_ALIAS}
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        connections.databases[DATABASE] = {
+            **connections[DEFAULT_DB_ALIAS].settings_dict,
+            'NAME': os.path.join(directory, 'db.sqlite3'),
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        }
+        self.addCleanup(self.remove_database)
+        self.connection = connections[DATABASE]
+
+    def remove_database(self):
+        self.connection.close()
+        delattr(connections._connections, DATABASE)
+        del connections.databases[DATABASE]
+
+    def pragma(self, name):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        # synchronous=NORMAL
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+
+    def test_immediate_transactions(self):
+        """atomic() сразу берёт блокировку записи: второе соединение не
+        может начать запись."""
+        other = connections.databases[DATABASE]['NAME']
+        with self.connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE counter (value integer)')
+        with transaction.atomic(using=DATABASE):
+            blocked = sqlite3.connect(other, timeout=0)
+            with self.assertRaises(sqlite3.OperationalError):
+                blocked.execute('BEGIN IMMEDIATE')
+            blocked.close()
+
+    def test_broken_connection_closed(self):
+        """Неработающее постоянное соединение закрывается перед запросом."""
+        self.connection.ensure_connection()
+        self.connection.connection.close()
+        check_connections(sender=None)
+        self.assertIsNone(self.connection.connection)
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
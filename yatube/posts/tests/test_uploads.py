@@ -0,0 +1,153 @@
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts import uploads
+from posts.models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def png_chunk(kind, data):
+    return (
+        struct.pack('>I', len(data)) + kind + data
+        + struct.pack('>I', zlib.crc32(kind + data))
+    )
+
+
+def bomb_png(width, height):
+    """PNG, в заголовке которого объявлены огромные размеры."""
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + png_chunk(b'IHDR', header)
+        + png_chunk(b'IDAT', zlib.compress(b'\x00' * 1024 * 1024))
+        + png_chunk(b'IEND', b'')
+    )
+
+
+def jpeg_with_exif(size, orientation):
+    image = Image.new('RGB', size, (200, 30, 30))
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    exif[0x010F] = 'Camera maker'
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', exif=exif)
+    return buffer.getvalue()
+
+
+def rss_status(key):
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(key + ':'):
+                return int(line.split()[1])
+
+
+def peak_rss_growth(function, *args):
+    """На сколько КБ пиковый RSS процесса превысил текущий за время
+    вызова function. Пик сбрасывается через /proc/self/clear_refs."""
+    with open('/proc/self/clear_refs', 'w') as refs:
+        refs.write('5')
+    before = rss_status('VmRSS')
+    function(*args)
+    return rss_status('VmHWM') - before
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_THUMBNAILS_ASYNC=False)
+class PostImageUploadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def create(self, name, content, content_type):
+        return self.authorized_client.post(reverse('posts:post_create'), {
+            'text': 'Пост с картинкой',
+            'image': SimpleUploadedFile(name, content, content_type),
+        })
+
+    def error_code(self, response):
+        return response.context['form'].errors.as_data()['image'][0].code
+
+    def test_decompression_bomb_rejected(self):
+        """Картинка с огромными размерами в заголовке отклоняется без
+        декодирования."""
+        response = self.create('bomb.png', bomb_png(8_000, 8_000), 'image/png')
+        self.assertEqual(self.error_code(response), 'too_many_pixels')
+        # больше предела Pillow: такой файл не открывает уже ImageField
+        response = self.create(
+            'bomb.png', bomb_png(100_000, 100_000), 'image/png'
+        )
+        self.assertIn('image', response.context['form'].errors)
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=10_000)
+    def test_too_many_pixels_rejected(self):
+        """Число пикселей ограничено POST_IMAGE_MAX_PIXELS."""
+        response = self.create(
+            'large.jpg', jpeg_with_exif((200, 100), 1), 'image/jpeg'
+        )
+        self.assertEqual(self.error_code(response), 'too_many_pixels')
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=100)
+    def test_large_file_rejected(self):
+        response = self.create(
+            'large.jpg', jpeg_with_exif((200, 100), 1), 'image/jpeg'
+        )
+        self.assertEqual(self.error_code(response), 'file_too_large')
+
+    @override_settings(POST_IMAGE_MAX_SIDE=100)
+    def test_original_downscaled_without_exif(self):
+        """Оригинал поворачивается по EXIF, уменьшается и сохраняется
+        без метаданных."""
+        # ориентация 6: картинку нужно повернуть на 90°
+        self.create('photo.jpg', jpeg_with_exif((300, 200), 6), 'image/jpeg')
+        post = Post.objects.get()
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (67, 100))
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(dict(image.getexif()), {})
+        self.assertTrue(post.image.name.endswith('.jpg'))
+
+    @unittest.skipUnless(
+        os.access('/proc/self/clear_refs', os.W_OK),
+        'Нужен Linux с /proc/self/clear_refs',
+    )
+    def test_peak_rss_below_full_decode(self):
+        """JPEG декодируется в уменьшенном масштабе: пиковая память
+        подготовки меньше размера полностью декодированной картинки."""
+        size = (6000, 4000)
+        path = os.path.join(TEMP_MEDIA_ROOT, 'camera.jpg')
+        Image.linear_gradient('L').resize(size).convert('RGB').save(path)
+
+        def sanitize():
+            with open(path, 'rb') as source:
+                uploads.sanitize(File(source, name='camera.jpg'))
+
+        growth = peak_rss_growth(sanitize)
+        decoded = size[0] * size[1] * 3 // 1024
+        self.assertLess(growth, decoded)
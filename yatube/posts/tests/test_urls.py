@@ -48,6 +48,7 @@ class PostURLTest(TestCase):
             f'/group/{self.group.slug}/',
             f'/profile/{self.user}/',
             f'/posts/{self.post.id}/',
+            '/search/?q=пост',
         ]
         for address in pages_address:
             with self.subTest(address=address):
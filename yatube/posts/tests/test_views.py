@@ -1,14 +1,36 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from io import StringIO
 from random import randrange
+from unittest import mock
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.cache import cache
-from django.test import Client, TestCase
+from django.core.cache import cache, caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from core.queries import QueryInspector
+from core.testing import QueryBudgetMixin
+from posts import cache as feed_cache
+from posts import cache_backends
+from posts import feeds, search
+from posts.cache_backends import LocalStore, TieredCache
 from posts.forms import PostForm
-from posts.models import Follow, Group, Post
+from posts.models import (Comment, Follow, Group, Post, Timeline,
+                          TimelineEntry)
+from posts.threads import MoreReplies, expand
+from posts.paginator import CursorPaginator
 
 User = get_user_model()
 
@@ -109,6 +131,19 @@ class PostViewsTest(TestCase):
             response.context.get('post').group.title, self.group.title)
         self.assertContains(response, f'Пост {self.post.text[:30]}')
 
+    def test_post_detail_shows_author_posts_count_without_count(self):
+        """Число постов автора на странице поста берётся из AuthorStats
+        без запроса COUNT."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(
+                reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+            )
+        self.assertContains(
+            response, f'<span >{self.user.posts.count()}</span>'
+        )
+        for query in queries.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'])
+
     def test_post_create_page_show_correct_context(self):
         """Шаблон формы создания поста сформирован с ожидаемым контекстом."""
         response = self.authorized_client.get(reverse('posts:post_create'))
@@ -312,30 +347,174 @@ class PaginatorViewTest(TestCase):
                     len(response.context['page_obj']), self.posts_qty())
 
 
+class CursorPaginatorViewTest(TestCase):
+    POSTS_QTY = 15
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+        cls.follower = User.objects.create_user(username='Follower')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.follower, author=cls.user)
+        for i in range(cls.POSTS_QTY):
+            Post.objects.create(
+                author=cls.user,
+                text=f'Any text{i}',
+                group=cls.group,
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.follower)
+        self.addresses = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:follow_index'),
+        ]
+
+    def test_cursor_pages_walk_through_feeds(self):
+        """Курсорный паджинатор проходит ленты вперёд и назад без
+        повторов и пропусков."""
+        expected = list(
+            Post.objects.order_by('-pub_date', '-pk').values_list(
+                'pk', flat=True
+            )
+        )
+        for address in self.addresses:
+            with self.subTest(address=address):
+                first_page = self.client.get(
+                    address + '?cursor='
+                ).context['page_obj']
+                self.assertEqual(len(first_page), settings.POSTS_PER_PAGE)
+                self.assertFalse(first_page.has_previous())
+                second_page = self.client.get(
+                    address + f'?cursor={first_page.next_cursor()}'
+                ).context['page_obj']
+                self.assertFalse(second_page.has_next())
+                self.assertEqual(
+                    [post.pk for post in first_page]
+                    + [post.pk for post in second_page],
+                    expected,
+                )
+                back_page = self.client.get(
+                    address + f'?cursor={second_page.previous_cursor()}'
+                ).context['page_obj']
+                self.assertEqual(
+                    [post.pk for post in back_page],
+                    [post.pk for post in first_page],
+                )
+
+    def test_cursor_pages_do_not_count_or_offset(self):
+        """Курсорная страница выбирается одним запросом без COUNT и
+        OFFSET."""
+        paginator = CursorPaginator(
+            Post.objects.all(), settings.POSTS_PER_PAGE
+        )
+        first_page = paginator.get_page(None)
+        for cursor in (None, first_page.next_cursor()):
+            with self.subTest(cursor=cursor):
+                with CaptureQueriesContext(connection) as queries:
+                    paginator.get_page(cursor)
+                self.assertEqual(len(queries), 1)
+                self.assertNotIn('COUNT(', queries[0]['sql'])
+                self.assertNotIn('OFFSET', queries[0]['sql'])
+        for address in self.addresses:
+            with self.subTest(address=address):
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.get(address + '?cursor=')
+                for query in queries.captured_queries:
+                    self.assertNotIn('OFFSET', query['sql'])
+
+    def test_broken_cursor_returns_first_page(self):
+        """Испорченный курсор ведёт на первую страницу."""
+        response = self.client.get(
+            reverse('posts:index') + '?cursor=broken'
+        )
+        self.assertEqual(
+            len(response.context['page_obj']), settings.POSTS_PER_PAGE
+        )
+
+    def test_page_window_is_bounded(self):
+        """Паджинатор по номерам выводит ограниченное окно страниц."""
+        with self.settings(POSTS_PER_PAGE=1):
+            response = self.client.get(
+                reverse('posts:index') + '?page=8'
+            )
+        self.assertEqual(
+            list(response.context['page_obj'].page_window),
+            [6, 7, 8, 9, 10],
+        )
+
+
 class CacheTest(TestCase):
     @classmethod
     def setUpClass(cls) -> None:
         super().setUpClass()
         cls.user = User.objects.create_user(username='NoName')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
         cls.post = Post.objects.create(
             author=cls.user,
             text='Any text',
+            group=cls.group,
         )
 
     def setUp(self):
         self.guest_client = Client()
+        cache.clear()
 
     def test_cache_index_page_show_correct_context(self):
         """Шаблон index сформирован с правильным контекстом с учетом
         кеширования страницы на 20 секунд."""
         response_1 = self.guest_client.get(reverse('posts:index'))
-        Post.objects.all().delete()
+        # update() не отправляет сигналы, версия ленты не меняется
+        Post.objects.all().update(text='Changed text')
         response_2 = self.guest_client.get(reverse('posts:index'))
         self.assertEqual(response_1.content, response_2.content)
         cache.clear()
         response_3 = self.guest_client.get(reverse('posts:index'))
         self.assertNotEqual(response_1.content, response_3.content)
 
+    def test_cache_index_page_invalidated_on_post_changes(self):
+        """Создание и удаление поста сбрасывает кеш главной страницы."""
+        response_1 = self.guest_client.get(reverse('posts:index'))
+        new_post = Post.objects.create(author=self.user, text='Fresh post')
+        response_2 = self.guest_client.get(reverse('posts:index'))
+        self.assertNotEqual(response_1.content, response_2.content)
+        self.assertContains(response_2, new_post.text)
+        new_post.delete()
+        response_3 = self.guest_client.get(reverse('posts:index'))
+        self.assertNotContains(response_3, new_post.text)
+
+    def test_cache_index_page_hit_rate_while_browsing(self):
+        """Просмотр других страниц не сбрасывает кеш главной страницы."""
+        self.guest_client.get(reverse('posts:index'))
+        other_pages = [
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        ]
+        requests_qty = 20
+        hits = 0
+        for _ in range(requests_qty):
+            for address in other_pages:
+                self.guest_client.get(address)
+            response = self.guest_client.get(reverse('posts:index'))
+            # страница из кеша отдаётся без рендеринга шаблона
+            if response.context is None:
+                hits += 1
+        self.assertEqual(hits, requests_qty)
+
 
 class FollowTest(TestCase):
     @classmethod
@@ -394,3 +573,1007 @@ class FollowTest(TestCase):
         )
         self.assertTrue(posts.filter(text__contains=new_post.text).exists())
         self.assertEqual(posts.count(), posts_count_before + 1)
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.follower = User.objects.create_user(username='NoName')
+        cls.author = User.objects.create_user(username='AnyName')
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Тестовый текст',
+        )
+
+    def setUp(self):
+        self.follower_client = Client()
+        self.follower_client.force_login(self.follower)
+        Follow.objects.create(user=self.follower, author=self.author)
+
+    def timeline_posts(self):
+        return list(
+            TimelineEntry.objects.filter(user=self.follower).values_list(
+                'post_id', flat=True
+            )
+        )
+
+    def test_follow_builds_timeline(self):
+        """Подписка материализует ленту, и лента подписок читается из
+        неё."""
+        self.assertTrue(Timeline.objects.filter(user=self.follower).exists())
+        self.assertEqual(self.timeline_posts(), [self.post.pk])
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+
+    def test_feed_without_timeline_does_not_write(self):
+        """Без материализованной ленты посты читаются соединением с
+        Follow, а GET ничего не пишет в базу; ленту строит команда
+        build_timelines."""
+        Timeline.objects.filter(user=self.follower).delete()
+        TimelineEntry.objects.filter(user=self.follower).delete()
+        with CaptureQueriesContext(connection) as context:
+            response = self.follower_client.get(
+                reverse('posts:follow_index')
+            )
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+        self.assertFalse([
+            query['sql'] for query in context.captured_queries
+            if not query['sql'].startswith('SELECT')
+        ])
+        self.assertNotIn('primary_until', response.cookies)
+        call_command('build_timelines', stdout=StringIO())
+        self.assertEqual(self.timeline_posts(), [self.post.pk])
+
+    def test_new_post_is_fanned_out(self):
+        """Новый пост автора попадает в построенную ленту подписчика."""
+        self.follower_client.get(reverse('posts:follow_index'))
+        new_post = Post.objects.create(author=self.author, text='Новый')
+        self.assertIn(new_post.pk, self.timeline_posts())
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], new_post)
+
+    def test_unfollow_purges_and_follow_backfills(self):
+        """Отписка убирает посты автора из ленты, подписка возвращает."""
+        self.follower_client.get(reverse('posts:follow_index'))
+        self.follower_client.get(reverse(
+            'posts:profile_unfollow', args=(self.author.username,)
+        ))
+        self.assertEqual(self.timeline_posts(), [])
+        self.follower_client.get(reverse(
+            'posts:profile_follow', args=(self.author.username,)
+        ))
+        self.assertEqual(self.timeline_posts(), [self.post.pk])
+
+    @override_settings(TIMELINE_MAX_ENTRIES=3)
+    def test_timeline_is_capped(self):
+        """В ленте хранится не больше TIMELINE_MAX_ENTRIES записей."""
+        self.follower_client.get(reverse('posts:follow_index'))
+        new_posts = [
+            Post.objects.create(author=self.author, text=f'Пост {i}')
+            for i in range(5)
+        ]
+        self.assertEqual(
+            self.timeline_posts(),
+            [post.pk for post in reversed(new_posts[-3:])],
+        )
+
+    @override_settings(TIMELINE_MAX_ENTRIES=3)
+    def test_trim_keeps_ties_within_cap(self):
+        """Записи с одной датой на границе ленты не удаляются, если
+        помещаются в неё."""
+        self.follower_client.get(reverse('posts:follow_index'))
+        new_posts = [
+            Post.objects.create(author=self.author, text=f'Пост {i}')
+            for i in range(2)
+        ]
+        TimelineEntry.objects.filter(user=self.follower).update(
+            pub_date=self.post.pub_date
+        )
+        newest = Post.objects.create(author=self.author, text='Новый')
+        self.assertEqual(
+            self.timeline_posts(),
+            [newest.pk, new_posts[1].pk, new_posts[0].pk],
+        )
+
+    def test_fan_out_queries_independent_of_followers(self):
+        """Раскладка поста — одна вставка и одна обрезка лент, сколько бы
+        ни было подписчиков."""
+        self.follower_client.get(reverse('posts:follow_index'))
+        readers = [
+            User.objects.create_user(username=f'reader{i}') for i in range(5)
+        ]
+        for reader in readers:
+            Timeline.objects.create(user=reader)
+            Follow.objects.create(user=reader, author=self.author)
+        with CaptureQueriesContext(connection) as context:
+            post = Post.objects.create(author=self.author, text='Новый')
+        timeline_queries = [
+            query['sql'] for query in context.captured_queries
+            if 'posts_timelineentry' in query['sql']
+        ]
+        self.assertEqual(len(timeline_queries), 2)
+        for reader in [self.follower, *readers]:
+            self.assertTrue(TimelineEntry.objects.filter(
+                user=reader, post=post
+            ).exists())
+
+    def test_popular_author_is_pulled_and_merged(self):
+        """Посты автора с числом подписчиков не меньше порога не
+        раскладываются по лентам, но выводятся в ленте подписок."""
+        other_author = User.objects.create_user(username='Other')
+        Follow.objects.create(user=self.follower, author=other_author)
+        self.follower_client.get(reverse('posts:follow_index'))
+        with override_settings(FEED_PULL_FOLLOWERS_THRESHOLD=1):
+            pulled_post = Post.objects.create(
+                author=self.author, text='Популярный'
+            )
+        pushed_post = Post.objects.create(author=other_author, text='Обычный')
+        self.assertNotIn(pulled_post.pk, self.timeline_posts())
+        self.assertIn(pushed_post.pk, self.timeline_posts())
+        expected = [pushed_post, pulled_post, self.post]
+        with override_settings(FEED_PULL_FOLLOWERS_THRESHOLD=1):
+            for query in ('', '?cursor='):
+                with self.subTest(query=query):
+                    response = self.follower_client.get(
+                        reverse('posts:follow_index') + query
+                    )
+                    self.assertEqual(
+                        list(response.context['page_obj']), expected
+                    )
+
+    @override_settings(FEED_PULL_FOLLOWERS_THRESHOLD=2)
+    def test_author_below_threshold_pushed_back(self):
+        """Посты, написанные, пока автор был выше порога, остаются в
+        ленте подписчика, когда он опускается ниже."""
+        other = User.objects.create_user(username='Other')
+        follow = Follow.objects.create(user=other, author=self.author)
+        pulled_post = Post.objects.create(author=self.author, text='Пул')
+        self.assertNotIn(pulled_post.pk, self.timeline_posts())
+        follow.delete()
+        self.assertIn(pulled_post.pk, self.timeline_posts())
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], pulled_post)
+
+    @override_settings(FEED_PULL_FOLLOWERS_THRESHOLD=1)
+    def test_merged_feed_counts_distinct_posts(self):
+        """Пост, который есть и в материализованной ленте, и среди
+        дочитанных, считается один раз."""
+        self.assertIn(self.post.pk, self.timeline_posts())
+        feed = feeds.follow_feed(self.follower)
+        self.assertIsInstance(feed, feeds.MergedFeed)
+        self.assertEqual(feed.count(), 1)
+        self.assertEqual(len(list(feed)), 1)
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Сегодня мы ходили в горы',
+        )
+        cls.other_post = Post.objects.create(
+            author=cls.user,
+            text='Вечером пошёл дождь',
+        )
+        cls.comment = Comment.objects.create(
+            post=cls.other_post,
+            author=cls.user,
+            text='А у нас в горах солнце',
+        )
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def search(self, query):
+        return self.guest_client.get(reverse('posts:search'), {'q': query})
+
+    def test_search_finds_posts_and_comments(self):
+        """Поиск находит посты и комментарии и подсвечивает слова."""
+        response = self.search('горы')
+        hits = list(response.context['page_obj'])
+        self.assertEqual(
+            {hit.post for hit in hits}, {self.post, self.other_post}
+        )
+        self.assertContains(response, '<mark>горы</mark>')
+        self.assertContains(response, '<mark>горах</mark>')
+        response = self.search('солнце')
+        hits = list(response.context['page_obj'])
+        self.assertEqual(len(hits), 1)
+        self.assertTrue(hits[0].is_comment)
+        self.assertEqual(hits[0].post, self.other_post)
+
+    def test_search_folds_yo_and_skips_stop_words(self):
+        """Поиск не различает «ё» и «е» и игнорирует стоп-слова."""
+        response = self.search('пошел')
+        self.assertEqual(
+            [hit.post for hit in response.context['page_obj']],
+            [self.other_post],
+        )
+        self.assertEqual(len(self.search('мы в').context['page_obj']), 0)
+
+    def test_reindex_command_rebuilds_index(self):
+        """Команда reindex_search восстанавливает индекс."""
+        Post.objects.bulk_create([Post(author=self.user, text='Снег в горах')])
+        call_command('reindex_search', chunk_size=1, stdout=StringIO())
+        self.assertEqual(len(self.search('снег').context['page_obj']), 1)
+        self.assertEqual(len(self.search('гора').context['page_obj']), 3)
+
+    def test_search_index_follows_edits_and_deletes(self):
+        """Индекс обновляется при изменении и удалении поста."""
+        self.post.text = 'Сегодня мы ходили на море'
+        self.post.save()
+        self.assertEqual(len(self.search('горы').context['page_obj']), 1)
+        self.assertEqual(len(self.search('море').context['page_obj']), 1)
+        self.other_post.delete()
+        self.assertEqual(len(self.search('солнце').context['page_obj']), 0)
+
+    def test_search_query_syntax_is_not_interpreted(self):
+        """Спецсимволы FTS5 в запросе не приводят к ошибке."""
+        for query in ('"горы', 'горы OR', 'NEAR(горы', '*', '-горы'):
+            with self.subTest(query=query):
+                response = self.search(query)
+                self.assertEqual(response.status_code, 200)
+
+    def test_database_backend_pages_in_sql(self):
+        """Запасной бэкенд отдаёт страницу срезом в SQL, а порядок — все
+        посты, затем все комментарии."""
+        backend = search.DatabaseSearchBackend()
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Ещё горы'
+        )
+
+        def keys(hits):
+            return [(hit.kind, hit.object_id) for hit in hits]
+
+        every = keys(backend.hits('гор', 0, 10))
+        self.assertEqual(
+            every,
+            [(search.POST, self.post.pk)] + [
+                (search.COMMENT, pk) for pk in Comment.objects.filter(
+                    text__icontains='гор'
+                ).values_list('pk', flat=True)
+            ],
+        )
+        for offset in range(len(every)):
+            with self.subTest(offset=offset):
+                with CaptureQueriesContext(connection) as queries:
+                    page = keys(backend.hits('гор', offset, 2))
+                self.assertEqual(page, every[offset:offset + 2])
+                self.assertTrue(all(
+                    'LIMIT' in query['sql'] or 'COUNT' in query['sql']
+                    for query in queries.captured_queries
+                ))
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт через поисковый индекс."""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.guest_client.force_login(admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(
+                '/admin/posts/post/', {'q': 'горы'}
+            )
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.post]
+        )
+        self.assertTrue(any(
+            'posts_search MATCH' in query['sql']
+            for query in queries.captured_queries
+        ))
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.authors = [
+            User.objects.create_user(username=f'author{number}')
+            for number in range(12)
+        ]
+        cls.reader = User.objects.create_user(username='reader')
+        groups = [
+            Group.objects.create(
+                title=f'Группа {number}',
+                slug=f'group-{number}',
+                description='Описание',
+            )
+            for number in range(12)
+        ]
+        # у каждого поста свои автор и группа, чтобы ленивая загрузка
+        # любой связи давала повторяющийся запрос
+        for author, group in zip(cls.authors, groups):
+            Post.objects.create(author=author, group=group, text='Пост')
+            Post.objects.create(
+                author=cls.authors[0], group=group, text='Пост'
+            )
+            Follow.objects.create(user=cls.reader, author=author)
+        cls.group = groups[0]
+        cls.post = Post.objects.filter(author=cls.authors[0]).first()
+        for author in cls.authors:
+            Comment.objects.create(
+                post=cls.post, author=author, text='Комментарий'
+            )
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_read_views_within_budget(self):
+        """Страницы со списками укладываются в объявленный бюджет
+        запросов и не читают связи по одной строке."""
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={
+                'username': self.authors[0].username
+            }),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+            reverse('posts:search') + '?q=пост',
+        )
+        for url in pages:
+            with self.subTest(url=url):
+                self.assertWithinQueryBudget(self.client.get(url))
+
+    def test_repeated_query_detected(self):
+        """Повторяющийся запрос считается N+1."""
+        inspector = QueryInspector()
+        with connection.execute_wrapper(inspector):
+            for post in Post.objects.all():
+                post.author.username
+        self.assertEqual(inspector.count, Post.objects.count() + 1)
+        self.assertEqual(len(inspector.repeated()), 1)
+
+    @override_settings(DEBUG=True)
+    def test_debug_headers(self):
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        self.assertEqual(
+            response['X-Query-Count'], str(response.query_stats.count)
+        )
+        self.assertEqual(response['X-Query-View'], 'posts.views.post_detail')
+        self.assertEqual(response['X-Query-Budget'], '6')
+        self.assertEqual(response['X-Query-Repeated'], '0')
+        self.assertIn('X-Query-Time-Ms', response)
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост'
+        )
+        Comment.objects.create(
+            post=cls.post, author=cls.author, text='Комментарий'
+        )
+        cls.pages = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.pk}),
+        )
+
+    def setUp(self):
+        cache.clear()
+        # Last-Modified не отдаётся, пока не прошла секунда изменения
+        self.past = mock.patch('time.time', return_value=time.time() - 60)
+        with self.past:
+            for url in self.pages:
+                self.client.get(url)
+
+    def test_not_modified_without_rendering(self):
+        """Повторный запрос с ETag получает 304, шаблоны не
+        отрисовываются, запросов к базе не больше одного."""
+        for url in self.pages:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response['ETag'].startswith('W/"'))
+                self.assertIn('Last-Modified', response)
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag']
+                    )
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.templates, [])
+                self.assertLessEqual(len(queries), 1)
+
+    def test_if_modified_since(self):
+        for url in self.pages:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                response = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+                )
+                self.assertEqual(response.status_code, 304)
+
+    def test_edit_changes_etag(self):
+        """Правка поста меняет ETag всех страниц, где он выводится."""
+        etags = [self.client.get(url)['ETag'] for url in self.pages]
+        self.post.text = 'Исправленный пост'
+        self.post.save()
+        for url, etag in zip(self.pages, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'Исправленный пост')
+
+    def assertModifiedSince(self, urls, change, text=None):
+        """После change запросы только с If-Modified-Since получают
+        новые страницы."""
+        dates = [self.client.get(url)['Last-Modified'] for url in urls]
+        change()
+        for url, last_modified in zip(urls, dates):
+            with self.subTest(url=url):
+                response = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=last_modified
+                )
+                self.assertEqual(response.status_code, 200)
+                if text is not None:
+                    self.assertContains(response, text)
+        return response
+
+    def test_edit_modifies_pages(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Исправленный пост'
+        self.assertModifiedSince(self.pages[1:], post.save, post.text)
+
+    def test_delete_modifies_group_page(self):
+        with self.past:
+            newest = Post.objects.create(
+                author=self.author, group=self.group, text='Удалённый пост'
+            )
+        response = self.assertModifiedSince(self.pages[1:2], newest.delete)
+        self.assertNotContains(response, 'Удалённый пост')
+
+    def test_group_rename_modifies_post_page(self):
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Новое название'
+        self.assertModifiedSince(self.pages[3:], group.save, group.title)
+
+    def test_etag_depends_on_viewer(self):
+        url = reverse('posts:profile', kwargs={'username': 'author'})
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_follow_changes_profile_etag(self):
+        reader = User.objects.create_user(username='reader')
+        self.client.force_login(reader)
+        url = reverse('posts:profile', kwargs={'username': 'author'})
+        etag = self.client.get(url)['ETag']
+        self.client.get(
+            reverse('posts:profile_follow', kwargs={'username': 'author'})
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Отписаться')
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой'
+        )
+        cls.group = Group.objects.create(
+            title='Классика', slug='classic', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Война и мир'
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def index(self, client=None):
+        return (client or self.client).get(reverse('posts:index'))
+
+    def test_card_rendered_once(self):
+        """Повторная отрисовка ленты берёт карточку из кеша."""
+        self.index()
+        # страница ленты кешируется целиком, сбрасываем только её
+        feed_cache.bump_version(feed_cache.INDEX)
+        response = self.index()
+        self.assertContains(response, 'Война и мир')
+        self.assertNotIn(
+            'posts/includes/post_card.html',
+            [template.name for template in response.templates],
+        )
+
+    def assertCardUpdated(self, text):
+        self.assertContains(self.index(), text)
+
+    def test_edit_updates_card(self):
+        self.index()
+        self.post.text = 'Анна Каренина'
+        self.post.save()
+        self.assertCardUpdated('Анна Каренина')
+
+    def test_group_rename_updates_card(self):
+        self.index()
+        self.group.title = 'Русская классика'
+        self.group.save()
+        self.assertCardUpdated('Русская классика')
+
+    def test_author_rename_updates_card(self):
+        self.index()
+        self.author.first_name = 'Лев Николаевич'
+        self.author.save()
+        self.assertCardUpdated('Лев Николаевич Толстой')
+
+    def test_login_keeps_card(self):
+        """Сохранение last_login при входе не сбрасывает карточки."""
+        self.author.set_password('secret')
+        self.author.save(update_fields=['password'])
+        updated = Post.objects.get(pk=self.post.pk).updated
+        self.client.login(username='author', password='secret')
+        self.assertEqual(Post.objects.get(pk=self.post.pk).updated, updated)
+
+    def test_edit_link_per_viewer(self):
+        """Ссылка на правку видна только автору, хотя карточка в кеше
+        общая."""
+        edit_url = reverse('posts:post_edit', args=(self.post.pk,))
+        author_client = Client()
+        author_client.force_login(self.author)
+        self.assertContains(self.index(author_client), edit_url)
+        reader_client = Client()
+        reader_client.force_login(User.objects.create_user('reader'))
+        self.assertNotContains(self.index(reader_client), edit_url)
+        self.assertNotContains(self.index(), edit_url)
+
+
+class SharedCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        Post.objects.create(author=cls.user, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(CACHES={
+        'default': settings.CACHE_BACKENDS['locmem'],
+        feed_cache.CACHE_ALIAS: {
+            **settings.CACHE_BACKENDS['locmem'], 'KEY_PREFIX': 'posts'
+        },
+    })
+    def test_posts_keys_namespaced(self):
+        """Все ключи приложения posts лежат под префиксом posts:."""
+        self.client.get(reverse('posts:index'))
+        keys = list(caches['default']._cache)
+        self.assertTrue(keys)
+        self.assertTrue(all(key.startswith('posts:') for key in keys), keys)
+
+    def test_file_cache_shared_between_processes(self):
+        """Страница, закешированная одним процессом, видна другому:
+        FileBasedCache хранит её в общем каталоге."""
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        config = {**settings.CACHE_BACKENDS['file'], 'LOCATION': location}
+        with override_settings(CACHES={
+            'default': config,
+            feed_cache.CACHE_ALIAS: {**config, 'KEY_PREFIX': 'posts'},
+        }):
+            self.client.get(reverse('posts:index'))
+            # отдельный экземпляр бэкенда, как в другом процессе
+            other = FileBasedCache(location, {'KEY_PREFIX': 'posts'})
+            key = feed_cache.version_key(feed_cache.INDEX)
+            self.assertEqual(
+                other.get(key), feed_cache.get_version(feed_cache.INDEX)
+            )
+            feed_cache.bump_version(feed_cache.INDEX)
+            self.assertEqual(
+                other.get(key), feed_cache.get_version(feed_cache.INDEX)
+            )
+
+
+@override_settings(CACHES={
+    **settings.CACHES,
+    'tiered_shared': {
+        **settings.CACHE_BACKENDS['locmem'], 'LOCATION': 'tiered-shared',
+    },
+})
+class TieredCacheTest(TestCase):
+    def setUp(self):
+        caches['tiered_shared'].clear()
+        # журнал уже ведётся, как в работающем приложении
+        caches['tiered_shared'].set('tiered:sequence', 1000, None)
+        self.cache = self.process('first')
+        self.other = self.process('second')
+        # начальная синхронизация, как в начале первого запроса процесса
+        self.cache.sync()
+        self.other.sync()
+
+    def process(self, origin):
+        """Экземпляр кеша со своим L1, как в отдельном процессе."""
+        tiered = TieredCache('tiered_shared', {'OPTIONS': {'MAX_ENTRIES': 10}})
+        tiered.local = LocalStore(10)
+        for name in ('publish', 'sync'):
+            setattr(tiered, name, self.from_origin(
+                getattr(tiered, name), origin
+            ))
+        return tiered
+
+    @staticmethod
+    def from_origin(method, origin):
+        def wrapped(*args):
+            with mock.patch('posts.cache_backends.origin',
+                            return_value=origin):
+                return method(*args)
+        return wrapped
+
+    def test_second_read_from_l1(self):
+        """Повторное чтение не обращается к общему кешу."""
+        self.cache.set('key', {'value': 1})
+        self.other.get('key')
+        value = self.other.get('key')
+        self.assertEqual(value, {'value': 1})
+        stats = self.other.stats()
+        self.assertEqual(stats['l1'], {'hits': 1, 'misses': 1})
+        self.assertEqual(stats['l2'], {'hits': 1, 'misses': 0})
+
+    def test_l1_returns_copy(self):
+        """Изменение прочитанного значения не меняет L1."""
+        self.cache.set('key', ['value'])
+        self.cache.get('key').append('changed')
+        self.assertEqual(self.cache.get('key'), ['value'])
+
+    def test_incr_invalidates_other_process(self):
+        """Увеличенный счётчик версии виден другому процессу после
+        синхронизации в начале запроса."""
+        self.cache.add('version', 1)
+        self.other.sync()
+        self.assertEqual(self.other.get('version'), 1)
+        self.cache.incr('version')
+        self.assertEqual(self.other.get('version'), 1)
+        self.other.sync()
+        self.assertEqual(self.other.get('version'), 2)
+        self.assertEqual(self.other.stats()['invalidations'], 2)
+
+    def test_own_messages_skipped(self):
+        self.cache.add('version', 1)
+        self.cache.get('version')
+        self.cache.sync()
+        self.cache.get('version')
+        self.assertEqual(self.cache.stats()['invalidations'], 0)
+        self.assertEqual(self.cache.stats()['l1']['hits'], 2)
+
+    def test_origin_renewed_after_fork(self):
+        """Процесс, порождённый после предзагрузки приложения, не
+        принимает сообщения родителя и соседей за свои."""
+        parent = cache_backends.origin()
+        self.assertEqual(cache_backends.origin(), parent)
+        with mock.patch('os.getpid', return_value=os.getpid() + 1):
+            child = cache_backends.origin()
+            self.assertEqual(cache_backends.origin(), child)
+        self.assertNotEqual(child, parent)
+
+    def test_batch_publishes_one_message(self):
+        self.cache.add('version', 1)
+        sequence = caches['tiered_shared'].get('tiered:sequence')
+        with self.cache.batch():
+            for number in range(5):
+                self.cache.add(f'version:{number}', 1)
+                self.cache.incr(f'version:{number}')
+        self.assertEqual(
+            caches['tiered_shared'].get('tiered:sequence'), sequence + 1
+        )
+
+    def test_lost_messages_flush_l1(self):
+        """Если сообщения журнала вытеснены, L1 очищается целиком."""
+        self.cache.add('key', 1)
+        self.other.sync()
+        self.other.get('key')
+        self.cache.incr('key')
+        shared = caches['tiered_shared']
+        shared.delete(f'tiered:message:{shared.get("tiered:sequence")}')
+        self.other.sync()
+        self.assertEqual(self.other.stats()['flushes'], 1)
+        self.assertEqual(self.other.get('key'), 2)
+
+    def test_clear_flushes_other_process(self):
+        self.cache.add('key', 1)
+        self.other.sync()
+        self.other.get('key')
+        self.cache.clear()
+        self.other.sync()
+        self.assertIsNone(self.other.get('key'))
+
+
+@override_settings(CACHES={
+    **settings.CACHES,
+    feed_cache.CACHE_ALIAS: {
+        **settings.CACHE_BACKENDS['locmem'], 'LOCATION': 'stampede',
+    },
+}, POSTS_PAGE_STALE_TIMEOUT=60, POSTS_PAGE_EARLY_REFRESH=0)
+class PageStampedeTest(SimpleTestCase):
+    """Одновременные запросы к истёкшей странице строят её один раз."""
+    clients = 8
+
+    def setUp(self):
+        feed_cache.get_cache().clear()
+        self.renders = 0
+        self.lock = threading.Lock()
+        self.view = feed_cache.coalesced_cache_page(
+            20, key_prefix='stampede'
+        )(self.slow_view)
+
+    def slow_view(self, request):
+        with self.lock:
+            self.renders += 1
+            number = self.renders
+        time.sleep(0.2)
+        return HttpResponse(f'render {number}')
+
+    def request_all(self):
+        """Запросы из нескольких потоков одновременно."""
+        barrier = threading.Barrier(self.clients)
+        bodies = []
+
+        def worker():
+            request = RequestFactory().get('/')
+            barrier.wait()
+            bodies.append(self.view(request).content.decode())
+
+        threads = [
+            threading.Thread(target=worker) for _ in range(self.clients)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return bodies
+
+    def expire(self):
+        """Сдвигает время за срок свежести страницы; блокировка прошлого
+        обновления к этому времени тоже истекает."""
+        patcher = mock.patch('time.time', return_value=time.time() + 21)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cold_page_rendered_once(self):
+        bodies = self.request_all()
+        self.assertEqual(self.renders, 1)
+        self.assertEqual(set(bodies), {'render 1'})
+
+    def test_stale_page_served_while_refreshing(self):
+        """Истёкшую страницу обновляет один запрос, остальные сразу
+        получают прежнюю."""
+        self.request_all()
+        self.expire()
+        bodies = self.request_all()
+        self.assertEqual(self.renders, 2)
+        self.assertEqual(bodies.count('render 2'), 1)
+        self.assertEqual(bodies.count('render 1'), self.clients - 1)
+        self.assertEqual(self.view(RequestFactory().get('/')).content,
+                         b'render 2')
+
+    def test_early_refresh(self):
+        """Чем дольше строится страница, тем раньше её срок для XFetch."""
+        now = time.time()
+        with mock.patch('posts.cache.random.random', return_value=0.9), \
+                override_settings(POSTS_PAGE_EARLY_REFRESH=1.0):
+            self.assertFalse(feed_cache.refresh_early(now + 1, 0.1, now))
+            self.assertTrue(feed_cache.refresh_early(now + 1, 1.0, now))
+        self.assertFalse(feed_cache.refresh_early(now + 1, 1.0, now))
+
+
+@override_settings(COMMENTS_PER_PAGE=10)
+class CommentPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        cls.comments = [
+            Comment.objects.create(
+                post=cls.post, author=cls.author, text=f'Комментарий {number}'
+            )
+            for number in range(25)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def texts(self, response):
+        return [comment.text for comment in response.context['comments']]
+
+    def test_comments_loaded_in_batches(self):
+        """Страница поста показывает первую пачку, фрагменты по курсору —
+        остальные, без повторов и пропусков."""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        texts = self.texts(response)
+        self.assertEqual(len(texts), 10)
+        self.assertContains(response, 'data-load-more')
+        while response.context['comments'].has_next():
+            response = self.client.get(
+                reverse('posts:post_comments',
+                        kwargs={'post_id': self.post.pk}),
+                {'cursor': response.context['comments'].next_cursor()},
+            )
+            self.assertTemplateUsed(
+                response, 'posts/includes/comment_list.html'
+            )
+            texts.extend(self.texts(response))
+        self.assertNotContains(response, 'data-load-more')
+        self.assertEqual(
+            texts, [comment.text for comment in reversed(self.comments)]
+        )
+
+    def test_fragment_two_queries(self):
+        """Пачка комментариев с авторами читается одним запросом, ответы
+        к ним — вторым."""
+        first = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        with self.assertNumQueries(2):
+            self.client.get(
+                reverse('posts:post_comments',
+                        kwargs={'post_id': self.post.pk}),
+                {'cursor': first.context['comments'].next_cursor()},
+            )
+
+    def test_comments_count_denormalized(self):
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 25)
+        self.comments[0].delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 24)
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        self.assertContains(response, 'Комментарии: 24')
+
+    def test_rebuild_comment_counts(self):
+        Post.objects.update(comments_count=0)
+        out = StringIO()
+        call_command('rebuild_author_stats', stdout=out)
+        self.assertIn('неверным числом комментариев 1', out.getvalue())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 25)
+
+
+@override_settings(COMMENT_MAX_DEPTH=3, COMMENT_REPLIES_PER_PAGE=2)
+class ThreadedCommentsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        cls.root = cls.reply('Корень')
+        cls.first = cls.reply('Ответ 1', cls.root)
+        cls.nested = cls.reply('Ответ 1.1', cls.first)
+        cls.others = [
+            cls.reply(f'Ответ {number}', cls.root) for number in (2, 3, 4)
+        ]
+        cls.other_root = cls.reply('Другой корень')
+
+    @classmethod
+    def reply(cls, text, parent=None):
+        return Comment.objects.create(
+            post=cls.post, author=cls.author, text=text, parent=parent
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.author)
+
+    def texts(self, items):
+        return [
+            'ещё' if isinstance(item, MoreReplies) else item.text
+            for item in items
+        ]
+
+    def test_path_and_depth(self):
+        self.assertEqual(self.root.depth, 0)
+        self.assertEqual(self.nested.depth, 2)
+        self.assertEqual(
+            self.nested.path.split('.'),
+            [str(comment.pk).zfill(10)
+             for comment in (self.root, self.first, self.nested)],
+        )
+
+    def test_subtree_single_query(self):
+        """Ветки пачки читаются одним запросом, в порядке обхода; у
+        комментария не больше COMMENT_REPLIES_PER_PAGE ответов."""
+        with self.assertNumQueries(1):
+            items = expand(self.post.pk, [self.other_root, self.root])
+        self.assertEqual(self.texts(items), [
+            'Другой корень',
+            'Корень', 'Ответ 1', 'Ответ 1.1', 'Ответ 2', 'ещё',
+        ])
+
+    def test_more_replies_fragment(self):
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        more = response.context['thread'][-1]
+        self.assertEqual(more.parent, self.root)
+        address = reverse('posts:comment_replies', kwargs={
+            'post_id': self.post.pk, 'comment_id': self.root.pk,
+        })
+        self.assertContains(
+            response, f'data-fragment="{address}?after={more.after}"'
+        )
+        response = self.client.get(address, {'after': more.after})
+        self.assertTemplateUsed(response, 'posts/includes/comment_thread.html')
+        self.assertEqual(
+            self.texts(response.context['thread']), ['Ответ 3', 'Ответ 4']
+        )
+
+    def test_more_replies_page(self):
+        """Без JavaScript ссылка «Ещё ответы» открывает страницу поста с
+        комментарием и следующей пачкой ответов на него."""
+        address = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        )
+        response = self.client.get(address)
+        more = response.context['thread'][-1]
+        self.assertContains(
+            response,
+            f'href="{address}?replies={self.root.pk}&after={more.after}'
+            f'#comment-{self.root.pk}"',
+        )
+        response = self.client.get(
+            address, {'replies': self.root.pk, 'after': more.after}
+        )
+        self.assertTemplateUsed(response, 'posts/post_detail.html')
+        self.assertEqual(
+            self.texts(response.context['thread']),
+            ['Корень', 'Ответ 3', 'Ответ 4'],
+        )
+        self.assertContains(response, f'id="comment-{self.root.pk}"')
+
+    def test_reply_added(self):
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'Ответ 1.1.1', 'parent': self.nested.pk},
+        )
+        reply = Comment.objects.get(text='Ответ 1.1.1')
+        self.assertEqual(reply.parent, self.nested)
+        self.assertTrue(reply.path.startswith(self.nested.path + '.'))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 8)
+
+    def test_depth_limited(self):
+        deepest = self.reply('Ответ 1.1.1', self.nested)
+        self.assertFalse(deepest.can_reply)
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'Слишком глубоко', 'parent': deepest.pk},
+        )
+        self.assertFalse(
+            Comment.objects.filter(text='Слишком глубоко').exists()
+        )
+
+    def test_parent_from_other_post_rejected(self):
+        other = Post.objects.create(author=self.author, text='Другой пост')
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': other.pk}),
+            {'text': 'Чужая ветка', 'parent': self.root.pk},
+        )
+        self.assertFalse(Comment.objects.filter(text='Чужая ветка').exists())
+
+    def test_subtree_deleted_with_parent(self):
+        self.first.delete()
+        self.assertFalse(Comment.objects.filter(pk=self.nested.pk).exists())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 5)
@@ -0,0 +1,125 @@
+"""Ветки комментариев.
+
+Комментарий хранит материализованный путь: pk предков и свой,
+дополненные нулями и разделённые точкой. Пути потомков комментария
+лежат между его subtree_bounds(), поэтому поддеревья читаются одним
+запросом по индексу (post, path), уже в порядке обхода в глубину, а
+ответы одного комментария идут в порядке создания.
+
+Ветка показывается пачками: у каждого комментария не больше
+COMMENT_REPLIES_PER_PAGE ответов, вместо остальных — ссылка
+MoreReplies на следующую пачку.
+"""
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import CharField, Q, Value
+from django.db.models.functions import Cast, LPad
+
+from .models import PATH_SEGMENT_WIDTH, PATH_SEPARATOR, Comment
+
+
+class MoreReplies:
+    """Ссылка на ответы parent, идущие после ответа с путём after."""
+
+    is_more = True
+
+    def __init__(self, parent, after):
+        self.parent = parent
+        self.after = after
+        self.depth = parent.depth + 1
+
+
+class Branch:
+    """Комментарий, чьи потомки сейчас обходятся."""
+
+    def __init__(self, comment, visible):
+        self.comment = comment
+        self.prefix = comment.path + PATH_SEPARATOR
+        self.visible = visible
+        self.shown = 0
+        self.last_shown = None
+        self.truncated = False
+
+    def close(self):
+        if self.visible and self.truncated:
+            return [MoreReplies(self.comment, self.last_shown)]
+        return []
+
+
+def fill_root_paths():
+    """Пути комментариев, вставленных bulk_create() в обход save(): все
+    такие комментарии корневые."""
+    return Comment.objects.filter(path='').update(
+        path=LPad(Cast('id', CharField()), PATH_SEGMENT_WIDTH, Value('0'))
+    )
+
+
+def descendants(post_id, parents):
+    """Потомки комментариев parents одним запросом, в порядке путей."""
+    if not parents:
+        return []
+    within = reduce(or_, (
+        Q(path__gt=low, path__lt=high)
+        for low, high in (parent.subtree_bounds() for parent in parents)
+    ))
+    return list(
+        Comment.objects.filter(within, post_id=post_id)
+        .select_related('author').order_by('path')
+    )
+
+
+def walk(parent, nodes, per_level):
+    """parent и его видимые потомки из nodes в порядке обхода."""
+    items = [parent]
+    stack = [Branch(parent, visible=True)]
+    for node in nodes:
+        while not node.path.startswith(stack[-1].prefix):
+            items.extend(stack.pop().close())
+        branch = stack[-1]
+        visible = branch.visible and branch.shown < per_level
+        if visible:
+            branch.shown += 1
+            branch.last_shown = node.path
+            items.append(node)
+        elif branch.visible:
+            branch.truncated = True
+        stack.append(Branch(node, visible))
+    while stack:
+        items.extend(stack.pop().close())
+    return items
+
+
+def expand(post_id, parents, per_level=None):
+    """Комментарии parents одной глубины, каждый со своей веткой, в
+    порядке parents: список комментариев и MoreReplies для шаблона."""
+    per_level = per_level or settings.COMMENT_REPLIES_PER_PAGE
+    parents = list(parents)
+    if not parents:
+        return []
+    width = len(parents[0].path)
+    branches = {parent.path: [] for parent in parents}
+    for node in descendants(post_id, parents):
+        branches[node.path[:width]].append(node)
+    items = []
+    for parent in parents:
+        items.extend(walk(parent, branches[parent.path], per_level))
+    return items
+
+
+def replies(post_id, parent, after='', per_level=None):
+    """Следующая пачка ответов parent после ответа с путём after, с их
+    ветками; если ответов больше, в конце — MoreReplies."""
+    per_level = per_level or settings.COMMENT_REPLIES_PER_PAGE
+    low, high = parent.subtree_bounds()
+    children = list(
+        Comment.objects.filter(
+            post_id=post_id, path__gt=max(low, after), path__lt=high,
+            depth=parent.depth + 1,
+        ).select_related('author').order_by('path')[:per_level + 1]
+    )
+    items = expand(post_id, children[:per_level], per_level)
+    if len(children) > per_level:
+        items.append(MoreReplies(parent, children[per_level - 1].path))
+    return items
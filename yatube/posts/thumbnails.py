@@ -0,0 +1,184 @@
+"""Заранее созданные миниатюры картинок постов.
+
+После сохранения поста с новой картинкой все варианты из POST_THUMBNAILS
+создаются в фоновом пуле потоков, а их URL записываются в
+Post.thumbnails. Вариант — это набор ширин с общими пропорциями, и
+каждая ширина создаётся во всех форматах POST_IMAGE_FORMATS, которые
+умеет записывать Pillow. Шаблоны берут готовые URL через тег
+post_picture и не вызывают sorl во время рендеринга.
+
+Ни запрос, ни его поток миниатюр не ждут: задачи завершаются в пуле
+сами, а одна картинка поста ставится в очередь не больше одного раза.
+Дождаться всех задач можно функцией drain() — в тестах и при остановке
+процесса; при выходе интерпретатора пул дожидается их и сам.
+"""
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.base import EXTENSIONS
+from sorl.thumbnail.images import ImageFile
+
+from .models import Post
+from .storage import post_image_storage
+
+logger = logging.getLogger(__name__)
+
+# формат -> (имя формата Pillow, MIME-тип)
+FORMATS = {
+    'avif': ('AVIF', 'image/avif'),
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+
+# ключи варианта, которые не передаются в sorl
+VARIANT_KEYS = ('geometry', 'widths', 'sizes')
+
+# sorl знает расширения только JPEG, PNG, GIF и WEBP
+EXTENSIONS.setdefault('AVIF', 'avif')
+
+_executor = None
+# (pk поста, имя картинки) -> задача, которая ещё не завершилась
+_pending = {}
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.POST_THUMBNAILS_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+@lru_cache(maxsize=None)
+def _writable(pil_format):
+    Image.init()
+    return pil_format in Image.SAVE
+
+
+def image_formats():
+    """Форматы из POST_IMAGE_FORMATS, которые умеет записывать Pillow,
+    в порядке предпочтения; последний служит запасным для <img>."""
+    return [
+        image_format for image_format in settings.POST_IMAGE_FORMATS
+        if _writable(FORMATS[image_format][0])
+    ]
+
+
+def variant_sizes(name):
+    """Пары (ширина, высота) варианта name по возрастанию ширины."""
+    variant = settings.POST_THUMBNAILS[name]
+    width, height = map(int, variant['geometry'].split('x'))
+    widths = sorted(set(variant.get('widths', ())) | {width})
+    return [(size, round(size * height / width)) for size in widths]
+
+
+def thumbnail(image_name, name, size, image_format):
+    """Миниатюра sorl одной ширины варианта name в формате image_format."""
+    variant = settings.POST_THUMBNAILS[name]
+    options = {
+        key: value for key, value in variant.items()
+        if key not in VARIANT_KEYS
+    }
+    if isinstance(image_name, str):
+        # миниатюры учитываются в sorl вместе с хранилищем оригинала
+        image_name = ImageFile(image_name, post_image_storage)
+    return get_thumbnail(
+        image_name,
+        '%dx%d' % size,
+        format=FORMATS[image_format][0],
+        quality=settings.POST_IMAGE_FORMATS[image_format],
+        **options,
+    )
+
+
+def render(image_name):
+    """Создаёт все варианты картинки; возвращает словарь
+    имя -> формат -> список пар [ширина, URL]."""
+    urls = {}
+    for name in settings.POST_THUMBNAILS:
+        urls[name] = {
+            image_format: [
+                [size[0], thumbnail(image_name, name, size, image_format).url]
+                for size in variant_sizes(name)
+            ]
+            for image_format in image_formats()
+        }
+    return urls
+
+
+def store(post_id, image_name, urls):
+    """Записывает URL миниатюр, если картинка поста не сменилась."""
+    Post.objects.filter(pk=post_id, image=image_name).update(
+        thumbnails=json.dumps(urls) if urls else '',
+        updated=timezone.now(),
+    )
+
+
+def generate(post_id, image_name):
+    try:
+        store(post_id, image_name, render(image_name) if image_name else {})
+    except Exception:
+        if not settings.POST_THUMBNAILS_ASYNC:
+            raise
+        logger.exception('Не удалось создать миниатюры поста %s', post_id)
+    finally:
+        if settings.POST_THUMBNAILS_ASYNC:
+            connection.close()
+
+
+def schedule(post):
+    """Ставит создание миниатюр поста в очередь после коммита."""
+    image_name = post.image.name if post.image else ''
+    # миниатюры прежней картинки больше не подходят
+    post.updated = timezone.now()
+    Post.objects.filter(pk=post.pk).update(
+        thumbnails='', updated=post.updated
+    )
+    post.thumbnails = ''
+    if not settings.POST_THUMBNAILS_ASYNC:
+        generate(post.pk, image_name)
+        return
+    transaction.on_commit(lambda: _submit(post.pk, image_name))
+
+
+def enqueue(post):
+    """Ставит в очередь миниатюры поста, у которого их ещё нет, не
+    сбрасывая прежние. В синхронном режиме миниатюры создаются только
+    при сохранении поста и командой generate_thumbnails."""
+    if not settings.POST_THUMBNAILS_ASYNC:
+        return
+    image_name = post.image.name
+    transaction.on_commit(lambda: _submit(post.pk, image_name))
+
+
+def _submit(post_id, image_name):
+    key = (post_id, image_name)
+    with _lock:
+        if key in _pending:
+            return
+        future = get_executor().submit(generate, post_id, image_name)
+        _pending[key] = future
+    future.add_done_callback(lambda future: _forget(key))
+
+
+def _forget(key):
+    with _lock:
+        _pending.pop(key, None)
+
+
+def drain(timeout=None):
+    """Дожидается всех миниатюр, поставленных в очередь."""
+    with _lock:
+        pending = list(_pending.values())
+    wait(pending, timeout)
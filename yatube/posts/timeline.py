@@ -0,0 +1,200 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import AuthorStats, Follow, Post, Timeline, TimelineEntry
+
+
+def timeline_size():
+    return settings.TIMELINE_MAX_ENTRIES
+
+
+def pull_threshold():
+    """Число подписчиков, начиная с которого посты автора не
+    раскладываются по лентам; None — раскладывать всегда."""
+    return settings.FEED_PULL_FOLLOWERS_THRESHOLD
+
+
+def is_pull_author(author_id):
+    threshold = pull_threshold()
+    return threshold is not None and AuthorStats.objects.filter(
+        author_id=author_id, followers_count__gte=threshold
+    ).exists()
+
+
+def has_timeline(user):
+    return Timeline.objects.filter(user=user).exists()
+
+
+# поля даты и id поста, по которым упорядочена и листается курсором
+# лента подписок
+FEED_KEYS = ('feed_date', 'feed_post')
+
+
+def pull_feed(user):
+    """Лента подписок, собранная соединением с Follow."""
+    return Post.objects.select_related('author', 'group').filter(
+        author__following__user=user
+    ).annotate(feed_date=F('pub_date'), feed_post=F('pk'))
+
+
+def timeline_feed(user):
+    """Лента подписок из материализованной таблицы."""
+    # порядок записей ленты совпадает с порядком постов, но сортировка
+    # по ним идёт по индексу ленты без временного B-дерева; F() —
+    # столбец post_id записи, а не сортировка связанного Post
+    return Post.objects.select_related('author', 'group').filter(
+        timeline_entries__user=user
+    ).annotate(
+        feed_date=F('timeline_entries__pub_date'),
+        feed_post=F('timeline_entries__post'),
+    ).order_by(*(f'-{key}' for key in FEED_KEYS))
+
+
+# пользователей в одном запросе trim(): параметров в запросе SQLite
+# бывает не больше 999
+TRIM_BATCH_SIZE = 500
+
+# подписчиков, чьи записи push_back() держит в памяти за раз
+PUSH_BACK_BATCH_SIZE = 50
+
+# записи сверх размера ленты нумеруются в порядке ленты по индексу
+# (user, -pub_date, -post) и удаляются по id, поэтому записи с одной
+# датой на границе ленты не теряются
+TRIM_SQL = """
+DELETE FROM {table} WHERE id IN (
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (
+            PARTITION BY user_id ORDER BY pub_date DESC, post_id DESC
+        ) AS position
+        FROM {table} WHERE user_id IN ({users})
+    ) AS ranked WHERE position > %s
+)
+"""
+
+
+def trim(user_ids):
+    """Оставляет в лентах пользователей user_ids не больше
+    timeline_size() последних записей, одним запросом на пачку
+    пользователей."""
+    user_ids = list(user_ids)
+    table = connection.ops.quote_name(TimelineEntry._meta.db_table)
+    with connection.cursor() as cursor:
+        for start in range(0, len(user_ids), TRIM_BATCH_SIZE):
+            batch = user_ids[start:start + TRIM_BATCH_SIZE]
+            cursor.execute(
+                TRIM_SQL.format(
+                    table=table, users=', '.join(['%s'] * len(batch))
+                ),
+                [*batch, timeline_size()],
+            )
+
+
+def _entries(user_id, posts):
+    return [
+        TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in posts.values_list('pk', 'pub_date')
+    ]
+
+
+@transaction.atomic
+def build(user_id):
+    """Материализует ленту подписок пользователя; False, если она уже
+    была построена."""
+    timeline, created = Timeline.objects.get_or_create(user_id=user_id)
+    if not created:
+        return False
+    posts = Post.objects.filter(author__following__user_id=user_id)
+    threshold = pull_threshold()
+    if threshold is not None:
+        posts = posts.exclude(
+            author__stats__followers_count__gte=threshold
+        )
+    TimelineEntry.objects.bulk_create(
+        _entries(user_id, posts[:timeline_size()]), ignore_conflicts=True
+    )
+    return True
+
+
+def fan_out(post):
+    """Раскладывает новый пост по материализованным лентам подписчиков.
+
+    Ленты пользователей, для которых они ещё не построены, не
+    трогаем: такие пользователи читают ленту соединением с Follow.
+    Посты авторов с большим числом подписчиков тоже не раскладываются,
+    их дочитывает feeds.follow_feed.
+    """
+    if is_pull_author(post.author_id):
+        return
+    follower_ids = list(
+        Follow.objects.filter(
+            author_id=post.author_id, user__timeline__isnull=False
+        ).values_list('user_id', flat=True)
+    )
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in follower_ids
+        ],
+        ignore_conflicts=True,
+    )
+    trim(follower_ids)
+
+
+def backfill(user_id, author_id):
+    """После подписки строит ленту пользователя, если её ещё нет, или
+    добавляет в неё последние посты автора. Так лента строится при
+    записи, а не при первом чтении."""
+    if build(user_id) or is_pull_author(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id)[:timeline_size()]
+    TimelineEntry.objects.bulk_create(
+        _entries(user_id, posts), ignore_conflicts=True
+    )
+    trim([user_id])
+
+
+def push_back(author_id):
+    """Раскладывает последние посты автора, опустившегося ниже порога,
+    по лентам подписчиков.
+
+    Пока подписчиков было не меньше порога, его посты не раскладывались,
+    а дочитывались при запросе; теперь они дочитываться перестанут и без
+    этого пропали бы из лент.
+    """
+    threshold = pull_threshold()
+    if threshold is None or not AuthorStats.objects.filter(
+        author_id=author_id, followers_count=threshold - 1
+    ).exists():
+        return
+    follower_ids = list(
+        Follow.objects.filter(
+            author_id=author_id, user__timeline__isnull=False
+        ).values_list('user_id', flat=True)
+    )
+    posts = list(
+        Post.objects.filter(author_id=author_id)
+        .values_list('pk', 'pub_date')[:timeline_size()]
+    )
+    for start in range(0, len(follower_ids), PUSH_BACK_BATCH_SIZE):
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(
+                    user_id=user_id, post_id=post_id, pub_date=pub_date
+                )
+                for user_id in follower_ids[
+                    start:start + PUSH_BACK_BATCH_SIZE
+                ]
+                for post_id, pub_date in posts
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+    trim(follower_ids)
+
+
+def purge(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
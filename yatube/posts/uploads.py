@@ -0,0 +1,88 @@
+"""Проверка и подготовка загружаемых картинок постов.
+
+Файл больше FILE_UPLOAD_MAX_MEMORY_SIZE Django пишет во временный файл
+по частям, поэтому в памяти загрузка целиком не оказывается. Размеры
+картинки проверяются по заголовку до декодирования, а оригинал перед
+сохранением уменьшается до POST_IMAGE_MAX_SIDE и пересохраняется без
+EXIF. JPEG при этом декодируется сразу в уменьшенном масштабе.
+"""
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image, ImageOps
+
+# формат Pillow -> параметры сохранения
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 90, 'optimize': True},
+    'PNG': {'optimize': True},
+    'GIF': {},
+    'WEBP': {'quality': 90},
+}
+JPEG_MODES = ('RGB', 'L', 'CMYK')
+
+
+def check_header(upload):
+    """Открывает картинку, прочитав только заголовок, и проверяет
+    размер файла и число пикселей."""
+    if upload.size > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+        raise ValidationError(
+            'Файл больше %(limit)d МБ.',
+            code='file_too_large',
+            params={'limit': settings.POST_IMAGE_MAX_UPLOAD_SIZE >> 20},
+        )
+    upload.seek(0)
+    # ImageField уже открывал файл, так что ошибок формата здесь нет
+    with Image.open(upload) as image:
+        pixels = image.width * image.height
+        image_format = image.format
+    if pixels > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка больше %(limit)d мегапикселей.',
+            code='too_many_pixels',
+            params={'limit': settings.POST_IMAGE_MAX_PIXELS // 10 ** 6},
+        )
+    if image_format not in SAVE_OPTIONS:
+        raise ValidationError(
+            'Поддерживаются картинки JPEG, PNG, GIF и WebP.',
+            code='unsupported_format',
+        )
+
+
+def sanitize(upload):
+    """Новый загруженный файл: картинка, повёрнутая по EXIF, уменьшенная
+    до POST_IMAGE_MAX_SIDE и сохранённая без метаданных."""
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    upload.seek(0)
+    with Image.open(upload) as image:
+        image_format = image.format
+        icc_profile = image.info.get('icc_profile')
+        scale = min(max_side / max(image.size), 1)
+        # JPEG декодируется сразу в масштабе 1/2, 1/4 или 1/8
+        image.draft(image.mode, (
+            round(image.width * scale), round(image.height * scale)
+        ))
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        image = ImageOps.exif_transpose(image)
+    if image_format == 'JPEG' and image.mode not in JPEG_MODES:
+        image = image.convert('RGB')
+    options = dict(SAVE_OPTIONS[image_format])
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    # как и загрузка, результат уходит на диск, если не умещается в
+    # FILE_UPLOAD_MAX_MEMORY_SIZE
+    cleaned = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+        dir=settings.FILE_UPLOAD_TEMP_DIR,
+    )
+    image.save(cleaned, format=image_format, **options)
+    size = cleaned.tell()
+    cleaned.seek(0)
+    return UploadedFile(
+        cleaned,
+        os.path.basename(upload.name),
+        Image.MIME[image_format],
+        size,
+    )
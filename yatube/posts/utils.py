@@ -1,12 +1,71 @@
 from django.conf import settings
-from django.core.cache import cache
 from django.core.paginator import Paginator
 
+from .models import Comment
+from .paginator import CursorPaginator
 
-def page_obj_return(request, posts):
-    """Получение page_obj с паджинатором."""
-    cache.clear()
-    paginator = Paginator(posts, settings.POSTS_PER_PAGE)
+# сколько номеров страниц показывать по обе стороны от текущей
+PAGE_WINDOW_SIZE = 2
+
+
+def use_cursor_pagination(request):
+    """Курсорный режим включается настройкой или параметром cursor."""
+    return (
+        settings.POSTS_PAGINATION == 'cursor' or 'cursor' in request.GET
+    )
+
+
+def page_window(page_obj, size=PAGE_WINDOW_SIZE):
+    """Ограниченное окно номеров страниц вокруг текущей."""
+    first = max(page_obj.number - size, 1)
+    last = min(page_obj.number + size, page_obj.paginator.num_pages)
+    return range(first, last + 1)
+
+
+def numbered_page_obj(request, object_list):
+    """Получение page_obj с паджинатором по номерам страниц."""
+    paginator = Paginator(object_list, settings.POSTS_PER_PAGE)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    page_obj.page_window = page_window(page_obj)
     return page_obj
+
+
+def page_obj_return(request, posts, keys=('pub_date', 'pk')):
+    """Получение page_obj с паджинатором; keys — поля даты и id,
+    по которым ленту листает курсор."""
+    if use_cursor_pagination(request):
+        paginator = CursorPaginator(posts, settings.POSTS_PER_PAGE, *keys)
+        return paginator.get_page(request.GET.get('cursor'))
+    return numbered_page_obj(request, posts)
+
+
+def comment_page(request, post_id):
+    """Пачка корневых комментариев поста по курсору, от новых к старым,
+    с авторами в том же запросе; ответы к ним даёт threads.expand()."""
+    comments = Comment.objects.filter(
+        post_id=post_id, depth=0
+    ).select_related('author')
+    paginator = CursorPaginator(
+        comments, settings.COMMENTS_PER_PAGE, date_field='created'
+    )
+    return paginator.get_page(request.GET.get('cursor'))
+
+
+def iter_chunks(queryset, fields, chunk_size):
+    """Строки queryset.values_list(*fields) пачками по chunk_size.
+
+    Пачки выбираются по возрастанию pk с условием pk > последнего
+    прочитанного, поэтому в памяти держится только одна пачка, а
+    запросы не используют OFFSET. Первым полем должен быть pk.
+    """
+    last_pk = 0
+    while True:
+        rows = list(
+            queryset.filter(pk__gt=last_pk).order_by('pk')
+            .values_list(*fields)[:chunk_size]
+        )
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1][0]
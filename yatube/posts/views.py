@@ -1,13 +1,24 @@
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.utils.http import urlencode
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 
-from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
-from .utils import page_obj_return
+from core.queries import query_budget
 
+from . import feeds, search, threads, thumbnails
+from .cache import cache_feed_page
+from .conditional import (comments_validators, conditional_feed,
+                          group_validators, index_validators,
+                          post_validators, profile_validators,
+                          replies_validators)
+from .forms import CommentForm, PostForm, ReplyForm
+from .models import Comment, Follow, Group, Post, User
+from .utils import comment_page, numbered_page_obj, page_obj_return
 
-@cache_page(20, key_prefix='index_page')
+
+@query_budget(4)
+@conditional_feed(index_validators)
+@cache_feed_page(20, key_prefix='index_page')
 def index(request):
     template = 'posts/index.html'
     posts = Post.objects.select_related('group', 'author').all()
@@ -17,10 +28,12 @@ def index(request):
     return render(request, template, context)
 
 
+@query_budget(6)
+@conditional_feed(group_validators)
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
+    posts = group.posts.select_related('author')
     context = {
         'group': group,
         'page_obj': page_obj_return(request, posts),
@@ -28,10 +41,14 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@query_budget(7)
+@conditional_feed(profile_validators)
 def profile(request, username):
     template = 'posts/profile.html'
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    posts = author.posts.select_related('group')
     following = True if (
         request.user.is_authenticated and Follow.objects.filter(
             user=request.user,
@@ -46,18 +63,82 @@ def profile(request, username):
     return render(request, template, context)
 
 
+@query_budget(5)
+def search_posts(request):
+    template = 'posts/search.html'
+    query = request.GET.get('q', '').strip()
+    context = {
+        'query': query,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    if query:
+        results = search.get_backend().search(query)
+        context['page_obj'] = numbered_page_obj(request, results)
+    return render(request, template, context)
+
+
+@query_budget(6)
+@conditional_feed(post_validators)
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id
+    )
     context = {
         'post': post,
         'form': CommentForm(request.POST or None),
-        'comments': post.comments.all(),
+    }
+    parent_id = request.GET.get('replies', '')
+    if parent_id.isdigit():
+        # ссылка «Ещё ответы» без JavaScript: комментарий и следующая
+        # пачка ответов на него
+        parent = get_object_or_404(
+            Comment.objects.select_related('author'),
+            pk=parent_id, post_id=post.pk,
+        )
+        context['thread'] = [parent, *threads.replies(
+            post.pk, parent, request.GET.get('after', '')
+        )]
+    else:
+        comments = comment_page(request, post.pk)
+        context['comments'] = comments
+        context['thread'] = threads.expand(post.pk, comments)
+    return render(request, template, context)
+
+
+@query_budget(4)
+@conditional_feed(comments_validators)
+def post_comments(request, post_id):
+    """Следующая пачка комментариев поста — фрагмент HTML для кнопки
+    «Показать ещё»."""
+    template = 'posts/includes/comment_list.html'
+    comments = comment_page(request, post_id)
+    context = {
+        'post_id': post_id,
+        'comments': comments,
+        'thread': threads.expand(post_id, comments),
+    }
+    return render(request, template, context)
+
+
+@query_budget(4)
+@conditional_feed(replies_validators)
+def comment_replies(request, post_id, comment_id):
+    """Следующая пачка ответов на комментарий — фрагмент HTML для
+    ссылки «Ещё ответы»."""
+    template = 'posts/includes/comment_thread.html'
+    parent = get_object_or_404(Comment, pk=comment_id, post_id=post_id)
+    context = {
+        'post_id': post_id,
+        'thread': threads.replies(
+            post_id, parent, request.GET.get('after', '')
+        ),
     }
     return render(request, template, context)
 
 
 @login_required
+@transaction.atomic
 def post_create(request):
     template = 'posts/post_create.html'
     form = PostForm(
@@ -68,6 +149,8 @@ def post_create(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post)
         return redirect('posts:profile', username=request.user.username)
     context = {
         'form': form,
@@ -77,6 +160,7 @@ def post_create(request):
 
 
 @login_required
+@transaction.atomic
 def post_edit(request, post_id):
     template = 'posts/post_create.html'
     post = get_object_or_404(Post, pk=post_id)
@@ -89,6 +173,8 @@ def post_edit(request, post_id):
     )
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post)
         return redirect('posts:post_detail', post_id=post_id)
     context = {
         'form': form,
@@ -99,9 +185,10 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
-    form = CommentForm(request.POST or None)
+    form = ReplyForm(request.POST or None, post=post)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
@@ -110,19 +197,20 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@query_budget(15)
 @login_required
 def follow_index(request):
     template = 'posts/follow.html'
-    posts = Post.objects.select_related('author').filter(
-        author__following__user=request.user
-    )
     context = {
-        'page_obj': page_obj_return(request, posts),
+        'page_obj': page_obj_return(
+            request, feeds.subscriptions(request.user), feeds.FEED_KEYS
+        ),
     }
     return render(request, template, context)
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user != author:
@@ -131,6 +219,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     Follow.objects.filter(
         user=request.user, author__username=username
@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryBudgetMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,10 +89,43 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # транзакции сразу берут блокировку записи (core.backends.sqlite3)
+        'ENGINE': 'core.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        # соединение переживает запрос и используется воркером повторно
+        'CONN_MAX_AGE': 600,
     }
 }
+# проверять открытые соединения перед каждым запросом (core.db)
+CONN_HEALTH_CHECKS: bool = True
+# прагмы каждого нового соединения SQLite (core.db)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # отрицательное значение — размер в КиБ
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+# реплики только для чтения; в YATUBE_DB_REPLICAS через запятую — пути к
+# копиям базы SQLite, в тестах реплики совпадают с основной базой
+DATABASE_REPLICAS = []
+for number, name in enumerate(
+    filter(None, os.environ.get('YATUBE_DB_REPLICAS', '').split(',')), 1
+):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'CONN_MAX_AGE': 600,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+# сколько секунд после записи чтения пользователя идут в основную базу
+REPLICA_STICKY_SECONDS: int = 5
 
 
 # Password validation
@@ -148,14 +183,115 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 # объявляем константы: ПОСТОВ_НА_СТРАНИЦЕ
 POSTS_PER_PAGE: int = 10
+# комментариев на странице поста и в каждой догружаемой пачке
+COMMENTS_PER_PAGE: int = 20
+# глубина ветки комментариев: у корневого комментария 0
+COMMENT_MAX_DEPTH: int = 5
+# ответов одного комментария в пачке; остальные догружаются по ссылке
+COMMENT_REPLIES_PER_PAGE: int = 5
 EMPTY_VALUE_DISPLAY: str = '-пусто-'
 
 # переопределяем view-функцию для обработки ошибки 403
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
-# подключаем бэкенд кеширования
-CACHES = {
-    'default': {
+# подключаем бэкенд кеширования:
+# 'locmem' — свой кеш у каждого процесса,
+# 'file' — общий кеш процессов одной машины в файлах, по возможности в
+# разделяемой памяти /dev/shm,
+# 'redis' — общий кеш нескольких машин, нужен пакет django-redis
+CACHE_BACKENDS = {
+    'locmem': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(
+            '/dev/shm' if os.path.isdir('/dev/shm') else '/tmp',
+            'yatube-cache',
+        ),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'redis': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_REDIS_URL', 'redis://127.0.0.1:6379/1'
+        ),
+        'OPTIONS': {'CLIENT_CLASS': 'django_redis.client.DefaultClient'},
+    },
+}
+CACHE_BACKEND: str = os.environ.get('YATUBE_CACHE_BACKEND', 'locmem')
+# перед общим кешем приложения posts стоит небольшой кеш в памяти
+# процесса (L1); с кешем 'locmem' он ничего не даёт
+POSTS_CACHE_L1: bool = CACHE_BACKEND != 'locmem'
+# ключи приложения posts хранятся в том же хранилище под префиксом posts:
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
+    'posts_shared': {**CACHE_BACKENDS[CACHE_BACKEND], 'KEY_PREFIX': 'posts'},
+}
+CACHES['posts'] = {
+    'BACKEND': 'posts.cache_backends.TieredCache',
+    'LOCATION': 'posts_shared',
+    'KEY_PREFIX': 'posts',
+    'OPTIONS': {'MAX_ENTRIES': 1000, 'L1_TIMEOUT': 5},
+} if POSTS_CACHE_L1 else CACHES['posts_shared']
+
+# режим паджинации лент: 'page' — по номерам страниц,
+# 'cursor' — по курсору (pub_date, id) без COUNT и OFFSET
+POSTS_PAGINATION: str = 'page'
+
+# страница ленты в кеше свежа заданное в представлении время и ещё
+# POSTS_PAGE_STALE_TIMEOUT секунд отдаётся устаревшей, пока её заново
+# строит один запрос; POSTS_PAGE_EARLY_REFRESH — коэффициент досрочного
+# обновления (XFetch), 0 — обновлять только по истечении
+POSTS_PAGE_STALE_TIMEOUT: int = 60
+POSTS_PAGE_EARLY_REFRESH: float = 1.0
+
+# сколько секунд хранится отрисованная карточка поста; ключ включает
+# Post.updated, так что устаревшие карточки просто перестают читаться
+POST_CARD_CACHE_TIMEOUT: int = 60 * 60 * 24
+
+# сколько последних постов хранится в материализованной ленте подписок
+TIMELINE_MAX_ENTRIES: int = 500
+
+# посты авторов, у которых подписчиков не меньше порога, не раскладываются
+# по лентам подписок, а дочитываются при запросе; None — раскладывать всегда
+FEED_PULL_FOLLOWERS_THRESHOLD = 1000
+
+# бэкенд полнотекстового поиска по постам и комментариям
+POSTS_SEARCH_BACKEND: str = 'posts.search.SQLiteFTS5Backend'
+
+# варианты картинок постов, создаваемые заранее при сохранении:
+# geometry задаёт наибольший размер и пропорции, widths — меньшие
+# ширины для srcset, sizes — атрибут sizes тега <img>
+POST_THUMBNAILS = {
+    'card': {
+        'geometry': '960x339',
+        'widths': (320, 480, 640),
+        'sizes': '(min-width: 768px) 720px, 100vw',
+        'crop': 'center',
+        'upscale': True,
+    },
+}
+# загрузки больше этого размера пишутся во временный файл по частям
+FILE_UPLOAD_MAX_MEMORY_SIZE: int = 256 * 1024
+# наибольший размер файла картинки поста в байтах
+POST_IMAGE_MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024
+# наибольшее число пикселей картинки, проверяемое по заголовку файла
+POST_IMAGE_MAX_PIXELS: int = 40_000_000
+# оригинал картинки уменьшается до этой длины большей стороны
+POST_IMAGE_MAX_SIDE: int = 2048
+# форматы миниатюр и их качество по убыванию предпочтения; форматы,
+# которые Pillow не умеет записывать, пропускаются, последний — запасной
+POST_IMAGE_FORMATS = {
+    'avif': 50,
+    'webp': 80,
+    'jpeg': 85,
 }
+# создавать миниатюры в фоновом пуле потоков после коммита
+POST_THUMBNAILS_ASYNC: bool = True
+POST_THUMBNAILS_WORKERS: int = 2
+
+# подсчёт SQL-запросов каждого HTTP-запроса (при DEBUG — с заголовками
+# X-Query-*); запрос, повторённый QUERY_REPEAT_THRESHOLD раз, — это N+1
+QUERY_INSPECTOR_ENABLED: bool = DEBUG
+QUERY_REPEAT_THRESHOLD: int = 5
@@ -5,6 +5,7 @@ from django.urls import include, path
 
 urlpatterns = [
     path('', include('posts.urls', namespace='posts')),
+    path('api/v1/', include('posts.api_urls', namespace='api')),
     path('admin/', admin.site.urls),
     path('about/', include('about.urls', namespace='about')),
     path('auth/', include('users.urls')),